@@ -1,8 +1,26 @@
 #!/bin/bash
 set -e
 
+# retention tiers: raw points for RAW_RETENTION, 5 minute means for DOWNSAMPLED_RETENTION
+RAW_RETENTION=${RAW_RETENTION:-14d}
+DOWNSAMPLED_RETENTION=${DOWNSAMPLED_RETENTION:-400d}
+DOWNSAMPLED_BUCKET=${DOWNSAMPLED_BUCKET:-${DOCKER_INFLUXDB_INIT_BUCKET}_downsampled}
+TABLE_FUNCTIONS=${INFLUXDB_TABLE_FUNCTIONS:-functions_usage_table}
+TABLE_INFRA=${INFLUXDB_TABLE_INFRA:-infra_usage_table}
+
 BUCKET_ID=`influx bucket list --name $DOCKER_INFLUXDB_INIT_BUCKET | tail -1 | head -c 16`
 
+influx bucket update \
+  --id ${BUCKET_ID} \
+  --retention ${RAW_RETENTION}
+
+influx bucket create \
+  --name ${DOWNSAMPLED_BUCKET} \
+  --retention ${DOWNSAMPLED_RETENTION} \
+  --org ${DOCKER_INFLUXDB_INIT_ORG}
+
+DOWNSAMPLED_BUCKET_ID=`influx bucket list --name $DOWNSAMPLED_BUCKET | tail -1 | head -c 16`
+
 influx v1 dbrp create \
   --bucket-id ${BUCKET_ID} \
   --db ${V1_DB_NAME} \
@@ -10,10 +28,51 @@ influx v1 dbrp create \
   --default \
   --org ${DOCKER_INFLUXDB_INIT_ORG}
 
+# the tiers as retention policies of the same database, the dashboards select them with the $tier variable
+influx v1 dbrp create \
+  --bucket-id ${BUCKET_ID} \
+  --db ${V1_DB_NAME} \
+  --rp raw \
+  --org ${DOCKER_INFLUXDB_INIT_ORG}
+
+influx v1 dbrp create \
+  --bucket-id ${DOWNSAMPLED_BUCKET_ID} \
+  --db ${V1_DB_NAME} \
+  --rp downsampled \
+  --org ${DOCKER_INFLUXDB_INIT_ORG}
+
 
 influx v1 auth create \
   --username ${V1_AUTH_USERNAME} \
   --password ${V1_AUTH_PASSWORD} \
   --write-bucket ${BUCKET_ID} \
   --read-bucket ${BUCKET_ID} \
-  --org ${DOCKER_INFLUXDB_INIT_ORG}
\ No newline at end of file
+  --read-bucket ${DOWNSAMPLED_BUCKET_ID} \
+  --org ${DOCKER_INFLUXDB_INIT_ORG}
+
+# downsampling tasks: every 5 minutes, the 5 minute means of the numeric fields of the last 30 minutes (points
+# arrive up to a collection window late) overwrite the previous means in the downsampled bucket
+create_downsampling_task () {
+  cat > /tmp/$1.flux <<EOF
+import "types"
+
+option task = {name: "$1", every: 5m, offset: 30s}
+
+from(bucket: "${DOCKER_INFLUXDB_INIT_BUCKET}")
+  |> range(start: -30m)
+  |> filter(fn: (r) => r._measurement == "$2" or r._measurement == "$3")
+  |> filter(fn: (r) => types.isNumeric(v: r._value))
+  |> aggregateWindow(every: 5m, fn: mean, createEmpty: false, timeSrc: "_start")
+  |> to(bucket: "${DOWNSAMPLED_BUCKET}", org: "${DOCKER_INFLUXDB_INIT_ORG}")
+EOF
+  influx task create --org ${DOCKER_INFLUXDB_INIT_ORG} --file /tmp/$1.flux
+}
+
+create_downsampling_task downsample_functions_usage functions_usage ${TABLE_FUNCTIONS}
+create_downsampling_task downsample_infra_usage infra_usage ${TABLE_INFRA}
+
+# long retention bucket of the 5m and 1h rollups written by the rollup sink of the monitor
+influx bucket create \
+  --name ${ROLLUP_BUCKET:-${DOCKER_INFLUXDB_INIT_BUCKET}_rollups} \
+  --retention ${ROLLUP_RETENTION:-400d} \
+  --org ${DOCKER_INFLUXDB_INIT_ORG}
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+import asyncio
+import logging
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# groups: metric groups to collect, start/end: step aligned range (end inclusive), step: seconds between points,
+# high_resolution: collected by the high resolution collector, attempt: number of previous failed attempts
+BackfillChunk = namedtuple("BackfillChunk", ["groups", "start", "end", "step", "high_resolution", "attempt"],
+                           defaults=[0])
+
+
+class BackfillWorker:
+    """ Re-collects gaps in the background.
+    Gaps are split into step aligned chunks of at most `chunk_seconds` and `max_points` points per series (Prometheus
+    rejects range queries of more than 11000 points). `concurrency` chunks are collected at a time, at most
+    `chunks_per_minute` are started per minute, and a chunk is only started while no live collection cycle is
+    running, so the backfill does not compete with the live cycles for the concurrency limit of the backends. The
+    frames of a chunk are written to the sinks before the next chunk of the worker is collected. Chunks with
+    missed queries are retried up to `retries` times; a failed write of a sink is counted for the sink and does not
+    retry the chunk, which the other sinks have already written.
+    """
+
+    max_points = 11000
+
+    def __init__(self, collect, sinks: list, concurrency: int = 2, chunks_per_minute: float = 6,
+                 chunk_seconds: int = 3600, retries: int = 3):
+        """
+        Args:
+            collect:
+                Callable - coroutine function collecting a BackfillChunk, returns (data category -> DataFrame,
+                Boolean complete)
+            sinks:
+                list - BaseSink instances the frames are written to
+            concurrency:
+                Integer - chunks collected at the same time
+            chunks_per_minute:
+                Float - chunks started per minute
+            chunk_seconds:
+                Integer - longest range of a chunk
+            retries:
+                Integer - attempts of a chunk with missed queries after the first
+        """
+        self.collect = collect
+        self.sinks = sinks
+        self.concurrency = concurrency
+        self.interval = 60.0 / chunks_per_minute
+        self.chunk_seconds = chunk_seconds
+        self.retries = retries
+        self.next_start = 0
+        self.active_cycles = 0
+        # created on the event loop by start
+        self.queue = None
+        self.idle = None
+        self.workers = []
+        self.stats = {"gaps": 0, "chunks_queued": 0, "chunks_collected": 0, "chunks_retried": 0, "chunks_failed": 0,
+                      "seconds_backfilled": 0}
+        # sink name -> chunks whose write to the sink failed
+        self.write_failures = {sink.name: 0 for sink in sinks}
+
+    def start(self) -> None:
+        if self.workers:
+            return
+        self.queue = asyncio.Queue()
+        self.idle = asyncio.Event()
+        if self.active_cycles == 0:
+            self.idle.set()
+        self.workers = [asyncio.ensure_future(self.run()) for _ in range(self.concurrency)]
+
+    def cycle_started(self) -> None:
+        self.active_cycles += 1
+        if self.idle is not None:
+            self.idle.clear()
+
+    def cycle_finished(self) -> None:
+        self.active_cycles -= 1
+        if self.active_cycles == 0 and self.idle is not None:
+            self.idle.set()
+
+    @classmethod
+    def split(cls, groups: tuple, start: int, end: int, step: int, high_resolution: bool,
+              chunk_seconds: int) -> list:
+        """ Splits a gap into chunks aligned to multiples of the step, which do not overlap.
+        Args:
+            groups:
+                Tuple - metric groups of the gap
+            start:
+                Integer - A timestamp, where the gap starts
+            end:
+                Integer - A timestamp, where the gap ends
+            step:
+                Integer - step of the range queries
+            high_resolution:
+                Boolean - collected by the high resolution collector
+            chunk_seconds:
+                Integer - longest range of a chunk
+
+        Returns:
+            list - BackfillChunks
+        """
+        points = min(max(chunk_seconds // step, 1), cls.max_points)
+        chunk_start = start - start % step
+        chunks = []
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + (points - 1) * step, end + (-end) % step)
+            chunks.append(BackfillChunk(tuple(groups), chunk_start, chunk_end, step, high_resolution))
+            chunk_start += points * step
+        return chunks
+
+    def add_gap(self, groups: tuple, start: int, end: int, step: int, high_resolution: bool = False) -> int:
+        """ Queues the chunks of a gap and returns their number. """
+        self.start()
+        chunks = self.split(groups, start, end, step, high_resolution, self.chunk_seconds)
+        for chunk in chunks:
+            self.queue.put_nowait(chunk)
+        self.stats["gaps"] += 1
+        self.stats["chunks_queued"] += len(chunks)
+        logging.info("backfilling %s from %s to %s in %s chunks", groups, time.strftime(
+            "%Y-%m-%d %H:%M:%S", time.gmtime(start)), time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(end)), len(chunks))
+        return len(chunks)
+
+    async def throttle(self) -> None:
+        """ Waits for the next start slot of the rate limit and until no live cycle is running. """
+        now = time.time()
+        slot = max(self.next_start, now)
+        self.next_start = slot + self.interval
+        await asyncio.sleep(slot - now)
+        await self.idle.wait()
+
+    async def run(self) -> None:
+        while True:
+            chunk = await self.queue.get()
+            await self.throttle()
+            try:
+                data_list, complete = await self.collect(chunk)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error("backfill of %s from %s to %s failed: %s", chunk.groups, chunk.start, chunk.end,
+                              repr(e))
+                data_list, complete = {}, False
+            frames = [(data_category, frame) for data_category, frame in data_list.items()
+                      if frame is not None and not frame.empty]
+            if frames:
+                await self.write(chunk, frames)
+            if complete:
+                self.stats["chunks_collected"] += 1
+                self.stats["seconds_backfilled"] += chunk.end - chunk.start + chunk.step
+            elif chunk.attempt < self.retries:
+                self.stats["chunks_retried"] += 1
+                self.queue.put_nowait(chunk._replace(attempt=chunk.attempt + 1))
+            else:
+                self.stats["chunks_failed"] += 1
+                logging.warning("gave up backfilling %s from %s to %s", chunk.groups, chunk.start, chunk.end)
+
+    async def write(self, chunk: BackfillChunk, frames: list) -> None:
+        """ Writes the frames of a chunk to every sink, a failing sink does not keep the others from writing. """
+        for sink in self.sinks:
+            try:
+                await sink.write(frames)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.write_failures[sink.name] += 1
+                logging.error("writing the backfill of %s from %s to %s to %s failed: %s", chunk.groups, chunk.start,
+                              chunk.end, sink.name, repr(e))
+
+    async def close(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, pending_chunks=self.queue.qsize() if self.queue is not None else 0,
+                    active_cycles=self.active_cycles, write_failures=dict(self.write_failures))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InfluxGapFinder:
+    """ Finds the ranges without any point of a cluster in InfluxDB, e.g. after the spool of the writer overflowed
+    during a long InfluxDB outage or when no watermarks were saved. The points of a measurement are counted in
+    windows of `resolution` seconds; consecutive empty windows form a gap of the metric groups writing to it.
+    """
+
+    # data category -> metric groups whose points are written to its measurement
+    category_groups = {"functions_usage": ("request", "pod_resources", "cloud"), "system_usage": ("node", "power")}
+
+    def __init__(self, url: str, token: str, org: str, bucket: str, measurements: dict, resolution: int = 300):
+        """
+        Args:
+            url:
+                String - url of InfluxDB
+            token:
+                String - token with read access to the bucket
+            org:
+                String - organization of the bucket
+            bucket:
+                String - bucket the monitor writes to
+            measurements:
+                dict - data category -> measurement name, e.g. {'functions_usage': 'functions_usage'}
+            resolution:
+                Integer - seconds of the windows, at least the longest period of the collections
+        """
+        self.url = url
+        self.token = token
+        self.org = org
+        self.bucket = bucket
+        self.measurements = measurements
+        self.resolution = resolution
+
+    def find_gaps(self, cluster_name: str, start: int, end: int) -> list:
+        """ Queries InfluxDB (blocking) for the empty windows of the measurements of a cluster.
+        Args:
+            cluster_name:
+                String - name of the cluster
+            start:
+                Integer - A timestamp, where the searched range starts
+            end:
+                Integer - A timestamp, where the searched range ends
+
+        Returns:
+            list - tuples of (groups, gap start, gap end)
+        """
+        # imported on first use, the backfill package is also used by the export without InfluxDB
+        from influxdb_client import InfluxDBClient
+
+        start -= start % self.resolution
+        gaps = []
+        with InfluxDBClient(url=self.url, token=self.token, org=self.org) as client:
+            query_api = client.query_api()
+            for data_category, measurement in self.measurements.items():
+                query = '''
+                    from(bucket: "{bucket}")
+                      |> range(start: {start}, stop: {end})
+                      |> filter(fn: (r) => r._measurement == "{measurement}" and r.cluster_name == "{cluster}")
+                      |> group()
+                      |> aggregateWindow(every: {resolution}s, fn: count, createEmpty: true, timeSrc: "_start")
+                      |> filter(fn: (r) => r._value == 0)
+                      |> keep(columns: ["_time"])
+                '''.format(bucket=self.bucket, start=start, end=end, measurement=measurement, cluster=cluster_name,
+                           resolution=self.resolution)
+                empty_windows = sorted(int(record.get_time().timestamp())
+                                       for table in query_api.query(query) for record in table.records)
+                groups = self.category_groups.get(data_category, ())
+                for gap_start, gap_end in self.merge_windows(empty_windows, self.resolution):
+                    gaps.append((groups, gap_start, min(gap_end, end)))
+        logging.info("found %s gaps of cluster %s in InfluxDB", len(gaps), cluster_name)
+        return gaps
+
+    @staticmethod
+    def merge_windows(window_starts: list, resolution: int) -> list:
+        """ Combines sorted, consecutive window starts into (start, end) ranges. """
+        ranges = []
+        for window_start in window_starts:
+            if ranges and ranges[-1][1] == window_start:
+                ranges[-1][1] = window_start + resolution
+            else:
+                ranges.append([window_start, window_start + resolution])
+        return [tuple(window_range) for window_range in ranges]
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Watermarks:
+    """ Remembers up to which timestamp every metric group of a cluster has been collected completely.
+    The collection windows of consecutive cycles overlap, so a failed cycle is repaired by the next one. Only when
+    the window of a successful cycle starts after the watermark of a group (the monitor was stopped, or Prometheus
+    was unreachable for longer than the window), the range in between is a gap. The watermarks are saved to a JSON
+    file, so the gap of a restart of the monitor is found by its first cycle.
+    """
+
+    def __init__(self, path: str = None, max_age: int = 24 * 3600, save_interval: float = 10):
+        """
+        Args:
+            path:
+                String, optional - JSON file of the watermarks, kept in memory only without
+            max_age:
+                Integer - seconds before now a gap may start, older data is no longer in Prometheus
+            save_interval:
+                Float - seconds between two saves of the file
+        """
+        self.path = path
+        self.max_age = max_age
+        self.save_interval = save_interval
+        self.last_save = 0
+        # "<cluster>/<group>" -> end (epoch seconds) of the last complete collection
+        self.watermarks = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path) as file:
+                    self.watermarks = {key: int(end) for key, end in json.load(file).items()}
+                logging.info("loaded the watermarks of %s metric groups from %s", len(self.watermarks), path)
+            except (OSError, ValueError, AttributeError) as e:
+                logging.warning("ignoring the watermarks in %s: %s", path, repr(e))
+
+    @staticmethod
+    def key(cluster_name: str, group: str) -> str:
+        return "{}/{}".format(cluster_name, group)
+
+    def record(self, cluster_name: str, groups, start: int, end: int) -> list:
+        """ Records a complete collection of [start, end] and returns the gaps before it.
+        Args:
+            cluster_name:
+                String - name of the cluster
+            groups:
+                Iterable - metric groups collected
+            start:
+                Integer - A timestamp, where the collected range starts
+            end:
+                Integer - A timestamp, where the collected range ends
+
+        Returns:
+            list - tuples of (groups, gap start, gap end), groups with the same gap are combined
+        """
+        oldest = int(time.time()) - self.max_age
+        gaps = {}
+        for group in groups:
+            key = self.key(cluster_name, group)
+            watermark = self.watermarks.get(key)
+            if watermark is not None and watermark < start and start > oldest:
+                gaps.setdefault((max(watermark, oldest), start), []).append(group)
+            self.watermarks[key] = max(end, watermark or end)
+        if time.time() - self.last_save >= self.save_interval:
+            self.save()
+        return [(tuple(groups), gap_start, gap_end) for (gap_start, gap_end), groups in gaps.items()]
+
+    def save(self) -> None:
+        self.last_save = time.time()
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # written to a temporary file first, a crash never leaves a truncated file
+        temporary_path = self.path + ".tmp"
+        try:
+            with open(temporary_path, "w") as file:
+                json.dump(self.watermarks, file)
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            logging.warning("could not save the watermarks to %s: %s", self.path, repr(e))
+
+    def get_stats(self) -> dict:
+        return dict(self.watermarks)
@@ -0,0 +1,3 @@
+from .Watermarks import Watermarks
+from .InfluxGapFinder import InfluxGapFinder
+from .BackfillWorker import BackfillWorker, BackfillChunk
@@ -8,10 +8,10 @@ import boto3
 from botocore.exceptions import ClientError
 import pandas as pd
 
-from Clusters import BaseCollector
+from Clusters import BaseCollector, CycleDeadline, BackendGuard
+from Observability import FrameSummary
 import logging
 
-logging.basicConfig(filename='Logs/log.log', format='%(message)s', filemode='w', level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 from pandas import DataFrame
@@ -19,6 +19,7 @@ from typing import List, Tuple
 
 import traceback
 import asyncio
+import functools
 import time
 
 
@@ -36,6 +37,8 @@ class AWSCollector(BaseCollector):
                                               region_name=self.region)
         self.metric_namespace = "AWS/Lambda"
         self.period = 60
+        self.cycle_deadline = CycleDeadline(45.0)
+        self.backend_guard = BackendGuard.for_backend("cloudwatch-" + str(self.region), latency_target=5.0)
 
 # TODO: update column name 
     async def get_and_convert_data_frame(self, start: int, end: int, stat_type: str,
@@ -60,7 +63,9 @@ class AWSCollector(BaseCollector):
         #search_query =  'SELECT SUM(Invocations) FROM SCHEMA("AWS/Lambda", FunctionName) GROUP BY FunctionName ORDER BY SUM() DESC '
         
         logging.debug("search_query, %s", search_query)
-        stats = self.cloudwatch_client.get_metric_data(
+        # boto3 is blocking, run it in the default executor so the guard can limit concurrent calls
+        get_metric_data = functools.partial(
+            self.cloudwatch_client.get_metric_data,
             MetricDataQueries=[
                 {
                     'Id': 'metric_data',
@@ -73,6 +78,7 @@ class AWSCollector(BaseCollector):
             EndTime=end,
             ScanBy='TimestampDescending'
         )
+        stats = await self.backend_guard.call(asyncio.get_event_loop().run_in_executor, None, get_metric_data)
         values = []
         logging.debug("feature_col_name, %s", feature_col_name)
         #logging.debug("stats, %s", stats)
@@ -98,8 +104,7 @@ class AWSCollector(BaseCollector):
 
         result_df = await self.get_and_convert_data_frame(start, end, 'SUM',
                                                           'Invocations', 'success_invocations')
-        logging.debug("frame, %s", 'success_invocations')
-        logging.debug(result_df)
+        logging.debug("frame, %s %s", 'success_invocations', FrameSummary(result_df))
         return result_df
     
     async def collect_concurrency_invocations(self, start: int, end: int) -> DataFrame:
@@ -120,8 +125,7 @@ class AWSCollector(BaseCollector):
         
         if len(result_df.values) > 0:
             result_df['replicas'] = result_df['replicas'].astype('float')
-        logging.debug("frame, %s", 'replicas')
-        logging.debug(result_df)
+        logging.debug("frame, %s %s", 'replicas', FrameSummary(result_df))
         return result_df
 
     async def collect_post_runtime_duration(self, start: int, end: int) -> DataFrame:
@@ -158,8 +162,7 @@ class AWSCollector(BaseCollector):
         if len(result_df.values) > 0:
             result_df["average_execution_time"] = result_df["average_execution_time"]/1000
             
-        logging.debug("frame, %s", 'average_execution_time')
-        logging.debug(result_df)
+        logging.debug("frame, %s %s", 'average_execution_time', FrameSummary(result_df))
         return result_df
 
     def collect_data_from_logs(self, func_name: str, start: int, end: int):
@@ -180,7 +183,7 @@ class AWSCollector(BaseCollector):
         response = None
 
         while response == None or response['status'] == 'Running':
-            print('Waiting for query to complete ...')
+            logging.debug('waiting for the logs query of %s to complete', func_name)
             time.sleep(1)
             response = self.logs_client.get_query_results(
                 queryId=query_id
@@ -245,14 +248,15 @@ class AWSCollector(BaseCollector):
         frame.index = pd.to_datetime(frame.index, unit='s')
         frame['cluster_name'] = cluster_name
         frame['measurement_category'] = measurement_category
-        frame['function_name'] = frame.apply(lambda x: self.change_function_name(x['function_name']),
-                                                    axis=1)
+        # rename once per distinct function instead of once per row
+        frame['function_name'] = frame['function_name'].astype('category').map(
+            self.change_function_name).astype(object)
         # frame.fillna(0, inplace=True)
-        logging.debug("frame, %s", 'do_frame_postprocessing')
-        logging.debug(frame)
+        logging.debug("frame, %s %s", 'do_frame_postprocessing', FrameSummary(frame))
         return frame
 
-    async def collect(self, cluster_name: str, start: int, end: int) -> DataFrame:
+    async def collect(self, cluster_name: str, start: int, end: int, groups: tuple = None,
+                      deadline: float = None) -> DataFrame:
         """ Collects function active_instances, network_egress, and execution_times for a GoogleCloudTarget.
         Args:
             cluster_name:
@@ -261,39 +265,39 @@ class AWSCollector(BaseCollector):
                 Integer - A timestamp, where the query range should start
             end:
                 Integer - A timestamp, where the query range should end
+            groups:
+                Tuple, optional - metric groups to collect, all AWS metrics belong to 'cloud'. Default: all
+            deadline:
+                Float, optional - seconds this cycle may take, queries still running are cancelled. Default: 45
         Returns:
             DataFrame - Query result as DataFrame - with columns: 'timestamp', 'target', 'function_name' and measurement fields(s)
         """
-        # start each worker
-        tasks: List[asyncio.Task] = [
-            asyncio.create_task(self.collect_execution_times(start, end)),
-            asyncio.create_task(self.collect_invocations(start, end)),
-            asyncio.create_task(self.collect_concurrency_invocations(start, end)),
-            asyncio.create_task(self.collect_post_runtime_duration(start, end)),
+        if groups is not None and "cloud" not in groups:
+            return {'functions_usage': pd.DataFrame()}
+
+        jobs = [
+            self.cycle_deadline.job("collect_execution_times", 0, self.collect_execution_times, (start, end)),
+            self.cycle_deadline.job("collect_invocations", 0, self.collect_invocations, (start, end)),
+            self.cycle_deadline.job("collect_concurrency_invocations", 0, self.collect_concurrency_invocations,
+                                    (start, end)),
+            self.cycle_deadline.job("collect_post_runtime_duration", 0, self.collect_post_runtime_duration,
+                                    (start, end))
         ]
-        # wait for all workers
+        results = await self.cycle_deadline.run(jobs, deadline)
+
         combined_frame = DataFrame()
-        try:
-            # wait for max 45 seconds
-            for result in asyncio.as_completed(tasks, timeout=45.0):
-                frame = await result
-                print("Frame collected")
-                if frame.empty:
-                    continue
-                elif combined_frame.empty:
-                    combined_frame = frame
-                else:
-                    combined_frame = pd.merge(combined_frame, frame, on=['timestamp', 'function_name'])
-
-        except Exception as e:
-            print("Exception when tyring to query data")
-            print(e)
-            traceback.print_exc()
+        for job, frame in results:
+            if frame.empty:
+                continue
+            elif combined_frame.empty:
+                combined_frame = frame
+            else:
+                combined_frame = pd.merge(combined_frame, frame, on=['timestamp', 'function_name'])
 
         if(len(combined_frame.values) > 0):
-            logging.debug("combined_frame_before, %s", combined_frame)
+            logging.debug("combined_frame_before, %s", FrameSummary(combined_frame))
             #combined_frame['timestamp'] = pd.to_datetime(combined_frame['timestamp'], utc=True)
-            logging.debug("combined_frame, %s", combined_frame)
+            logging.debug("combined_frame, %s", FrameSummary(combined_frame))
             values = []
             try:
                 for func_name in combined_frame["function_name"].unique():
@@ -307,16 +311,13 @@ class AWSCollector(BaseCollector):
                     df = df.dropna(how='any')
                     df.reset_index(inplace=True, drop=True)
                     df["function_name"]= func_name
-                    logging.debug("frame, %s", 'collect_data_from_logs')
-                    logging.debug(df)
+                    logging.debug("frame, %s %s", 'collect_data_from_logs', FrameSummary(df))
                     processed_values = df.to_dict('records')
                     values = values + processed_values
             except Exception as e:
-                logging.error(e)
-                print("something when wrong", e)
+                logging.error("collecting the logs of the functions failed: %s", repr(e))
             df = pd.DataFrame(values)
-            logging.debug("frame, %s", df)
-            logging.debug(df)
+            logging.debug("frame, %s", FrameSummary(df))
             if(len(df.values) > 0 and "timestamp" in df.columns and "function_name" in df.columns):
                 df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True)
                 combined_frame = pd.merge(left=combined_frame, right=df, how='inner', right_on=['timestamp', 'function_name'], left_on=['timestamp', 'function_name'])
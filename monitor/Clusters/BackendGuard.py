@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class BackendError(Exception):
+    """ Raised for responses that indicate an overloaded or unavailable backend (e.g. HTTP 5xx or 429). """
+    pass
+
+
+class CircuitOpenError(BackendError):
+    """ Raised instead of calling a backend while its circuit breaker is open. """
+    pass
+
+
+class BackendGuard:
+    """ Protects a backend (a Prometheus instance, CloudWatch, Cloud Monitoring) from the collectors.
+
+    Concurrency limiter: at most `limit` calls are in flight. The limit grows additively for every call that
+    finishes below `latency_target` and is halved (at most once per `latency_target`) on errors and slow calls,
+    so an overloaded backend is not hit with every query of a cycle at once.
+
+    Circuit breaker: after `failure_threshold` consecutive failures calls fail fast with a CircuitOpenError
+    instead of waiting for timeouts. After `recovery_timeout` seconds a single probe call is let through,
+    its success closes the circuit again.
+    """
+
+    # backend name (e.g. the prometheus url) -> BackendGuard, shared by all collectors using the backend
+    registry = {}
+
+    def __init__(self, name: str, initial_limit: int = 10, min_limit: int = 1, max_limit: int = 50,
+                 latency_target: float = 2.0, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        """
+        Args:
+            name:
+                String - name of the backend, used for logging
+            initial_limit:
+                Integer - concurrent calls allowed at the start
+            min_limit:
+                Integer - lower bound of the concurrency limit
+            max_limit:
+                Integer - upper bound of the concurrency limit
+            latency_target:
+                Float - calls slower than this (seconds) decrease the concurrency limit
+            failure_threshold:
+                Integer - consecutive failures that open the circuit
+            recovery_timeout:
+                Float - seconds the circuit stays open before a probe call is allowed
+        """
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+        self.in_flight = 0
+        self.last_decrease = 0
+        self.waiters = deque()
+
+        # closed, open or half_open
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0
+        self.probe_in_flight = False
+
+        self.stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "circuit_opened": 0}
+
+    @classmethod
+    def for_backend(cls, name: str, **kwargs) -> "BackendGuard":
+        """ Returns the guard of a backend, creating it with the given settings on first use. """
+        if name not in cls.registry:
+            cls.registry[name] = cls(name, **kwargs)
+        return cls.registry[name]
+
+    def allow_call(self) -> bool:
+        """ Checks the circuit breaker, switching from open to half open after the recovery timeout. """
+        if self.state == "open" and time.time() - self.opened_at >= self.recovery_timeout:
+            self.state = "half_open"
+            logging.info("backend %s: circuit half open, probing", self.name)
+        if self.state == "half_open" and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        return self.state == "closed"
+
+    async def acquire(self) -> None:
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_event_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # pass a slot we may have been woken up for to the next waiter
+                self.wake_waiters()
+                raise
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self.wake_waiters()
+
+    def wake_waiters(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def decrease_limit(self) -> None:
+        now = time.time()
+        # all calls in flight when the backend became slow report it, only react once
+        if now - self.last_decrease < self.latency_target:
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit / 2)
+        logging.debug("backend %s: concurrency limit decreased to %s", self.name, int(self.limit))
+
+    def record_success(self, latency: float) -> None:
+        self.consecutive_failures = 0
+        if self.state == "half_open":
+            self.state = "closed"
+            logging.info("backend %s: circuit closed", self.name)
+        if latency > self.latency_target:
+            self.stats["slow_calls"] += 1
+            self.decrease_limit()
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.wake_waiters()
+
+    def record_failure(self) -> None:
+        self.stats["failures"] += 1
+        self.consecutive_failures += 1
+        self.decrease_limit()
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.stats["circuit_opened"] += 1
+                logging.warning("backend %s: circuit opened after %s failures", self.name,
+                                self.consecutive_failures)
+            self.state = "open"
+            self.opened_at = time.time()
+
+    async def call(self, coroutine_function, *args, **kwargs):
+        """ Calls a backend through the circuit breaker and the concurrency limiter.
+        Args:
+            coroutine_function:
+                Callable - coroutine function performing the request, raising on failures
+            args, kwargs:
+                arguments of coroutine_function
+
+        Returns:
+            Object - the result of coroutine_function
+
+        Raises:
+            CircuitOpenError - if the circuit is open
+        """
+        if not self.allow_call():
+            self.stats["rejected"] += 1
+            raise CircuitOpenError("circuit of backend {} is open".format(self.name))
+
+        is_probe = self.state == "half_open"
+        try:
+            await self.acquire()
+        except BaseException:
+            if is_probe:
+                self.probe_in_flight = False
+            raise
+
+        self.stats["calls"] += 1
+        started = time.time()
+        try:
+            result = await coroutine_function(*args, **kwargs)
+        except asyncio.CancelledError:
+            # cancelled at the cycle deadline, the backend is too slow
+            self.stats["slow_calls"] += 1
+            self.decrease_limit()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        else:
+            self.record_success(time.time() - started)
+            return result
+        finally:
+            if is_probe:
+                self.probe_in_flight = False
+            self.release()
+
+    def get_stats(self) -> dict:
+        """ Returns the counters together with the current limit and circuit state. """
+        stats = dict(self.stats)
+        stats["limit"] = int(self.limit)
+        stats["in_flight"] = self.in_flight
+        stats["state"] = self.state
+        return stats
@@ -1,14 +1,81 @@
 from abc import abstractmethod
+import pandas as pd
 from pandas import DataFrame
 
 
+
 class BaseCollector:
     """Abstract DataCollector class
     It serves as a base  class for all the deployment classes for particular clusters
     """
 
+    # metric groups that can be scheduled with their own period and window:
+    #   request - invocations, errors, execution times, cold starts
+    #   pod_resources - per function pod cpu/memory/fs/network usage, replicas, requests and limits
+    #   node - node cpu/memory/disk/network usage
+    #   power - node and per function power consumption
+    #   cloud - AWS Lambda and Google Cloud Functions metrics
+    metric_groups = ("request", "pod_resources", "node", "power", "cloud")
+    # queries of groups with a lower value are started first and get the full cycle deadline
+    metric_group_priorities = {"request": 0, "cloud": 0, "pod_resources": 1, "power": 2, "node": 2}
+
+    @staticmethod
+    def merge_frames(frames: list, keys: list) -> DataFrame:
+        """ Outer joins the frames of one collection cycle on the given keys in a single step.
+        Rows with duplicate keys within a frame are averaged.
+        Args:
+            frames:
+                list - DataFrames with the key columns (the first key may be the index)
+            keys:
+                list - join keys, e.g. ['timestamp', 'function_name']
+
+        Returns:
+            DataFrame - the combined frame indexed by the first key
+        """
+        indexed_frames = []
+        for frame in frames:
+            if len(frame.values) == 0:
+                continue
+            if keys[0] not in frame.columns:
+                frame = frame.reset_index()
+            frame = frame.set_index(keys)
+            if not frame.index.is_unique:
+                frame = frame.groupby(level=keys).mean(numeric_only=True)
+            indexed_frames.append(frame)
+
+        if len(indexed_frames) == 0:
+            return DataFrame()
+
+        combined_frame = pd.concat(indexed_frames, axis=1, join="outer")
+        if len(keys) > 1:
+            combined_frame.reset_index(level=keys[1:], inplace=True)
+        return combined_frame
+
+    def build_cycle_jobs(self, metric_groups: dict, groups, start: int, end: int) -> list:
+        """ Creates the CycleJobs of the selected metric groups, prioritized by metric_group_priorities.
+        Args:
+            metric_groups:
+                dict - group name -> {measurement category: [collect functions]}
+            groups:
+                Iterable - names of the groups to collect
+            start:
+                Integer - A timestamp, where the query range should start
+            end:
+                Integer - A timestamp, where the query range should end
+
+        Returns:
+            list - CycleJobs with the per-query deadlines of self.cycle_deadline, the measurement category is the
+            last argument of each job
+        """
+        return [self.cycle_deadline.job(collect_function.__name__, self.metric_group_priorities.get(group, 0),
+                                        collect_function, (start, end, measurement_category))
+                for group in groups if group in metric_groups
+                for measurement_category, collect_functions in metric_groups[group].items()
+                for collect_function in collect_functions]
+
     @abstractmethod
-    async def collect(self, config_object: object, cluster_name: str, start: int, end: int) -> dict:
+    async def collect(self, cluster_name: str, start: int, end: int, groups: tuple = None,
+                      deadline: float = None) -> dict:
         pass
 
     @abstractmethod
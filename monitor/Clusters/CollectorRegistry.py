@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CollectorRegistry:
+    """ Maps cluster types to their collector classes.
+    The module of a collector is only imported when its class is requested, so the monitor only loads the client
+    libraries of the configured platform (e.g. not boto3 and google-cloud-monitoring for an OpenFaaS cluster).
+    """
+
+    # cluster type -> (module, class name)
+    collectors = {
+        "OPENFAAS": ("Clusters.OpenFaas", "OpenFaasCollector"),
+        "OPENWHISK": ("Clusters.OpenWhisk", "OpenWhiskCollector"),
+        "GCF": ("Clusters.Google", "GCFCollector"),
+        "AWS": ("Clusters.AWS", "AWSCollector"),
+    }
+
+    @classmethod
+    def register(cls, cluster_type: str, module: str, class_name: str) -> None:
+        """ Registers a collector, e.g. register("KNATIVE", "Clusters.Knative", "KnativeCollector").
+        Args:
+            cluster_type:
+                String - value of CLUSTER_TYPE selecting the collector
+            module:
+                String - absolute module path of the collector
+            class_name:
+                String - name of the collector class in the module
+        """
+        cls.collectors[cluster_type] = (module, class_name)
+
+    @classmethod
+    def get(cls, cluster_type: str) -> type:
+        """ Imports and returns the collector class of a cluster type. """
+        if cluster_type not in cls.collectors:
+            raise ValueError("unknown cluster type {}, expected one of {}".format(
+                cluster_type, ", ".join(cls.collectors)))
+        module, class_name = cls.collectors[cluster_type]
+        return getattr(importlib.import_module(module), class_name)
+
+    @classmethod
+    def by_class_name(cls, class_name: str) -> type:
+        """ Imports and returns a registered collector class by its name, None if it is not registered. """
+        for cluster_type, (_, registered_class_name) in cls.collectors.items():
+            if registered_class_name == class_name:
+                return cls.get(cluster_type)
+        return None
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+import asyncio
+import logging
+import time
+from collections import deque, namedtuple
+
+from Observability import Metrics
+
+logger = logging.getLogger(__name__)
+
+# name: metric name used for the missed counters, priority: 0 is the highest,
+# collect_function/args: the coroutine function to run, timeout: optional per-query deadline in seconds
+CycleJob = namedtuple("CycleJob", ["name", "priority", "collect_function", "args", "timeout"], defaults=[None])
+
+
+class CycleDeadline:
+    """ Runs the queries of one collection cycle within a deadline budget.
+    Queries are started in priority order. Lower priority queries get only a share of the budget so they are
+    cut first when the backend is slow. Every query also has its own deadline: a configured timeout of its metric,
+    or `timeout_factor` times the 95th percentile of its recent durations, so a single hanging query is cancelled
+    long before the cycle deadline. Queries still running at their deadline are cancelled, and the results of all
+    completed queries are returned instead of failing the whole cycle.
+    """
+
+    # durations kept per metric, and needed before the percentile is used
+    history_size = 50
+    min_history = 10
+
+    def __init__(self, budget: float = 30.0, low_priority_share: float = 0.8, timeout_factor: float = 3.0,
+                 min_timeout: float = 2.0):
+        """
+        Args:
+            budget:
+                Float - default deadline of a cycle in seconds
+            low_priority_share:
+                Float - share of the budget available to queries with a priority > 0
+            timeout_factor:
+                Float - per-query deadline as a multiple of the 95th percentile duration of the query
+            min_timeout:
+                Float - shortest per-query deadline derived from the durations
+        """
+        self.budget = budget
+        self.low_priority_share = low_priority_share
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        # metric name -> configured per-query deadline in seconds
+        self.timeouts = {}
+        # metric name -> durations of the last queries, a missed query counts with its deadline
+        self.durations = {}
+        # metric name -> count
+        self.missed = {}
+        self.completed = {}
+
+    def query_timeout(self, name: str) -> float:
+        """ Returns the per-query deadline of a metric, None while it has neither a configured timeout nor enough
+        recorded durations.
+        """
+        if name in self.timeouts:
+            return self.timeouts[name]
+        durations = self.durations.get(name)
+        if durations is None or len(durations) < self.min_history:
+            return None
+        ordered = sorted(durations)
+        return max(self.min_timeout, self.timeout_factor * ordered[int(0.95 * (len(ordered) - 1))])
+
+    def job(self, name: str, priority: int, collect_function, args: tuple) -> CycleJob:
+        """ Creates a CycleJob with the per-query deadline of its metric. """
+        return CycleJob(name, priority, collect_function, args, self.query_timeout(name))
+
+    def record_duration(self, name: str, duration: float) -> None:
+        if name not in self.durations:
+            self.durations[name] = deque(maxlen=self.history_size)
+        self.durations[name].append(duration)
+
+    def query_deadline(self, job: CycleJob, budget: float) -> float:
+        deadline = budget if job.priority == 0 else budget * self.low_priority_share
+        if job.timeout is not None:
+            deadline = min(deadline, job.timeout)
+        return deadline
+
+    async def run_job(self, job: CycleJob):
+        # the task has its own context, queries of the job are labelled with its name
+        Metrics.current_metric.set(job.name)
+        started = time.monotonic()
+        result = await job.collect_function(*job.args)
+        self.record_duration(job.name, time.monotonic() - started)
+        return result
+
+    async def run(self, jobs: list, budget: float = None) -> list:
+        """ Runs the jobs concurrently and returns the results of the jobs that completed in time.
+        Args:
+            jobs:
+                list - CycleJobs of this cycle
+            budget:
+                Float, optional - deadline of this cycle in seconds, capped at the configured budget
+
+        Returns:
+            list - tuples of (CycleJob, result) in priority order
+        """
+        budget = self.budget if budget is None else min(budget, self.budget)
+
+        tasks = {}
+        deadlines = {}
+        for job in sorted(jobs, key=lambda job: job.priority):
+            deadlines[job] = self.query_deadline(job, budget)
+            tasks[job] = asyncio.create_task(asyncio.wait_for(self.run_job(job), deadlines[job]))
+
+        if len(tasks) == 0:
+            return []
+
+        done, pending = await asyncio.wait(tasks.values(), timeout=budget)
+        for task in pending:
+            task.cancel()
+        if pending:
+            # wait for the cancellation so no task outlives the cycle
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        results = []
+        for job, task in tasks.items():
+            if task in done and not task.cancelled() and task.exception() is None:
+                self.completed[job.name] = self.completed.get(job.name, 0) + 1
+                results.append((job, task.result()))
+                continue
+
+            self.missed[job.name] = self.missed.get(job.name, 0) + 1
+            Metrics.query_missed.labels(Metrics.cluster_name, job.name).inc()
+            if task in done and not task.cancelled() and not isinstance(task.exception(), asyncio.TimeoutError):
+                logging.error("query %s failed: %s", job.name, repr(task.exception()))
+            else:
+                # the deadline is a lower bound of the duration, a slower backend raises the next deadlines
+                self.record_duration(job.name, deadlines[job])
+                logging.warning("query %s missed its deadline of %.1fs (missed %s times)", job.name, deadlines[job],
+                                self.missed[job.name])
+
+        return results
@@ -3,12 +3,12 @@ import subprocess
 import sys
 import os
 sys.path.append(os.path.abspath('../'))
-from Clusters import BaseCollector
+from Clusters import BaseCollector, CycleDeadline, BackendGuard
+from Observability import FrameSummary
 import logging
 import json
 import yaml
 
-logging.basicConfig(filename='Logs/log.log', format='%(message)s', filemode='w', level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 from pandas import DataFrame
@@ -29,6 +29,8 @@ class GCFCollector(BaseCollector):
         self.config_object = config_object
         self.config_path = config_path
         self.power_collection = power_collection
+        self.cycle_deadline = CycleDeadline(45.0)
+        self.backend_guard = BackendGuard.for_backend("cloud-monitoring", latency_target=5.0)
 
 
     async def get_and_convert_data_frame(self, start: int, end: int,
@@ -63,18 +65,23 @@ class GCFCollector(BaseCollector):
                 "per_series_aligner": monitoring_v3.Aggregation.Aligner.ALIGN_SUM,
             }
         )
-        ts_results = await client.list_time_series(
-            request={
-                "name": f"projects/{ self.config_object['project_id']}",
-                "filter": 'metric.type = "cloudfunctions.googleapis.com/function/' + feature_col_name + '"',
-                "interval": interval,
-                "view": "FULL",
-                "aggregation": aggregation,
-            }
-        )
+        async def list_time_series() -> list:
+            # fetch all pages within the guarded call
+            pager = await client.list_time_series(
+                request={
+                    "name": f"projects/{ self.config_object['project_id']}",
+                    "filter": 'metric.type = "cloudfunctions.googleapis.com/function/' + feature_col_name + '"',
+                    "interval": interval,
+                    "view": "FULL",
+                    "aggregation": aggregation,
+                }
+            )
+            return [ts async for ts in pager]
+
+        ts_results = await self.backend_guard.call(list_time_series)
         values = []
         #logging.debug("ts_results, %s", ts_results)
-        async for ts in ts_results:
+        for ts in ts_results:
             name = ts.resource.labels['function_name']
             region = ts.resource.labels['region']
 
@@ -133,8 +140,7 @@ class GCFCollector(BaseCollector):
         result_df.rename(columns = {'active_instances':'replicas'}, inplace = True)
         if len(result_df.values) > 0:
             result_df['replicas'] = result_df['replicas'].astype('float')
-        logging.debug("frame, %s", 'active_instances')
-        logging.debug(result_df)
+        logging.debug("frame, %s %s", 'active_instances', FrameSummary(result_df))
         
         return result_df
 
@@ -154,8 +160,7 @@ class GCFCollector(BaseCollector):
 
         result_df = await self.get_and_convert_data_frame(start, end, 'network_egress')
         result_df.rename(columns = {'network_egress':'pods-network-transmit-bytes'}, inplace = True)
-        logging.debug("frame, %s", 'pods-network-transmit-bytes')
-        logging.debug(result_df)        
+        logging.debug("frame, %s %s", 'pods-network-transmit-bytes', FrameSummary(result_df))
         return result_df
 
     async def collect_execution_times(self, start: int, end: int) -> DataFrame:
@@ -174,8 +179,7 @@ class GCFCollector(BaseCollector):
 
         result_df = await self.get_and_convert_data_frame(start, end, 'execution_times')
         result_df.rename(columns = {'execution_times':'average_execution_time'}, inplace = True)
-        logging.debug("frame, %s", 'average_execution_time')
-        logging.debug(result_df)
+        logging.debug("frame, %s %s", 'average_execution_time', FrameSummary(result_df))
 
         return result_df
 
@@ -195,8 +199,7 @@ class GCFCollector(BaseCollector):
 
         result_df = await self.get_and_convert_data_frame(start, end, 'user_memory_bytes')
         result_df.rename(columns = {'user_memory_bytes':'pods-mem-sum-bytes'}, inplace = True)
-        logging.debug("frame, %s", 'pods-mem-sum-bytes')
-        logging.debug(result_df)
+        logging.debug("frame, %s %s", 'pods-mem-sum-bytes', FrameSummary(result_df))
 
         return result_df
 
@@ -230,54 +233,49 @@ class GCFCollector(BaseCollector):
         frame.index = pd.to_datetime(frame.index, unit='s')
         frame['cluster_name'] = cluster_name
         frame['measurement_category'] = measurement_category
-        frame['function_name'] = frame.apply(lambda x: self.change_function_name(x['function_name']),
-                                            axis=1)
+        # rename once per distinct function instead of once per row
+        frame['function_name'] = frame['function_name'].astype('category').map(
+            self.change_function_name).astype(object)
         # frame.fillna(0, inplace=True)
-        logging.debug("frame, %s", measurement_category)
-        logging.debug(frame)
+        logging.debug("frame, %s %s", measurement_category, FrameSummary(frame))
         return frame
 
-    async def collect(self, cluster_name: str, start: int, end: int) -> DataFrame:
+    async def collect(self, cluster_name: str, start: int, end: int, groups: tuple = None,
+                      deadline: float = None) -> DataFrame:
         """ Collects function active_instances, network_egress, and execution_times for a GoogleCloudTarget.
         Args:
-            config_object:
-                object - The Target, for which the prometheus should be queried
             cluster_name:
                 String - The name of the cluster
             start:
                 Integer - A timestamp, where the query range should start
             end:
                 Integer - A timestamp, where the query range should end
+            groups:
+                Tuple, optional - metric groups to collect, all GCF metrics belong to 'cloud'. Default: all
+            deadline:
+                Float, optional - seconds this cycle may take, queries still running are cancelled. Default: 45
         Returns:
             DataFrame - Query result as DataFrame - with columns: 'timestamp', 'target', 'function_name' and measurement fields(s)
         """
-
-        # start each worker
-        tasks: List[asyncio.Task] = [
-            asyncio.create_task(self.collect_network_egress(start, end)),
-            asyncio.create_task(self.collect_execution_times(start, end)),
-            asyncio.create_task(self.collect_user_memory_bytes(start, end)),
-            asyncio.create_task(self.collect_active_instances(start, end))
+        if groups is not None and "cloud" not in groups:
+            return {'functions_usage': pd.DataFrame()}
+
+        jobs = [
+            self.cycle_deadline.job("collect_network_egress", 0, self.collect_network_egress, (start, end)),
+            self.cycle_deadline.job("collect_execution_times", 0, self.collect_execution_times, (start, end)),
+            self.cycle_deadline.job("collect_user_memory_bytes", 0, self.collect_user_memory_bytes, (start, end)),
+            self.cycle_deadline.job("collect_active_instances", 0, self.collect_active_instances, (start, end))
         ]
+        results = await self.cycle_deadline.run(jobs, deadline)
 
-        # wait for all workers
         combined_frame = DataFrame()
-        try:
-            # wait for max 45 seconds
-            for result in asyncio.as_completed(tasks, timeout=45.0):
-                frame = await result
-
-                if combined_frame.empty and len(frame.values)>0 and "timestamp" in frame.columns and "function_name" in frame.columns and "region" in frame.columns:
-                    combined_frame = frame
-                else:
-                    #frame = frame[frame["function_name"] == "mytestservicegcf1-dev-nodeinfo"]
-                    if len(frame.values)>0 and "timestamp" in frame.columns and "function_name" in frame.columns and "region" in frame.columns:
-                        combined_frame = pd.merge(combined_frame, frame, on=['timestamp', 'function_name', 'region'])
-
-        except Exception as e:
-            print("Exception when tyring to query data")
-            print(e)
-            traceback.print_exc()
+        for job, frame in results:
+            if combined_frame.empty and len(frame.values)>0 and "timestamp" in frame.columns and "function_name" in frame.columns and "region" in frame.columns:
+                combined_frame = frame
+            else:
+                #frame = frame[frame["function_name"] == "mytestservicegcf1-dev-nodeinfo"]
+                if len(frame.values)>0 and "timestamp" in frame.columns and "function_name" in frame.columns and "region" in frame.columns:
+                    combined_frame = pd.merge(combined_frame, frame, on=['timestamp', 'function_name', 'region'])
 
         combined_frame_functions_usage =  self.do_frame_postprocessing(combined_frame, cluster_name, "function_usage")
         result_dict = {'functions_usage': combined_frame_functions_usage}
@@ -1,28 +1,63 @@
 #!/usr/bin/env python
 from Clusters import BaseCollector
 import logging
-from logging.handlers import RotatingFileHandler
 import pandas as pd
 from pandas import DataFrame
 from .PrometheusCollector import PrometheusCollector
+from .PodIndex import PodIndex
+from Clusters import StaticMetricCache
+from Observability import FrameSummary
 from abc import abstractmethod
 import sys
 
-logging.basicConfig(format='%(message)s', level=logging.DEBUG,
-                    handlers=[
-                        RotatingFileHandler("Logs/log.log", maxBytes=1e9, backupCount=2),
-                        logging.StreamHandler(sys.stdout)
-                        ]
-                    )
 logger = logging.getLogger(__name__)
 
 
 class KubernetesCollector(BaseCollector):
 
-    def __init__(self, prometheus_url: str, step: int, interval: str):
+    def __init__(self, prometheus_url: str, step: int, interval: str, pod_index_ttl: int = 300,
+                 static_metrics_ttl: int = 600):
         self.prom_obj = PrometheusCollector(prometheus_url)
         self.step = step
         self.interval = interval
+        # shared by all pod based queries of this collector
+        self.pod_index = PodIndex(self.prom_obj, ttl=pod_index_ttl)
+        self.prom_obj.pod_index = self.pod_index
+        # requests, limits, total memory and cpu cores only change on deploys or node changes
+        self.static_cache = StaticMetricCache(static_metrics_ttl)
+
+    async def collect_static_pod_metric(self, query: str, start: int, end: int, measurement_category: str,
+                                        measurement_field_name: str) -> DataFrame:
+        """ Returns a cached static per-function metric broadcast over the timestamps of [start, end].
+        The metric is refetched after the cache ttl or as soon as the pod set changes.
+        Args:
+            query:
+                String - instant query, grouped by pod
+            start:
+                Integer - timestamp of start
+            end:
+                Integer - timestamp of end
+            measurement_category:
+                String - measurement_category
+            measurement_field_name:
+                String - Name of the measurement field
+        Returns:
+            DataFrame - a Pandas Dataframe with the result.
+        """
+        async def fetch() -> DataFrame:
+            frame = await self.prom_obj.query_prometheus_without_ts(query, measurement_category,
+                                                                    measurement_field_name, True, "pod")
+            if len(frame.values) > 0:
+                frame = frame.groupby(['function_name'])[measurement_field_name].mean().reset_index()
+            return frame
+
+        await self.pod_index.refresh()
+        frame = await self.static_cache.get(measurement_field_name, fetch, self.pod_index.version)
+        frame = self.static_cache.broadcast(frame, start, end, self.step)
+        if len(frame.values) > 0:
+            frame = frame[["timestamp", "function_name", measurement_field_name]]
+            frame.set_index("timestamp", inplace=True)
+        return frame
 
     async def collect_replicas(self, start: int, end: int, measurement_category: str) -> DataFrame:
         """ Collects the amount of active replicas per function.
@@ -88,18 +123,18 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - The result as Dataframe with the columns: 'timestamp', 'action' and 'invocations'
         """
-        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode!=\"idle\"}[1m]) '
+        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode!=\"idle\"}[' + self.interval + ']) '
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "avg_cpu_user", start, end, self.step)
 
-        logging.debug("node_cpu_seconds_total %s", frame)
+        logging.debug("node_cpu_seconds_total %s", FrameSummary(frame))
 
         if len(frame.values) > 0:
             frame = frame.groupby(['timestamp', 'node', 'mode'])[
                 'avg_cpu_user'].sum().reset_index()
-            logging.debug("node_cpu_seconds_totaldfdsfds %s", frame)
+            logging.debug("node_cpu_seconds_total per node and mode %s", FrameSummary(frame))
             frame = frame.groupby(['timestamp', 'node'])[
                 'avg_cpu_user'].sum().reset_index()
-            logging.debug("node_cpu_seconds_totdaldfdsfdsdsfsdf %s", frame)
+            logging.debug("node_cpu_seconds_total per node %s", FrameSummary(frame))
             frame.reset_index(inplace=True, drop=True)
             frame.set_index("timestamp", inplace=True)
 
@@ -142,7 +177,8 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "idelta(powerexporter_power_consumption_ampere_seconds_total{instance=~\".*.*\"}[1m:10s])"
+        query = "idelta(powerexporter_power_consumption_ampere_seconds_total{instance=~\".*.*\"}[%s:%ss])" % (
+            self.interval, min(10, self.step))
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "avg_power_consumption", start, end, self.step, True,
                                                      "pod")
         if len(frame.values) > 0:
@@ -169,18 +205,7 @@ class KubernetesCollector(BaseCollector):
         query = "sum(kube_pod_container_resource_requests{namespace=~\".*openfaas-fn.*\", resource=~\"cpu\"}) by (pod,node)"
         logging.debug("collect_pod_cpu_requests query %s", query)
 
-        frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-cpu-requests", start, end, self.step, True,
-                                                     "pod")
-        if len(frame.values) > 0:
-            frame = frame.groupby(['timestamp', 'function_name'])[
-                'pods-cpu-requests'].mean().reset_index()
-            
-            
-            frame.reset_index(inplace=True, drop=True)
-            frame = frame[["timestamp","function_name", "pods-cpu-requests"]]
-            frame.set_index("timestamp", inplace=True)
-
-        return frame
+        return await self.collect_static_pod_metric(query, start, end, measurement_category, "pods-cpu-requests")
 
     async def collect_pod_cpu_limits(self, start: int, end: int, measurement_category: str) -> DataFrame:
         """ Collects the amount of active replicas per function.
@@ -196,17 +221,8 @@ class KubernetesCollector(BaseCollector):
         """
         query = "sum(kube_pod_container_resource_limits{namespace=~\".*openfaas-fn.*\", resource=~\"cpu\"}) by (pod,node)"
         logging.debug("kube_pod_container_resource_limits query %s", query)
-        frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-cpu-limits", start, end, self.step, True,
-                                                     "pod")
-        if len(frame.values) > 0:
-            frame = frame.groupby(['timestamp', 'function_name'])[
-                'pods-cpu-limits'].mean().reset_index()
-            
-            frame.reset_index(inplace=True, drop=True)
-            frame = frame[["timestamp","function_name", "pods-cpu-limits"]]
-            frame.set_index("timestamp", inplace=True)
 
-        return frame
+        return await self.collect_static_pod_metric(query, start, end, measurement_category, "pods-cpu-limits")
 
     async def collect_machine_cpu_cores(self, measurement_category: str) -> DataFrame:
         """ Collects the amount of active replicas per function.
@@ -221,8 +237,10 @@ class KubernetesCollector(BaseCollector):
             DataFrame - a Pandas Dataframe with the result.
         """
         query = 'machine_cpu_cores'
-        frame = await self.prom_obj.query_prometheus_without_ts(query, measurement_category, "machine_cpu_cores")
-        frame.reset_index(inplace=True, drop=True)
+        frame = await self.static_cache.get(
+            "machine_cpu_cores",
+            lambda: self.prom_obj.query_prometheus_without_ts(query, measurement_category, "machine_cpu_cores"))
+        frame = frame.reset_index(drop=True)
         
         return frame
 
@@ -250,18 +268,18 @@ class KubernetesCollector(BaseCollector):
                                'timestamp', 'node'])
 
             logging.debug(
-                "frame_cpu_usageframe_cpu_usageframe_cpu_usage %s", result1)
+                "frame_cpu_usageframe_cpu_usageframe_cpu_usage %s", FrameSummary(result1))
 
             result = pd.merge(result1, frame_power_consumption,
                               on=['timestamp', 'node'])
 
             logging.debug(
-                "frame_power_consumptionframe_power_consumptionframe_power_consumption %s", result)
+                "frame_power_consumptionframe_power_consumptionframe_power_consumption %s", FrameSummary(result))
 
             result["pods-power-usage-sum"] = (
                 result["pods-cpu-sum"]/result["avg_cpu_user"])*result["avg_power_consumption"]
 
-            logging.debug("result pods-power-usage-sum %s", result)
+            logging.debug("result pods-power-usage-sum %s", FrameSummary(result))
 
             # funct_to_limits_dict = {}
             # for index, val in frame_pods_limits.iterrows():
@@ -341,7 +359,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "irate(container_file_descriptors{pod=~\".*.*\", namespace=~\".*openfaas-fn.*\"}[1m])"
+        query = "irate(container_file_descriptors{pod=~\".*.*\", namespace=~\".*openfaas-fn.*\"}[" + self.interval + "])"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-file-descp-sum", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -367,7 +385,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "sum(irate(container_fs_reads_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", namespace=~\".*openfaas-fn.*\"}[1m])) by (pod,node)"
+        query = "sum(irate(container_fs_reads_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", namespace=~\".*openfaas-fn.*\"}[" + self.interval + "])) by (pod,node)"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-iops-reads-sum", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -393,7 +411,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "sum(irate(container_fs_writes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", namespace=~\".*openfaas-fn.*\"}[1m])) by (pod,node)"
+        query = "sum(irate(container_fs_writes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", namespace=~\".*openfaas-fn.*\"}[" + self.interval + "])) by (pod,node)"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-iops-writes-sum", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -419,7 +437,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "sum(irate(container_network_transmit_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", namespace=~\".*openfaas-fn.*\"}[1m])) by (pod,node)"
+        query = "sum(irate(container_network_transmit_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", namespace=~\".*openfaas-fn.*\"}[" + self.interval + "])) by (pod,node)"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-network-transmit-bytes", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -446,7 +464,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "sum(irate(container_network_receive_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", namespace=~\".*openfaas-fn.*\"}[1m])) by (pod,node)"
+        query = "sum(irate(container_network_receive_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", namespace=~\".*openfaas-fn.*\"}[" + self.interval + "])) by (pod,node)"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-network-receive-bytes", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -473,7 +491,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "sum(irate(container_fs_writes_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", container!=\"\", pod=~\".*.*\", namespace=~\".*openfaas-fn.*\"}[1m])) by (pod,node)"
+        query = "sum(irate(container_fs_writes_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", container!=\"\", pod=~\".*.*\", namespace=~\".*openfaas-fn.*\"}[" + self.interval + "])) by (pod,node)"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-fs-write-bytes", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -500,7 +518,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "sum(irate(container_fs_reads_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", container!=\"\", pod=~\".*.*\", namespace=~\".*openfaas-fn.*\"}[1m])) by (pod,node)"
+        query = "sum(irate(container_fs_reads_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", container!=\"\", pod=~\".*.*\", namespace=~\".*openfaas-fn.*\"}[" + self.interval + "])) by (pod,node)"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-fs-read-bytes", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -528,7 +546,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - The result as Dataframe with the columns: 'timestamp', 'action' and 'invocations'
         """
-        query = 'irate(powerexporter_power_consumption_ampere_seconds_total{instance=~\".*.*\"}[1m]) '
+        query = 'irate(powerexporter_power_consumption_ampere_seconds_total{instance=~\".*.*\"}[' + self.interval + ']) '
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "avg_power_consumption", start, end, self.step)
         if len(frame.values) > 0:
             frame = frame.groupby(['timestamp'])[
@@ -551,7 +569,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - The result as Dataframe with the columns: 'timestamp', 'action' and 'invocations'
         """
-        query = 'irate(powerexporter_current_ampere{instance=~\".*.*\"}[1m]) '
+        query = 'irate(powerexporter_current_ampere{instance=~\".*.*\"}[' + self.interval + ']) '
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "avg_current_usage", start, end, self.step)
 
         if len(frame.values) > 0:
@@ -575,7 +593,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - The result as Dataframe with the columns: 'timestamp', 'action' and 'invocations'
         """
-        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"system\"}[1m]) '
+        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"system\"}[' + self.interval + ']) '
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "avg_cpu_system", start, end, self.step)
 
         if len(frame.values) > 0:
@@ -599,7 +617,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - The result as Dataframe with the columns: 'timestamp', 'action' and 'invocations'
         """
-        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"user\"}[1m]) '
+        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"user\"}[' + self.interval + ']) '
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "avg_cpu_user", start, end, self.step)
 
         if len(frame.values) > 0:
@@ -624,7 +642,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - The result as Dataframe with the columns: 'timestamp', 'action' and 'invocations'
         """
-        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"iowait\"}[1m]) '
+        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"iowait\"}[' + self.interval + ']) '
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "avg_cpu_iowait", start, end, self.step)
 
         if len(frame.values) > 0:
@@ -649,7 +667,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - The result as Dataframe with the columns: 'timestamp', 'action' and 'invocations'
         """
-        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"idle\"}[1m]) '
+        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"idle\"}[' + self.interval + ']) '
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "avg_cpu_idle", start, end, self.step)
         if len(frame.values) > 0:
             frame = frame.groupby(['timestamp'])[
@@ -675,7 +693,10 @@ class KubernetesCollector(BaseCollector):
         """
 
         query = 'node_memory_MemTotal_bytes{instance=~\".*.*\"}'
-        frame = await self.prom_obj.query_prometheus(query, measurement_category, "total_avg_mem_per_node", start, end, self.step)
+        frame = await self.static_cache.get(
+            "total_avg_mem_per_node",
+            lambda: self.prom_obj.query_prometheus_without_ts(query, measurement_category, "total_avg_mem_per_node"))
+        frame = self.static_cache.broadcast(frame.reset_index(drop=True), start, end, self.step)
 
         return frame
 
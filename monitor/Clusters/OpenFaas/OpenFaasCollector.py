@@ -1,37 +1,30 @@
 #!/usr/bin/env python
 from abc import abstractmethod
 import asyncio
-import traceback
-from typing import List, Tuple
 import pandas as pd
 from pandas import DataFrame
 import logging
-from logging.handlers import RotatingFileHandler
 from .KubernetesCollector import KubernetesCollector
 from .PrometheusCollector import PrometheusCollector
-from Clusters import BaseCollector
+from Clusters import BaseCollector, CycleDeadline
+from Observability import Metrics
 import sys
 import os
 sys.path.append(os.path.abspath('../'))
 
-logging.basicConfig(format='%(message)s', level=logging.DEBUG,
-                    handlers=[
-                        RotatingFileHandler("Logs/log.log", maxBytes=1e9, backupCount=2),
-                        logging.StreamHandler(sys.stdout)
-                        ]
-                    )
 
 logger = logging.getLogger(__name__)
 
 
 class OpenFaasCollector(BaseCollector):
     def __init__(self, of_prometheus_url: str = None, cluster_kube_prom_url: str = None, power_collection: bool = False,
-                 step: int=60, interval: str = "1m"):
+                 step: int=60, interval: str = "1m", cycle_deadline: float = 30.0):
         self.of_prom_obj = PrometheusCollector(of_prometheus_url)    
         self.step = step
         self.interval = interval
         self.cluster_kube_prom_obj = KubernetesCollector(cluster_kube_prom_url, self.step, self.interval)
         self.power_collection = power_collection
+        self.cycle_deadline = CycleDeadline(cycle_deadline)
 
 
     async def collect_average_execution_time(self, start: int, end: int, measurement_category: str) -> DataFrame:
@@ -168,9 +161,53 @@ class OpenFaasCollector(BaseCollector):
 
         return frame
 
-    async def collect(self, cluster_name: str, start: int, end: int) -> dict:
+    def get_metric_groups(self) -> dict:
+        """ Returns the collect functions of this cluster per metric group and measurement category.
+
+        Returns:
+            dict - group name -> {'function_usage': [collect functions], 'system_usage': [collect functions]}
+        """
+        kube = self.cluster_kube_prom_obj
+        metric_groups = {
+            "request": {
+                "function_usage": [self.collect_average_execution_time, self.collect_percentile,
+                                   self.collect_function_invocations, self.collect_500_errors,
+                                   self.collect_502_errors],
+                "system_usage": []
+            },
+            "pod_resources": {
+                "function_usage": [kube.collect_pods_cpu_sum, kube.collect_replicas, kube.collect_pods_mem_sum,
+                                   kube.collect_pod_cpu_requests, kube.collect_pod_cpu_limits,
+                                   kube.collect_pods_file_descp_sum, kube.collect_pods_fs_read_bytes,
+                                   kube.collect_pods_fs_write_bytes, kube.collect_pods_network_receive_bytes,
+                                   kube.collect_pods_network_trasmit_bytes],
+                "system_usage": []
+            },
+            "node": {
+                "function_usage": [],
+                "system_usage": [kube.collect_bytes_transmitted, kube.collect_nodes_avg_cpu_usage_system,
+                                 kube.collect_nodes_avg_cpu_usage_user, kube.collect_nodes_avg_cpu_usage_iowait,
+                                 kube.collect_nodes_avg_cpu_usage_idle, kube.collect_avg_total_memory,
+                                 kube.collect_memory_avg_usage, kube.collect_disk_written_bytes,
+                                 kube.collect_disk_read_iops, kube.collect_disk_write_iops]
+            },
+            "power": {
+                "function_usage": [],
+                "system_usage": [kube.collect_nodes_avg_power_consumption, kube.collect_nodes_avg_current_usage]
+            }
+        }
+        if self.power_collection:
+            metric_groups["power"]["function_usage"] = [kube.collect_pods_power_sum]
+            # pod iops are only collected on clusters with power collection
+            metric_groups["pod_resources"]["function_usage"] += [kube.collect_pods_iops_read_sum,
+                                                                 kube.collect_pods_iops_write_sum]
+        return metric_groups
+
+    async def collect(self, cluster_name: str, start: int, end: int, groups: tuple = None,
+                      deadline: float = None) -> dict:
         """ Collects function cold starts, invocations, initialization time and runtime for a Target
         from the configured prometheus instance.
+        Queries still running at the deadline are cancelled and counted as missed, the completed ones are returned.
 
         Args:
             cluster_name:
@@ -179,162 +216,59 @@ class OpenFaasCollector(BaseCollector):
                 Integer - A timestamp, where the query range should start
             end:
                 Integer - A timestamp, where the query range should end
+            groups:
+                Tuple, optional - metric groups to collect (see BaseCollector.metric_groups). Default: all
+            deadline:
+                Float, optional - seconds this cycle may take. Default: the budget of the CycleDeadline
 
         Returns:
             DataFrame - Query result as DataFrame - with columns: 'timestamp', 'target', 'action' and measurement fields(s)
         """
+        metric_groups = self.get_metric_groups()
+        if groups is None:
+            groups = metric_groups.keys()
+
+        # request metrics (invocations, latency) first, stragglers are cancelled at the deadline
+        jobs = self.build_cycle_jobs(metric_groups, groups, start, end)
+        results = await self.cycle_deadline.run(jobs, deadline)
 
-        # start each worker
-        
-        if self.power_collection: 
-            tasks_functions_usage: List[asyncio.Task] = [
-                asyncio.create_task(self.collect_average_execution_time(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.collect_percentile(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.collect_function_invocations(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.collect_500_errors(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.collect_502_errors(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_cpu_sum(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_power_sum(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pod_cpu_requests(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pod_cpu_limits(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_replicas(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_mem_sum(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_file_descp_sum(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_iops_read_sum(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_iops_write_sum(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_fs_read_bytes(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_fs_write_bytes(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_network_receive_bytes(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_network_trasmit_bytes(
-                    start, end, "function_usage"))
-            ]
-        else:
-            tasks_functions_usage: List[asyncio.Task] = [
-                asyncio.create_task(self.collect_average_execution_time(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.collect_percentile(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.collect_function_invocations(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.collect_500_errors(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.collect_502_errors(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_cpu_sum(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_replicas(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_mem_sum(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pod_cpu_requests(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pod_cpu_limits(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_file_descp_sum(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_fs_read_bytes(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_fs_write_bytes(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_network_receive_bytes(
-                    start, end, "function_usage")),
-                asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_network_trasmit_bytes(
-                    start, end, "function_usage"))
-            ]
-        # start each worker
-        tasks_system_usage: List[asyncio.Task] = [
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_bytes_transmitted(
-                start, end, "system_usage")),
-            # asyncio.create_task(self.collect_500_errors(start, end, step)),
-            asyncio.create_task(
-                self.cluster_kube_prom_obj.collect_nodes_avg_cpu_usage_system(start, end, "system_usage")),
-            asyncio.create_task(
-                self.cluster_kube_prom_obj.collect_nodes_avg_cpu_usage_user(start, end, "system_usage")),
-            asyncio.create_task(
-                self.cluster_kube_prom_obj.collect_nodes_avg_cpu_usage_iowait(start, end, "system_usage")),
-            asyncio.create_task(
-                self.cluster_kube_prom_obj.collect_nodes_avg_cpu_usage_idle(start, end, "system_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_avg_total_memory(
-                start, end, "system_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_memory_avg_usage(
-                start, end, "system_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_disk_written_bytes(
-                start, end, "system_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_disk_read_iops(
-                start, end, "system_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_disk_write_iops(
-                start, end, "system_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_nodes_avg_power_consumption(
-                start, end, "system_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_nodes_avg_current_usage(
-                start, end, "system_usage"))
-        ]
-
-        # wait for all workers
-        combined_frame_functions_usage = DataFrame()
+        frames_functions_usage = []
         combined_frame_systems_usage = DataFrame()
-        try:
-            # wait for max 45 seconds
-            for result in asyncio.as_completed(tasks_functions_usage, timeout=30.0):
-                frame = await result
-
-                if combined_frame_functions_usage.empty and len(frame.values)>0:
-                    combined_frame_functions_usage = frame
-                else:
-                    logging.debug("frame combined_frame_functions_usagecombined_frame_functions_usage, %s", frame)
-                    if len(frame.values)>0:
-                        combined_frame_functions_usage = pd.merge(combined_frame_functions_usage,
-                                                                frame, on=['timestamp', 'function_name'], how="outer")
-                logging.debug("after combined_frame_functions_usagecombined_frame_functions_usage, %s", combined_frame_functions_usage)
-                
-
-            # wait for max 45 seconds
-            for result in asyncio.as_completed(tasks_system_usage, timeout=30.0):
-                frame = await result
-
-                if combined_frame_systems_usage.empty:
+        with Metrics.stage_timer("merge"):
+            for job, frame in results:
+                if job.args[-1] == "function_usage":
+                    frames_functions_usage.append(frame)
+                elif combined_frame_systems_usage.empty:
                     combined_frame_systems_usage = frame
-                else:
-                    if len(frame.values)>0:
-                        combined_frame_systems_usage = pd.merge(combined_frame_systems_usage, frame,
-                                                                on=['timestamp'])
-
-            # combined_frame_functions_usage = self.postprocess_relative_to_invocations(combined_frame_functions_usage, '500_error_invocations')
-            # combined_frame_functions_usage = self.postprocess_relative_to_invocations(combined_frame_functions_usage, '502_error_invocations')
-            
-            # Divide by invocations & interpolate
-            # If no value exists -> just insert empty values
-            # combined_frame = self.postprocess_relative_to_invocations(combined_frame, 'inittime')
-            # combined_frame = self.postprocess_relative_to_invocations(combined_frame, 'runtime')
-
-        except Exception as e:
-            print("Exception when tyring to query data")
-            print(e)
-            traceback.print_exc()
+                elif len(frame.values) > 0:
+                    combined_frame_systems_usage = pd.merge(combined_frame_systems_usage, frame, on=['timestamp'])
+
+        # combined_frame_functions_usage = self.postprocess_relative_to_invocations(combined_frame_functions_usage, '500_error_invocations')
+        # combined_frame_functions_usage = self.postprocess_relative_to_invocations(combined_frame_functions_usage, '502_error_invocations')
+
+        # Divide by invocations & interpolate
+        # If no value exists -> just insert empty values
+        # combined_frame = self.postprocess_relative_to_invocations(combined_frame, 'inittime')
+        # combined_frame = self.postprocess_relative_to_invocations(combined_frame, 'runtime')
+
+        with Metrics.stage_timer("merge"):
+            combined_frame_functions_usage = self.merge_frames(frames_functions_usage, ['timestamp', 'function_name'])
 
         #print('combined_frame_systems_usage', combined_frame_systems_usage)
 
-        combined_frame_systems_usage = self.of_prom_obj.do_frame_postprocessing(combined_frame_systems_usage,
-                                                                                str(cluster_name), "system_usage")
-        combined_frame_functions_usage = self.of_prom_obj.do_frame_postprocessing(combined_frame_functions_usage,
-                                                                                  str(cluster_name), "function_usage")
+        with Metrics.stage_timer("postprocess"):
+            combined_frame_systems_usage = self.of_prom_obj.do_frame_postprocessing(combined_frame_systems_usage,
+                                                                                    str(cluster_name), "system_usage")
+            combined_frame_functions_usage = self.of_prom_obj.do_frame_postprocessing(combined_frame_functions_usage,
+                                                                                      str(cluster_name), "function_usage")
+
+        logging.debug("pod index stats %s", self.cluster_kube_prom_obj.pod_index.get_stats())
+        if self.cycle_deadline.missed:
+            logging.debug("missed queries %s", self.cycle_deadline.missed)
+        logging.debug("prometheus backends %s %s", self.of_prom_obj.backend_guard.get_stats(),
+                      self.cluster_kube_prom_obj.prom_obj.backend_guard.get_stats())
+        logging.debug("prometheus hedging %s %s", self.of_prom_obj.hedger.get_stats(),
+                      self.cluster_kube_prom_obj.prom_obj.hedger.get_stats())
 
         result_dict = {'functions_usage': combined_frame_functions_usage,
                        'system_usage': combined_frame_systems_usage}
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+import asyncio
+import logging
+import time
+import pandas as pd
+from pandas import DataFrame
+
+from .PrometheusCollector import PrometheusCollector
+
+logger = logging.getLogger(__name__)
+
+
+class PodIndex:
+    """ Maps pod names to OpenFaaS function names.
+    The index is built from kube-state-metrics (kube_pod_labels and kube_pod_info) instead of guessing the
+    function name from the pod name, so StatefulSet and Job pods are resolved correctly as well.
+    It is refreshed incrementally after `ttl` seconds and shared by all queries of a KubernetesCollector.
+    """
+
+    function_suffix = ".openfaas-fn"
+
+    def __init__(self, prom_obj: PrometheusCollector, namespace: str = ".*openfaas-fn.*", ttl: int = 300, full_resync_every: int = 10,
+                 retention: int = 900, miss_refresh_interval: int = 15):
+        """
+        Args:
+            prom_obj:
+                PrometheusCollector - the collector used to query kube-state-metrics
+            namespace:
+                String - regex for the namespaces holding the function pods
+            ttl:
+                Integer - seconds after which the index is refreshed
+            full_resync_every:
+                Integer - every n-th refresh re-reads all pods instead of only newly created ones
+            retention:
+                Integer - seconds a pod is kept after it has disappeared from kube-state-metrics
+            miss_refresh_interval:
+                Integer - minimal seconds between early refreshes triggered by unknown pods
+        """
+        self.prom_obj = prom_obj
+        self.namespace = namespace
+        self.ttl = ttl
+        self.full_resync_every = full_resync_every
+        self.retention = retention
+        self.miss_refresh_interval = miss_refresh_interval
+
+        # pod name -> function name, pod name -> last time seen in kube-state-metrics
+        self.pods = {}
+        self.last_seen = {}
+
+        # changes whenever pods are added or evicted, used to invalidate per-pod caches
+        self.version = 0
+
+        self.last_refresh = 0
+        self.refresh_count = 0
+        self.has_misses = False
+        self.lock = None
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0, "full_resyncs": 0, "evictions": 0}
+
+    @staticmethod
+    def function_name_from_labels(labels: dict) -> str:
+        """ Resolves the function name of a pod from its kube_pod_labels and kube_pod_info labels.
+        Args:
+            labels:
+                dict - merged label set of the pod
+
+        Returns:
+            String - function name with the '.openfaas-fn' suffix, or None if it cannot be resolved
+        """
+        if labels.get("label_faas_function"):
+            return labels["label_faas_function"] + PodIndex.function_suffix
+
+        owner_kind = labels.get("created_by_kind", "")
+        owner_name = labels.get("created_by_name", "")
+        if owner_name and owner_kind not in ("", "<none>"):
+            if owner_kind == "ReplicaSet":
+                # <deployment>-<pod template hash>
+                owner_name = owner_name.rsplit("-", 1)[0]
+            return owner_name + PodIndex.function_suffix
+
+        return None
+
+    def is_expired(self) -> bool:
+        now = time.time()
+        if now - self.last_refresh >= self.ttl:
+            return True
+        return self.has_misses and now - self.last_refresh >= self.miss_refresh_interval
+
+    async def refresh(self, force: bool = False) -> None:
+        """ Refreshes the index if the ttl is expired. Concurrent callers share a single refresh.
+        Args:
+            force:
+                Boolean - refresh regardless of the ttl
+        """
+        if not force and not self.is_expired():
+            return
+
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        async with self.lock:
+            # another query refreshed the index while we were waiting
+            if not force and not self.is_expired():
+                return
+            try:
+                await self.do_refresh()
+            except Exception as e:
+                logging.error("pod index refresh failed: %s", e)
+            # do not retry on every query when kube-state-metrics is unavailable
+            self.last_refresh = time.time()
+            self.has_misses = False
+
+    async def do_refresh(self) -> None:
+        now = time.time()
+        full_resync = self.refresh_count % self.full_resync_every == 0
+        selector = "namespace=~\"{}\"".format(self.namespace)
+
+        if full_resync:
+            label_query = "kube_pod_labels{%s}" % selector
+            info_query = "kube_pod_info{%s}" % selector
+        else:
+            # only pods created since the last refresh (with some slack for scrape delays)
+            created_filter = " and on(namespace, pod) (kube_pod_created{%s} > %d)" % (
+                selector, int(self.last_refresh - 2 * self.ttl))
+            label_query = "kube_pod_labels{%s}" % selector + created_filter
+            info_query = "kube_pod_info{%s}" % selector + created_filter
+
+        label_result, info_result = await asyncio.gather(self.prom_obj.query_prometheus_raw(label_query),
+                                                         self.prom_obj.query_prometheus_raw(info_query))
+
+        pod_labels = {}
+        for metric in label_result + info_result:
+            labels = metric["metric"]
+            if "pod" in labels:
+                pod_labels.setdefault(labels["pod"], {}).update(labels)
+
+        for pod, labels in pod_labels.items():
+            self.last_seen[pod] = now
+            function_name = self.function_name_from_labels(labels)
+            if function_name is not None and self.pods.get(pod) != function_name:
+                self.pods[pod] = function_name
+                self.version += 1
+
+        if full_resync:
+            stale = [pod for pod, seen in self.last_seen.items() if now - seen > self.retention]
+            for pod in stale:
+                del self.last_seen[pod]
+                self.pods.pop(pod, None)
+            if stale:
+                self.version += 1
+            self.stats["evictions"] += len(stale)
+            self.stats["full_resyncs"] += 1
+
+        self.refresh_count += 1
+        self.stats["refreshes"] += 1
+        logging.debug("pod index refreshed (full: %s), %s pods updated, stats: %s", full_resync, len(pod_labels),
+                      self.get_stats())
+
+    def map_function_names(self, frame: DataFrame, pod_field: str = "pod") -> DataFrame:
+        """ Adds the 'function_name' column to a frame holding a pod column.
+        The mapping is applied once per distinct pod (categorical), not once per row.
+        Pods missing in the index fall back to the name-based heuristic and trigger an early refresh.
+        Args:
+            frame:
+                DataFrame - frame with a pod column
+            pod_field:
+                String - name of the pod column
+
+        Returns:
+            DataFrame - the frame with 'function_name' set and the pod column removed
+        """
+        if frame.empty or pod_field not in frame.columns:
+            return frame
+
+        pods = frame[pod_field].astype("category")
+        categories = pods.cat.categories
+        known = categories.isin(list(self.pods.keys()))
+
+        mapped = [self.pods[pod] if is_known else PrometheusCollector.function_name_from_pod_name(pod)
+                  for pod, is_known in zip(categories, known)]
+        codes = pods.cat.codes.values
+        frame["function_name"] = pd.Index(mapped, dtype=object).take(codes).values
+
+        hits = int(known[codes].sum())
+        self.stats["hits"] += hits
+        self.stats["misses"] += len(frame) - hits
+        if not known[categories != "None"].all():
+            self.has_misses = True
+
+        return frame.drop(columns=[pod_field])
+
+    def get_stats(self) -> dict:
+        """ Returns the index size and hit rate. """
+        lookups = self.stats["hits"] + self.stats["misses"]
+        stats = dict(self.stats)
+        stats["size"] = len(self.pods)
+        stats["hit_rate"] = self.stats["hits"] / lookups if lookups > 0 else 0.0
+        return stats
@@ -1,18 +1,26 @@
 #!/usr/bin/env python
-from Clusters import BaseCollector
+from Clusters import BaseCollector, BackendGuard, BackendError, RequestHedger
 import logging
 from pandas import DataFrame
+import numpy as np
 import pandas as pd
 from aiohttp_requests import requests
 from abc import abstractmethod
+import json
+import time
+from Observability import Metrics, FrameSummary
 
-logging.basicConfig(filename='Logs/log.log',
-                    format='%(message)s', filemode='w', level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
 class PrometheusCollector(BaseCollector):
 
+    # measurement fields whose series are labelled by pod instead of by function
+    pod_measurement_fields = ('replicas', 'pods-cpu-sum', 'pods-mem-sum-bytes', 'pods-file-descp-sum',
+                              'pods-cpu-requests', 'pods-cpu-limits', 'pods-iops-reads-sum', 'pods-iops-writes-sum',
+                              'pods-network-transmit-bytes', 'pods-network-receive-bytes', 'pods-fs-write-bytes',
+                              'pods-fs-read-bytes')
+
     def __init__(self, prometheus_url: str):
         """ Collects usage data from the openwhisk cluster
         Args:
@@ -25,6 +33,13 @@ class PrometheusCollector(BaseCollector):
         self.query_base = "/api/v1/query_range?query="
         self.query_base_without_ts = "/api/v1/query?query="
 
+        # shared by all collectors querying this instance
+        self.backend_guard = BackendGuard.for_backend(prometheus_url)
+        self.hedger = RequestHedger.for_backend(prometheus_url)
+
+        # PodIndex used to map pods to functions, set by the KubernetesCollector
+        self.pod_index = None
+
     @staticmethod
     def parse_result_to_dataframe_without_ts(measurement_category: str, measurement_field_name: str, response,
                                   multiple_actions: bool = False,
@@ -60,9 +75,8 @@ class PrometheusCollector(BaseCollector):
                 frame = DataFrame(columns=[measurement_field_name])
                 frame.loc[0] = [metric['value'][1]]
 
-                frame["node"] = "test"
-                if "node" in metric["metric"]:
-                    frame["node"] = metric["metric"]["node"]
+                # the same node label as the range queries, so the static frames line up with the other node series
+                frame["node"] = metric["metric"].get("instance", "test")
                         
                 frame[measurement_field_name] = frame[measurement_field_name].apply(
                     lambda v: float(v))
@@ -76,10 +90,13 @@ class PrometheusCollector(BaseCollector):
             for metric in result:
                 new_frame = DataFrame(columns=[measurement_field_name])
                 new_frame.loc[0] = [metric['value'][1]]
-                if "pod" in metric['metric'].keys():
-                    fun_name_arr = metric['metric']["pod"].split("-")
-                    new_frame['function_name'] = '-'.join(
-                        fun_name_arr[:-2]) + '.openfaas-fn'
+                if measurement_field_name in PrometheusCollector.pod_measurement_fields:
+                    # resolved to 'function_name' by resolve_function_names
+                    new_frame['pod'] = metric['metric'].get("pod", "None")
+                elif 'function_name' in metric['metric'].keys():
+                    new_frame['function_name'] = metric['metric']['function_name']
+                elif 'faas_function' in metric['metric'].keys():
+                    new_frame['function_name'] = metric['metric']['faas_function']
                 else:
                     new_frame['function_name'] = "None"
 
@@ -116,74 +133,61 @@ class PrometheusCollector(BaseCollector):
         if len(result) == 0:
             return DataFrame()
 
-        frame = DataFrame()
+        # build the frame column-wise in one go instead of one DataFrame per series
+        timestamps = []
+        values = []
+        labels = {"node": []}
 
         if measurement_category == 'system_usage':
-            frames = []
-            if measurement_field_name == "avg_cpu_user":
-                logging.debug("avg_cpu_userssssssss %s", result)
-            for metric in result:
-                frame = DataFrame(metric['values'], columns=['timestamp', measurement_field_name])
-
-                frame["node"] = "test"
-                if "instance" in metric["metric"]:
-                    frame["node"] = metric["metric"]["instance"]
-                    
-                if "cpu" in metric["metric"]:
-                    frame["cpu"] = metric["metric"]["cpu"]
-                if "mode" in metric["metric"]:
-                    frame["mode"] = metric["metric"]["mode"]
-                                           
-                frame[measurement_field_name] = frame[measurement_field_name].apply(
-                    lambda v: float(v))
-                
-                frames.append(frame)
+            # cpu and mode are only kept if every series carries them
+            optional_labels = [label for label in ("cpu", "mode") if all(label in metric["metric"] for metric in result)]
+            for label in optional_labels:
+                labels[label] = []
 
-            frame = pd.concat(frames, join="inner")
-            if measurement_field_name == "avg_cpu_user":
-                logging.debug("avg_cpu_userssssssss sdsd %s", frame)
+            for metric in result:
+                series_timestamps, series_values = zip(*metric['values'])
+                timestamps.extend(series_timestamps)
+                values.extend(series_values)
+                length = len(series_timestamps)
+
+                labels["node"].extend([metric["metric"].get("instance", "test")] * length)
+                for label in optional_labels:
+                    labels[label].extend([metric["metric"][label]] * length)
         else:
-            frames = []
-
-            for metric in result:   
-                new_frame = DataFrame(metric['values'], columns=[
-                                      'timestamp', measurement_field_name])
-                new_frame["node"] = "test"
-                
-                if "node" in metric["metric"]:
-                    new_frame["node"] = metric["metric"]["node"]
-                if measurement_field_name == 'replicas' or measurement_field_name == 'pods-cpu-sum' or \
-                        measurement_field_name == 'pods-mem-sum-bytes' or measurement_field_name == 'pods-file-descp-sum' or \
-                        measurement_field_name == 'pods-cpu-requests' or measurement_field_name == 'pods-cpu-limits' or\
-                        measurement_field_name == 'pods-iops-reads-sum' or measurement_field_name == 'pods-iops-writes-sum' or\
-                        measurement_field_name == 'pods-network-transmit-bytes' or measurement_field_name == 'pods-network-receive-bytes' or \
-                        measurement_field_name == 'pods-fs-write-bytes' or measurement_field_name == 'pods-fs-read-bytes':
-                    if "pod" in metric['metric'].keys():
-                        fun_name_arr = metric['metric']["pod"].split("-")
-                        new_frame['function_name'] = '-'.join(
-                            fun_name_arr[:-2]) + '.openfaas-fn'
-                    else:
-                        new_frame['function_name'] = "None"
+            name_field = 'pod' if measurement_field_name in PrometheusCollector.pod_measurement_fields else 'function_name'
+            labels[name_field] = []
 
+            for metric in result:
+                series_timestamps, series_values = zip(*metric['values'])
+                timestamps.extend(series_timestamps)
+                values.extend(series_values)
+                length = len(series_timestamps)
+
+                labels["node"].extend([metric["metric"].get("node", "test")] * length)
+                if name_field == 'pod':
+                    # resolved to 'function_name' by resolve_function_names
+                    name = metric['metric'].get("pod", "None")
+                elif 'function_name' in metric['metric'].keys():
+                    name = metric['metric']['function_name']
+                elif 'faas_function' in metric['metric'].keys():
+                    name = metric['metric']['faas_function']
+                elif 'container' in metric['metric'].keys():
+                    name = metric['metric']['container']
                 else:
-                    if 'function_name' in metric['metric'].keys():
-                        new_frame['function_name'] = metric['metric']['function_name']
-                    elif 'faas_function' in metric['metric'].keys():
-                        new_frame['function_name'] = metric['metric']['faas_function']
-                    elif 'container' in metric['metric'].keys():
-                        new_frame['function_name'] = metric['metric']['container']
-                    else:
-                        new_frame['function_name'] = "System"
-
-                frames.append(new_frame)
+                    name = "System"
+                labels[name_field].extend([name] * length)
 
-            frame = pd.concat(frames, join="inner")
-
-        frame[measurement_field_name] = frame[measurement_field_name].apply(lambda v: float(v))
-        logging.debug("frame, %s", measurement_field_name)
-        logging.debug(frame)
+        frame = DataFrame({'timestamp': timestamps, measurement_field_name: np.asarray(values, dtype=float), **labels})
+        logging.debug("frame, %s %s", measurement_field_name, FrameSummary(frame))
         return frame
 
+    @staticmethod
+    def function_name_from_pod_name(pod: str) -> str:
+        """ Derives the function name from a Deployment pod name (<function>-<replicaset hash>-<pod hash>). """
+        if pod == "None":
+            return pod
+        return '-'.join(pod.split("-")[:-2]) + '.openfaas-fn'
+
     @staticmethod
     def change_function_name(name):
         end = ".openfaas-fn"
@@ -195,7 +199,6 @@ class PrometheusCollector(BaseCollector):
         """ Performs postprocessing on dataframes.
         These are:
             - apply the target name
-            - fill N/A values with 0
             - set timestamp as index
             - set the measurement_category (e.g. system resource, function usage)
         Args:
@@ -225,8 +228,9 @@ class PrometheusCollector(BaseCollector):
                 # frame.fillna(0, inplace=True)
             else:
                 frame = frame[frame.function_name != 'None'].copy()
-                frame['function_name'] = frame.apply(lambda x: PrometheusCollector.change_function_name(x['function_name']),
-                                                    axis=1)
+                # rename once per distinct function instead of once per row
+                frame['function_name'] = frame['function_name'].astype('category').map(
+                    PrometheusCollector.change_function_name).astype(object)
                 if "timestamp" in frame.columns:
                     frame.reset_index(inplace=True, drop=True)
                 #frame.drop_duplicates(subset=['timestamp', 'function_name'], keep='first', inplace=True)
@@ -235,7 +239,7 @@ class PrometheusCollector(BaseCollector):
                 frame.index = pd.to_datetime(frame.index, unit='s')
                 frame['cluster_name'] = target_name
                 frame['measurement_category'] = measurement_category
-                frame.fillna(0, inplace=True)
+                # missing values stay NaN and are omitted by the sinks instead of being written as 0
 
             return frame
         else:
@@ -269,13 +273,15 @@ class PrometheusCollector(BaseCollector):
         """
         url = self.prometheus_url + self.query_base_without_ts + query
 
-        prometheus_request = await requests.get(url)
+        response = await self.request_prometheus(url, self.query_base_without_ts + query)
 
         # get result and parse
-        if prometheus_request.status == 200:
-            response = await prometheus_request.json()
-            return self.parse_result_to_dataframe_without_ts(measurement_category, measurement_field_name, response,
-                                                  multiple_actions, action_field)
+        if response is not None:
+            with Metrics.stage_timer("parse"):
+                frame = self.parse_result_to_dataframe_without_ts(measurement_category, measurement_field_name, response,
+                                                                  multiple_actions, action_field)
+            Metrics.observe_result(len(response['data']['result']), len(frame))
+            return await self.resolve_function_names(frame)
 
         return DataFrame()
     
@@ -312,15 +318,86 @@ class PrometheusCollector(BaseCollector):
         logging.debug("measurement_field_name url %s", url)
 
 
-        prometheus_request = await requests.get(url)
+        response = await self.request_prometheus(url, self.query_base + query)
         # get result and parse
-        if prometheus_request.status == 200:
-            response = await prometheus_request.json()
-            return self.parse_result_to_dataframe(measurement_category, measurement_field_name, response,
-                                                  multiple_actions, action_field)
+        if response is not None:
+            with Metrics.stage_timer("parse"):
+                frame = self.parse_result_to_dataframe(measurement_category, measurement_field_name, response,
+                                                       multiple_actions, action_field)
+            Metrics.observe_result(len(response['data']['result']), len(frame))
+            return await self.resolve_function_names(frame)
 
         return DataFrame()
 
+    async def query_prometheus_raw(self, query: str) -> list:
+        """ Runs an instant query against the configured Prometheus instance.
+        Args:
+            query:
+                String - The query that should be executed
+
+        Returns:
+            list - the 'result' part of the prometheus response (empty if the query was rejected)
+        """
+        url = self.prometheus_url + self.query_base_without_ts + query
+
+        response = await self.request_prometheus(url, self.query_base_without_ts + query)
+        if response is not None:
+            return response['data']['result']
+
+        return []
+
+    async def request_prometheus(self, url: str, query: str) -> dict:
+        """ Sends a request to the Prometheus instance, hedging it if it is slower than usual for the query.
+        Each request goes through the BackendGuard (concurrency limit, circuit breaker) of its instance.
+        Args:
+            url:
+                String - the query url
+            query:
+                String - the query without the time range, latencies are tracked per query
+
+        Returns:
+            dict - the json response, None if Prometheus rejected the query
+        """
+        return await self.hedger.run(query, self.fetch_json_guarded, url)
+
+    @staticmethod
+    async def fetch_json_guarded(base_url: str, url: str) -> dict:
+        return await BackendGuard.for_backend(base_url).call(PrometheusCollector.fetch_json, url)
+
+    @staticmethod
+    async def fetch_json(url: str) -> dict:
+        started = time.perf_counter()
+        prometheus_request = await requests.get(url)
+        # an overloaded or unavailable Prometheus counts as failure of the backend
+        if prometheus_request.status >= 500 or prometheus_request.status == 429:
+            raise BackendError("prometheus returned status {}".format(prometheus_request.status))
+        if prometheus_request.status != 200:
+            return None
+        body = await prometheus_request.read()
+        Metrics.observe_query(time.perf_counter() - started, len(body))
+        return json.loads(body)
+
+    async def resolve_function_names(self, frame: DataFrame) -> DataFrame:
+        """ Replaces the 'pod' column of a parsed frame with the 'function_name' of the pod.
+        Uses the PodIndex if one is configured, otherwise the function name is derived from the pod name.
+        Args:
+            frame:
+                DataFrame - frame returned by parse_result_to_dataframe
+
+        Returns:
+            DataFrame - the frame with a 'function_name' instead of a 'pod' column
+        """
+        if frame.empty or 'pod' not in frame.columns:
+            return frame
+
+        if self.pod_index is not None:
+            await self.pod_index.refresh()
+            return self.pod_index.map_function_names(frame)
+
+        frame['function_name'] = frame['pod'].astype('category').map(
+            PrometheusCollector.function_name_from_pod_name).astype(object)
+        return frame.drop(columns=['pod'])
+
     @abstractmethod
     async def collect(self, config_object: object, cluster_name: str, start: int, end: int) -> DataFrame:
         """ Collects one or more measurements for a Target from the configured Prometheus instance.
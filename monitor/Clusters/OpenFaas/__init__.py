@@ -1,3 +1,4 @@
 from .OpenFaasCollector import OpenFaasCollector
 from .PrometheusCollector import PrometheusCollector
-from .KubernetesCollector import KubernetesCollector
\ No newline at end of file
+from .KubernetesCollector import KubernetesCollector
+from .PodIndex import PodIndex
@@ -3,18 +3,50 @@ from Clusters import BaseCollector
 import logging
 from pandas import DataFrame
 from .PrometheusCollector import PrometheusCollector
+from Clusters import StaticMetricCache
 from abc import abstractmethod
-logging.basicConfig(filename='Logs/log.log',
-                    format='%(message)s', filemode='w', level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
 class KubernetesCollector(BaseCollector):
 
-    def __init__(self, prometheus_url: str, step: int, interval: str):
+    def __init__(self, prometheus_url: str, step: int, interval: str, static_metrics_ttl: int = 600):
         self.prom_obj = PrometheusCollector(prometheus_url)
         self.step = step
         self.interval = interval
+        # requests, limits and total memory only change on deploys or node changes
+        self.static_cache = StaticMetricCache(static_metrics_ttl)
+
+    async def collect_static_pod_metric(self, query: str, start: int, end: int, measurement_category: str,
+                                        measurement_field_name: str) -> DataFrame:
+        """ Returns a cached static per-function metric broadcast over the timestamps of [start, end].
+        Args:
+            query:
+                String - instant query, grouped by pod
+            start:
+                Integer - timestamp of start
+            end:
+                Integer - timestamp of end
+            measurement_category:
+                String - measurement_category
+            measurement_field_name:
+                String - Name of the measurement field
+        Returns:
+            DataFrame - a Pandas Dataframe with the result.
+        """
+        async def fetch() -> DataFrame:
+            frame = await self.prom_obj.query_prometheus_without_ts(query, measurement_category,
+                                                                    measurement_field_name, True, "pod")
+            if len(frame.values) > 0:
+                frame = frame.groupby(['function_name'])[measurement_field_name].mean().reset_index()
+            return frame
+
+        frame = await self.static_cache.get(measurement_field_name, fetch)
+        frame = self.static_cache.broadcast(frame, start, end, self.step)
+        if len(frame.values) > 0:
+            frame = frame[["timestamp", "function_name", measurement_field_name]]
+            frame.set_index("timestamp", inplace=True)
+        return frame
 
     async def collect_replicas(self, start: int, end: int, measurement_category: str) -> DataFrame:
         """ Collects the amount of active replicas per function.
@@ -79,17 +111,8 @@ class KubernetesCollector(BaseCollector):
         """
         query = "sum(kube_pod_container_resource_requests{pod=~\".*guest.*\", container=~\".*user-action.*\", resource=~\"cpu\"}) by (pod,node)"
         logging.debug("collect_pod_cpu_requests query %s", query)
-        
-        frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-cpu-requests", start, end, self.step, True,
-                                                     "pod")
-        if len(frame.values)>0:
-            frame = frame.groupby(['timestamp', 'function_name'])[
-                'pods-cpu-requests'].mean().reset_index()
-            frame.reset_index(inplace=True, drop=True)
-            frame = frame[["timestamp","function_name", "pods-cpu-requests"]]
-            frame.set_index("timestamp", inplace=True)
 
-        return frame
+        return await self.collect_static_pod_metric(query, start, end, measurement_category, "pods-cpu-requests")
     
     async def collect_pod_cpu_limits(self, start: int, end: int, measurement_category: str) -> DataFrame:
         """ Collects the amount of active replicas per function.
@@ -105,16 +128,8 @@ class KubernetesCollector(BaseCollector):
         """
         query = "sum(kube_pod_container_resource_limits{pod=~\".*guest.*\", container=~\".*user-action.*\", resource=~\"cpu\"}) by (pod,node)"
         logging.debug("kube_pod_container_resource_limits query %s", query)
-        frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-cpu-limits", start, end, self.step, True,
-                                                     "pod")
-        if len(frame.values)>0:
-            frame = frame.groupby(['timestamp', 'function_name'])[
-                'pods-cpu-limits'].mean().reset_index()
-            frame.reset_index(inplace=True, drop=True)
-            frame = frame[["timestamp","function_name", "pods-cpu-limits"]]
-            frame.set_index("timestamp", inplace=True)
 
-        return frame
+        return await self.collect_static_pod_metric(query, start, end, measurement_category, "pods-cpu-limits")
 
    
     async def collect_pods_mem_sum(self, start: int, end: int, measurement_category: str) -> DataFrame:
@@ -153,7 +168,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "irate(container_file_descriptors{pod=~\".*guest.*\", container=~\".*user-action.*\"}[1m])"
+        query = "irate(container_file_descriptors{pod=~\".*guest.*\", container=~\".*user-action.*\"}[" + self.interval + "])"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-file-descp-sum", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -177,7 +192,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "sum(irate(container_fs_reads_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", pod=~\".*guest.*\"}[1m])) by (pod,node)"
+        query = "sum(irate(container_fs_reads_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", pod=~\".*guest.*\"}[" + self.interval + "])) by (pod,node)"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-iops-reads-sum", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -203,7 +218,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "sum(irate(container_fs_writes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", pod=~\".*guest.*\"}[1m])) by (pod,node)"
+        query = "sum(irate(container_fs_writes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", pod=~\".*guest.*\"}[" + self.interval + "])) by (pod,node)"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-iops-writes-sum", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -229,7 +244,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "sum(irate(container_network_transmit_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", pod=~\".*guest.*\"}[1m])) by (pod,node)"
+        query = "sum(irate(container_network_transmit_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", pod=~\".*guest.*\"}[" + self.interval + "])) by (pod,node)"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-network-transmit-bytes", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -254,7 +269,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "sum(irate(container_network_receive_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", pod=~\".*guest.*\"}[1m])) by (pod,node)"
+        query = "sum(irate(container_network_receive_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", pod=~\".*guest.*\"}[" + self.interval + "])) by (pod,node)"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-network-receive-bytes", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -279,7 +294,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "sum(irate(container_fs_writes_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", pod=~\".*guest.*\", container=~\".*user-action.*\"}[1m])) by (pod,node)"
+        query = "sum(irate(container_fs_writes_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", pod=~\".*guest.*\", container=~\".*user-action.*\"}[" + self.interval + "])) by (pod,node)"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-fs-write-bytes", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -304,7 +319,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - a Pandas Dataframe with the result.
         """
-        query = "sum(irate(container_fs_reads_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", pod=~\".*guest.*\", container=~\".*user-action.*\"}[1m])) by (pod,node)"
+        query = "sum(irate(container_fs_reads_bytes_total{job=~\"kubelet\", metrics_path=~\"/metrics/cadvisor\", pod=~\".*guest.*\", container=~\".*user-action.*\"}[" + self.interval + "])) by (pod,node)"
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "pods-fs-read-bytes", start, end, self.step,
                                                      True,
                                                      "pod")
@@ -331,7 +346,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - The result as Dataframe with the columns: 'timestamp', 'action' and 'invocations'
         """
-        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"system\"}[1m]) '
+        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"system\"}[' + self.interval + ']) '
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "avg_cpu_system", start, end, self.step)
 
         if len(frame.values)>0:
@@ -355,7 +370,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - The result as Dataframe with the columns: 'timestamp', 'action' and 'invocations'
         """
-        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"user\"}[1m]) '
+        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"user\"}[' + self.interval + ']) '
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "avg_cpu_user", start, end, self.step)
 
         if len(frame.values)>0:
@@ -380,7 +395,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - The result as Dataframe with the columns: 'timestamp', 'action' and 'invocations'
         """
-        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"iowait\"}[1m]) '
+        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"iowait\"}[' + self.interval + ']) '
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "avg_cpu_iowait", start, end, self.step)
 
         if len(frame.values)>0:
@@ -405,7 +420,7 @@ class KubernetesCollector(BaseCollector):
         Returns:
             DataFrame - The result as Dataframe with the columns: 'timestamp', 'action' and 'invocations'
         """
-        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"idle\"}[1m]) '
+        query = 'irate(node_cpu_seconds_total{instance=~\".*.*\", mode=\"idle\"}[' + self.interval + ']) '
         frame = await self.prom_obj.query_prometheus(query, measurement_category, "avg_cpu_idle", start, end, self.step)
         if len(frame.values)>0:
             frame = frame.groupby(['timestamp'])[
@@ -431,7 +446,10 @@ class KubernetesCollector(BaseCollector):
         """
 
         query = 'node_memory_MemTotal_bytes{instance=~\".*.*\"}'
-        frame = await self.prom_obj.query_prometheus(query, measurement_category, "total_avg_mem_per_node", start, end, self.step)
+        frame = await self.static_cache.get(
+            "total_avg_mem_per_node",
+            lambda: self.prom_obj.query_prometheus_without_ts(query, measurement_category, "total_avg_mem_per_node"))
+        frame = self.static_cache.broadcast(frame.reset_index(drop=True), start, end, self.step)
 
         return frame
 
@@ -5,9 +5,10 @@ sys.path.append(os.path.abspath('../'))
 from Clusters import BaseCollector
 from .PrometheusCollector import PrometheusCollector
 from .KubernetesCollector import KubernetesCollector
+from Clusters import StaticMetricCache, CycleDeadline
+from Observability import Metrics
 import logging
 
-logging.basicConfig(filename='Logs/log.log', format='%(message)s', filemode='w', level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 from pandas import DataFrame
@@ -20,12 +21,15 @@ from abc import abstractmethod
 
 class OpenWhiskCollector(BaseCollector):
     def __init__(self, ow_prometheus_url: str = None, kubernetes_prom_url: str = None, power_collection: bool = False,
-                 step: int=60, interval: str = "1m"):
+                 step: int=60, interval: str = "1m", cycle_deadline: float = 30.0):
         self.ow_prom_obj = PrometheusCollector(ow_prometheus_url)
         self.step = step
         self.interval = interval
         self.cluster_kube_prom_obj = KubernetesCollector(kubernetes_prom_url, self.step, self.interval)
         self.power_collection = power_collection
+        # the configured action memory only changes when an action is updated
+        self.static_cache = StaticMetricCache()
+        self.cycle_deadline = CycleDeadline(cycle_deadline)
 
 
     async def collect_cold_starts(self, start: int, end: int, measurement_category: str) -> DataFrame:
@@ -89,14 +93,18 @@ class OpenWhiskCollector(BaseCollector):
         """
 
         query = "openwhisk_action_memory"
-        frame = await self.ow_prom_obj.query_prometheus(query, measurement_category, "pod-mem-limits", start, end, self.step, True)
+
+        async def fetch() -> DataFrame:
+            frame = await self.ow_prom_obj.query_prometheus_without_ts(query, measurement_category, "pod-mem-limits", True)
+            if len(frame.values) > 0:
+                frame = frame.groupby(['function_name'])['pod-mem-limits'].mean().reset_index()
+                frame["pod-mem-limits"] = frame["pod-mem-limits"]*1024*1024
+            return frame
+
+        frame = await self.static_cache.get("pod-mem-limits", fetch)
+        frame = self.static_cache.broadcast(frame, start, end, self.step)
         if len(frame.values)>0:
-            frame = frame.groupby(['timestamp', 'function_name'])[
-                'pod-mem-limits'].mean().reset_index()
-            
-            frame.reset_index(inplace=True, drop=True)
             frame = frame[["timestamp","function_name", "pod-mem-limits"]]
-            frame["pod-mem-limits"] = frame["pod-mem-limits"]*1024*1024
             frame.set_index("timestamp", inplace=True)
             
         return frame
@@ -194,134 +202,104 @@ class OpenWhiskCollector(BaseCollector):
 
         return frame
 
-    async def collect(self, cluster_name: str, start: int, end: int) -> DataFrame:
+    def get_metric_groups(self) -> dict:
+        """ Returns the collect functions of this cluster per metric group and measurement category.
+
+        Returns:
+            dict - group name -> {'function_usage': [collect functions], 'system_usage': [collect functions]}
+        """
+        kube = self.cluster_kube_prom_obj
+        return {
+            "request": {
+                "function_usage": [self.collect_cold_starts, self.collect_function_runtimes,
+                                   self.collect_function_invocations, self.collect_function_initialization_times,
+                                   self.collect_function_wait_times],
+                "system_usage": []
+            },
+            "pod_resources": {
+                "function_usage": [self.collect_function_memory, kube.collect_replicas, kube.collect_pods_cpu_sum,
+                                   kube.collect_pod_cpu_requests, kube.collect_pod_cpu_limits,
+                                   kube.collect_pods_mem_sum, kube.collect_pods_file_descp_sum,
+                                   kube.collect_pods_fs_read_bytes, kube.collect_pods_fs_write_bytes,
+                                   kube.collect_pods_iops_read_sum, kube.collect_pods_iops_write_sum,
+                                   kube.collect_pods_network_receive_bytes, kube.collect_pods_network_trasmit_bytes],
+                "system_usage": []
+            },
+            "node": {
+                "function_usage": [],
+                "system_usage": [kube.collect_bytes_transmitted, kube.collect_nodes_avg_cpu_usage_system,
+                                 kube.collect_nodes_avg_cpu_usage_user, kube.collect_nodes_avg_cpu_usage_iowait,
+                                 kube.collect_nodes_avg_cpu_usage_idle, kube.collect_avg_total_memory,
+                                 kube.collect_memory_avg_usage, kube.collect_disk_written_bytes,
+                                 kube.collect_disk_read_iops, kube.collect_disk_write_iops]
+            }
+        }
+
+    async def collect(self, cluster_name: str, start: int, end: int, groups: tuple = None,
+                      deadline: float = None) -> DataFrame:
         """ Collects function cold starts, invocations, initialization time and runtime for a Target from the configured prometheus instance.
+        Queries still running at the deadline are cancelled and counted as missed, the completed ones are returned.
 
         Args:
-            config_object:
-                Object - The Target, for which the prometheus should be queried
+            cluster_name:
+                String - Name of cluster
             start:
                 Integer - A timestamp, where the query range should start
             end:
                 Integer - A timestamp, where the query range should end
+            groups:
+                Tuple, optional - metric groups to collect (see BaseCollector.metric_groups). Default: all
+            deadline:
+                Float, optional - seconds this cycle may take. Default: the budget of the CycleDeadline
 
         Returns:
             DataFrame - Query result as DataFrame - with columns: 'timestamp', 'target', 'action' and measurement fields(s)
         """
-        
-        # start each worker
-        tasks_functions_usage: List[asyncio.Task] = [
-            asyncio.create_task(self.collect_cold_starts(
-                start, end, "function_usage")),
-            asyncio.create_task(self.collect_function_runtimes(
-                start, end, "function_usage")),
-            asyncio.create_task(self.collect_function_invocations(
-                start, end, "function_usage")),
-            asyncio.create_task(self.collect_function_initialization_times(
-                start, end, "function_usage")),
-            asyncio.create_task(self.collect_function_wait_times(
-                start, end, "function_usage")),
-            asyncio.create_task(self.collect_function_memory(
-                start, end, "function_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_replicas(
-                start, end, "function_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_cpu_sum(
-                start, end, "function_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_pod_cpu_requests(
-                start, end, "function_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_pod_cpu_limits(
-                start, end, "function_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_mem_sum(
-                start, end, "function_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_file_descp_sum(
-                start, end, "function_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_fs_read_bytes(
-                start, end, "function_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_fs_write_bytes(
-                start, end, "function_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_iops_read_sum(
-                start, end, "function_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_iops_write_sum(
-                start, end, "function_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_network_receive_bytes(
-                start, end, "function_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_pods_network_trasmit_bytes(
-                start, end, "function_usage"))
-        ]
-
-        # start each worker
-        tasks_system_usage: List[asyncio.Task] = [
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_bytes_transmitted(
-                start, end, "system_usage")),
-            # asyncio.create_task(self.collect_500_errors(start, end, self.step)),
-            asyncio.create_task(
-                self.cluster_kube_prom_obj.collect_nodes_avg_cpu_usage_system(start, end, "system_usage")),
-            asyncio.create_task(
-                self.cluster_kube_prom_obj.collect_nodes_avg_cpu_usage_user(start, end, "system_usage")),
-            asyncio.create_task(
-                self.cluster_kube_prom_obj.collect_nodes_avg_cpu_usage_iowait(start, end, "system_usage")),
-            asyncio.create_task(
-                self.cluster_kube_prom_obj.collect_nodes_avg_cpu_usage_idle(start, end, "system_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_avg_total_memory(
-                start, end, "system_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_memory_avg_usage(
-                start, end, "system_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_disk_written_bytes(
-                start, end, "system_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_disk_read_iops(
-                start, end, "system_usage")),
-            asyncio.create_task(self.cluster_kube_prom_obj.collect_disk_write_iops(
-                start, end, "system_usage"))
-        ]
-
-        # wait for all workers
-        combined_frame_functions_usage = DataFrame()
+        metric_groups = self.get_metric_groups()
+        if groups is None:
+            groups = metric_groups.keys()
+
+        # request metrics (invocations, latency) first, stragglers are cancelled at the deadline
+        jobs = self.build_cycle_jobs(metric_groups, groups, start, end)
+        results = await self.cycle_deadline.run(jobs, deadline)
+
+        frames_functions_usage = []
         combined_frame_systems_usage = DataFrame()
-        try:
-            # wait for max 45 seconds
-            for result in asyncio.as_completed(tasks_functions_usage, timeout=30.0):
-                frame = await result
-
-                if combined_frame_functions_usage.empty and len(frame.values)>0:
-                    combined_frame_functions_usage = frame
-                else:
-                    logging.debug("frame combined_frame_functions_usagecombined_frame_functions_usage, %s", frame)
-                    if len(frame.values)>0:
-                        combined_frame_functions_usage = pd.merge(combined_frame_functions_usage,
-                                                                frame, on=['timestamp', 'function_name'], how="outer")
-                        
-                logging.debug("after combined_frame_functions_usagecombined_frame_functions_usage, %s", combined_frame_functions_usage)
-            # wait for max 45 seconds
-            for result in asyncio.as_completed(tasks_system_usage, timeout=30.0):
-                frame = await result
-
-                if combined_frame_systems_usage.empty:
+        with Metrics.stage_timer("merge"):
+            for job, frame in results:
+                if job.args[-1] == "function_usage":
+                    frames_functions_usage.append(frame)
+                elif combined_frame_systems_usage.empty:
                     combined_frame_systems_usage = frame
-                else:
-                    if len(frame.values)>0:
-                        combined_frame_systems_usage = pd.merge(combined_frame_systems_usage, frame, 
-                                                                on=['timestamp'])
-            # Divide by invocations & interpolate
-            # If no value exists -> just insert empty values
-            # combined_frame_functions_usage = self.postprocess_relative_to_invocations(combined_frame_functions_usage, 'init_time')
-            # combined_frame_functions_usage = self.postprocess_relative_to_invocations(combined_frame_functions_usage, 'wait_time')
-            # combined_frame_functions_usage = self.postprocess_relative_to_invocations(combined_frame_functions_usage, 'average_execution_time')
-        
-            # combined_frame = self.postprocess_relative_to_invocations(combined_frame, 'inittime')
-            # combined_frame = self.postprocess_relative_to_invocations(combined_frame, 'runtime')
-
-        except Exception as e:
-            print("Exception when tyring to query data")
-            print(e)
-            traceback.print_exc()
+                elif len(frame.values) > 0:
+                    combined_frame_systems_usage = pd.merge(combined_frame_systems_usage, frame, on=['timestamp'])
+
+        # Divide by invocations & interpolate
+        # If no value exists -> just insert empty values
+        # combined_frame_functions_usage = self.postprocess_relative_to_invocations(combined_frame_functions_usage, 'init_time')
+        # combined_frame_functions_usage = self.postprocess_relative_to_invocations(combined_frame_functions_usage, 'wait_time')
+        # combined_frame_functions_usage = self.postprocess_relative_to_invocations(combined_frame_functions_usage, 'average_execution_time')
+
+        # combined_frame = self.postprocess_relative_to_invocations(combined_frame, 'inittime')
+        # combined_frame = self.postprocess_relative_to_invocations(combined_frame, 'runtime')
+
+        with Metrics.stage_timer("merge"):
+            combined_frame_functions_usage = self.merge_frames(frames_functions_usage, ['timestamp', 'function_name'])
 
         #print('combined_frame_systems_usage', combined_frame_systems_usage)
 
-        combined_frame_systems_usage = self.ow_prom_obj.do_frame_postprocessing(combined_frame_systems_usage,
-                                                                                str(cluster_name), "system_usage")
-        combined_frame_functions_usage = self.ow_prom_obj.do_frame_postprocessing(combined_frame_functions_usage,
-                                                                                  str(cluster_name), "function_usage")
-            
+        with Metrics.stage_timer("postprocess"):
+            combined_frame_systems_usage = self.ow_prom_obj.do_frame_postprocessing(combined_frame_systems_usage,
+                                                                                    str(cluster_name), "system_usage")
+            combined_frame_functions_usage = self.ow_prom_obj.do_frame_postprocessing(combined_frame_functions_usage,
+                                                                                      str(cluster_name), "function_usage")
+        if self.cycle_deadline.missed:
+            logging.debug("missed queries %s", self.cycle_deadline.missed)
+        logging.debug("prometheus backends %s %s", self.ow_prom_obj.backend_guard.get_stats(),
+                      self.cluster_kube_prom_obj.prom_obj.backend_guard.get_stats())
+        logging.debug("prometheus hedging %s %s", self.ow_prom_obj.hedger.get_stats(),
+                      self.cluster_kube_prom_obj.prom_obj.hedger.get_stats())
+
         result_dict = {'functions_usage': combined_frame_functions_usage,
                        'system_usage': combined_frame_systems_usage}
 
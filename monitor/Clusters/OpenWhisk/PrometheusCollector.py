@@ -1,13 +1,15 @@
 #!/usr/bin/env python
 from abc import abstractmethod
+import json
+import time
+from Observability import Metrics, FrameSummary
 from aiohttp_requests import requests
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
-from Clusters import BaseCollector
+from Clusters import BaseCollector, BackendGuard, BackendError, RequestHedger
 import logging
 
-logging.basicConfig(filename='Logs/log.log',
-                    format='%(message)s', filemode='w', level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
@@ -24,6 +26,10 @@ class PrometheusCollector(BaseCollector):
 
         self.query_base = "/api/v1/query_range?query="
         self.query_base_without_ts = "/api/v1/query?query="
+
+        # shared by all collectors querying this instance
+        self.backend_guard = BackendGuard.for_backend(prometheus_url)
+        self.hedger = RequestHedger.for_backend(prometheus_url)
         
     @staticmethod
     def parse_result_to_dataframe_without_ts(measurement_category: str, measurement_field_name: str, response,
@@ -60,9 +66,8 @@ class PrometheusCollector(BaseCollector):
                 frame = DataFrame(columns=[measurement_field_name])
                 frame.loc[0] = [metric['value'][1]]
 
-                frame["node"] = "test"
-                if "node" in metric["metric"]:
-                    frame["node"] = metric["metric"]["node"]
+                # the same node label as the range queries, so the static frames line up with the other node series
+                frame["node"] = metric["metric"].get("instance", "test")
                         
                 frame[measurement_field_name] = frame[measurement_field_name].apply(
                     lambda v: float(v))
@@ -76,10 +81,14 @@ class PrometheusCollector(BaseCollector):
             for metric in result:
                 new_frame = DataFrame(columns=[measurement_field_name])
                 new_frame.loc[0] = [metric['value'][1]]
-                if "pod" in metric['metric'].keys():
-                    fun_name_arr = metric['metric']["pod"].split("-")
-                    new_frame['function_name'] = '-'.join(
-                        fun_name_arr[:-2]) + '.openfaas-fn'
+                if action_field == "pod":
+                    if "pod" in metric['metric'].keys():
+                        fun_name_arr = metric['metric']["pod"].split("-guest-")
+                        new_frame['function_name'] = fun_name_arr[-1].replace('-', '')
+                    else:
+                        new_frame['function_name'] = "None"
+                elif action_field in metric['metric'].keys():
+                    new_frame['function_name'] = metric['metric'][action_field].replace('-', '')
                 else:
                     new_frame['function_name'] = "None"
 
@@ -116,70 +125,50 @@ class PrometheusCollector(BaseCollector):
         if len(result) == 0:
             return DataFrame()
 
-        frame = DataFrame()
-        
-        if measurement_category == 'system_usage':
-            frames = []
-            for metric in result:
-                frame = DataFrame(metric['values'], columns=['timestamp', measurement_field_name])
+        # build the frame column-wise in one go instead of one DataFrame per series
+        timestamps = []
+        values = []
+        nodes = []
+        function_names = []
 
-                frame["node"] = "test"
-                if "instance" in metric["metric"]:
-                    frame["node"] = metric["metric"]["instance"]
-                        
-                frame[measurement_field_name] = frame[measurement_field_name].apply(
-                    lambda v: float(v))
-                
-                frames.append(frame)
+        for metric in result:
+            series_timestamps, series_values = zip(*metric['values'])
+            timestamps.extend(series_timestamps)
+            values.extend(series_values)
+            length = len(series_timestamps)
 
-            frame = pd.concat(frames, join="inner")
-        else:
-            frames = []
-
-            for metric in result:
-                new_frame = DataFrame(metric['values'], columns=[
-                                        'timestamp', measurement_field_name])
-                new_frame["node"] = "test"
-                
-                if "node" in metric["metric"]:
-                    new_frame["node"] = metric["metric"]["node"]
-                if measurement_field_name == 'replicas' or measurement_field_name == 'pods-cpu-sum' or \
-                    measurement_field_name == 'pods-mem-sum-bytes' or measurement_field_name == 'pods-file-descp-sum' or \
-                    measurement_field_name == 'pods-cpu-requests' or measurement_field_name == 'pods-cpu-limits' or\
-                    measurement_field_name == 'pods-iops-reads-sum' or measurement_field_name == 'pods-iops-writes-sum' or\
-                    measurement_field_name == 'pods-network-transmit-bytes' or measurement_field_name == 'pods-network-receive-bytes' or \
-                    measurement_field_name == 'pods-fs-write-bytes' or measurement_field_name == 'pods-fs-read-bytes':
-                    if "pod" in metric['metric'].keys():
-                        fun_name_arr = metric['metric']["pod"].split("-guest-")
-                        new_frame['function_name'] = fun_name_arr[-1].replace('-', '')
-                    else:
-                        new_frame['function_name'] = "None" 
-                        
-                else:   
-                    func_name  = metric['metric'][action_field].replace('-', '')
-                    new_frame['function_name'] = func_name
+            if measurement_category == 'system_usage':
+                nodes.extend([metric["metric"].get("instance", "test")] * length)
+                continue
+
+            nodes.extend([metric["metric"].get("node", "test")] * length)
+            if measurement_field_name == 'replicas' or measurement_field_name == 'pods-cpu-sum' or \
+                measurement_field_name == 'pods-mem-sum-bytes' or measurement_field_name == 'pods-file-descp-sum' or \
+                measurement_field_name == 'pods-cpu-requests' or measurement_field_name == 'pods-cpu-limits' or\
+                measurement_field_name == 'pods-iops-reads-sum' or measurement_field_name == 'pods-iops-writes-sum' or\
+                measurement_field_name == 'pods-network-transmit-bytes' or measurement_field_name == 'pods-network-receive-bytes' or \
+                measurement_field_name == 'pods-fs-write-bytes' or measurement_field_name == 'pods-fs-read-bytes':
+                if "pod" in metric['metric'].keys():
+                    fun_name_arr = metric['metric']["pod"].split("-guest-")
+                    func_name = fun_name_arr[-1].replace('-', '')
+                else:
+                    func_name = "None"
+            else:
+                func_name = metric['metric'][action_field].replace('-', '')
+            function_names.extend([func_name] * length)
 
-                # if "kubernetes_pod_name" in metric['metric'].keys():
-                #     new_frame['kubernetes_pod_name'] = metric['metric']["kubernetes_pod_name"]
-                
-                
-                # elif "kubernetes_pod_name" not in metric['metric'].keys() and "pod" in metric['metric'].keys():
-                #     new_frame['kubernetes_pod_name'] = metric['metric']["pod"]
+        frame = DataFrame({'timestamp': timestamps, measurement_field_name: np.asarray(values, dtype=float),
+                           'node': nodes})
+        if measurement_category != 'system_usage':
+            frame['function_name'] = function_names
 
-                frames.append(new_frame)
-
-            frame = pd.concat(frames, join="inner")
-            
-        frame[measurement_field_name] = frame[measurement_field_name].apply(lambda v: float(v))
-        logging.debug("frame, %s", measurement_field_name)
-        logging.debug(frame)
+        logging.debug("frame, %s %s", measurement_field_name, FrameSummary(frame))
         return frame
 
     def do_frame_postprocessing(self, frame: DataFrame, target_name: str, measurement_category: str) -> DataFrame:
         """ Performs postprocessing on dataframes.
         These are:
             - apply the target name
-            - fill N/A values with 0
             - set timestamp as index
             - set the measurement_category (e.g. system resource, function usage)
         Args:
@@ -222,7 +211,7 @@ class PrometheusCollector(BaseCollector):
                 frame.index = pd.to_datetime(frame.index, unit='s')
                 frame['cluster_name'] = target_name
                 frame['measurement_category'] = measurement_category
-                frame.fillna(0, inplace=True)
+                # missing values stay NaN and are omitted by the sinks instead of being written as 0
 
             return frame
         else:
@@ -256,13 +245,15 @@ class PrometheusCollector(BaseCollector):
         """
         url = self.prometheus_url + self.query_base_without_ts + query
 
-        prometheus_request = await requests.get(url)
+        response = await self.request_prometheus(url, self.query_base_without_ts + query)
 
         # get result and parse
-        if prometheus_request.status == 200:
-            response = await prometheus_request.json()
-            return self.parse_result_to_dataframe_without_ts(measurement_category, measurement_field_name, response,
-                                                  multiple_actions, action_field)
+        if response is not None:
+            with Metrics.stage_timer("parse"):
+                frame = self.parse_result_to_dataframe_without_ts(measurement_category, measurement_field_name, response,
+                                                                  multiple_actions, action_field)
+            Metrics.observe_result(len(response['data']['result']), len(frame))
+            return frame
 
         return DataFrame()        
 
@@ -299,15 +290,48 @@ class PrometheusCollector(BaseCollector):
         logging.debug("measurement_field_name url %s", url)
 
 
-        prometheus_request = await requests.get(url)
+        response = await self.request_prometheus(url, self.query_base + query)
         # get result and parse
-        if prometheus_request.status == 200:
-            response = await prometheus_request.json()
-            return self.parse_result_to_dataframe(measurement_category, measurement_field_name, response,
-                                                  multiple_actions, action_field)
+        if response is not None:
+            with Metrics.stage_timer("parse"):
+                frame = self.parse_result_to_dataframe(measurement_category, measurement_field_name, response,
+                                                       multiple_actions, action_field)
+            Metrics.observe_result(len(response['data']['result']), len(frame))
+            return frame
 
         return DataFrame()
 
+    async def request_prometheus(self, url: str, query: str) -> dict:
+        """ Sends a request to the Prometheus instance, hedging it if it is slower than usual for the query.
+        Each request goes through the BackendGuard (concurrency limit, circuit breaker) of its instance.
+        Args:
+            url:
+                String - the query url
+            query:
+                String - the query without the time range, latencies are tracked per query
+
+        Returns:
+            dict - the json response, None if Prometheus rejected the query
+        """
+        return await self.hedger.run(query, self.fetch_json_guarded, url)
+
+    @staticmethod
+    async def fetch_json_guarded(base_url: str, url: str) -> dict:
+        return await BackendGuard.for_backend(base_url).call(PrometheusCollector.fetch_json, url)
+
+    @staticmethod
+    async def fetch_json(url: str) -> dict:
+        started = time.perf_counter()
+        prometheus_request = await requests.get(url)
+        # an overloaded or unavailable Prometheus counts as failure of the backend
+        if prometheus_request.status >= 500 or prometheus_request.status == 429:
+            raise BackendError("prometheus returned status {}".format(prometheus_request.status))
+        if prometheus_request.status != 200:
+            return None
+        body = await prometheus_request.read()
+        Metrics.observe_query(time.perf_counter() - started, len(body))
+        return json.loads(body)
+
     @abstractmethod
     async def collect(self, config_object: object, cluster_name: str, start: int, end: int) -> DataFrame:
         """ Collects one or more measurements for a Target from the configured Prometheus instance.
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class RequestHedger:
+    """ Hedges slow requests to a backend.
+    If a query has not answered after the `percentile` latency observed for the same query, a duplicate request
+    is sent (to the next replica, or to the same backend if no replicas are configured). The first successful
+    response is used and the other request is cancelled. At most `max_hedge_ratio` of the requests are hedged,
+    so an overloaded backend does not receive twice the load.
+    """
+
+    # backend name (e.g. the prometheus url) -> RequestHedger
+    registry = {}
+
+    def __init__(self, name: str, enabled: bool = False, replica_urls: list = None, percentile: float = 0.95,
+                 min_samples: int = 20, history: int = 100, min_delay: float = 0.05, max_hedge_ratio: float = 0.1):
+        """
+        Args:
+            name:
+                String - base url of the primary backend
+            enabled:
+                Boolean - hedge requests, otherwise only the primary backend is requested
+            replica_urls:
+                list, optional - base urls of replicas serving the same data, used round-robin for hedges
+            percentile:
+                Float - latency percentile of a query after which its request is hedged
+            min_samples:
+                Integer - latencies of a query needed before it is hedged
+            history:
+                Integer - latencies kept per query
+            min_delay:
+                Float - queries faster than this (seconds) are never hedged
+            max_hedge_ratio:
+                Float - maximum share of hedged requests
+        """
+        self.name = name
+        self.enabled = enabled
+        self.replica_urls = replica_urls or []
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.history = history
+        self.min_delay = min_delay
+        self.max_hedge_ratio = max_hedge_ratio
+
+        # query -> latencies of the last requests in seconds
+        self.latencies = {}
+        self.next_replica = 0
+        self.stats = {"requests": 0, "hedges_issued": 0, "hedges_won": 0}
+
+    @classmethod
+    def for_backend(cls, name: str, **kwargs) -> "RequestHedger":
+        """ Returns the hedger of a backend, creating it with the given settings on first use. """
+        if name not in cls.registry:
+            cls.registry[name] = cls(name, **kwargs)
+        return cls.registry[name]
+
+    def record(self, key: str, latency: float) -> None:
+        if key not in self.latencies:
+            self.latencies[key] = deque(maxlen=self.history)
+        self.latencies[key].append(latency)
+
+    def hedge_delay(self, key: str) -> float:
+        """ Returns the seconds after which a request of the query is hedged, None if it should not be hedged. """
+        if not self.enabled or self.stats["hedges_issued"] >= self.max_hedge_ratio * self.stats["requests"]:
+            return None
+        latencies = self.latencies.get(key)
+        if latencies is None or len(latencies) < self.min_samples:
+            return None
+        ordered = sorted(latencies)
+        delay = ordered[int(self.percentile * (len(ordered) - 1))]
+        return max(delay, self.min_delay)
+
+    def hedge_target(self) -> str:
+        if not self.replica_urls:
+            return self.name
+        replica_url = self.replica_urls[self.next_replica % len(self.replica_urls)]
+        self.next_replica += 1
+        return replica_url
+
+    async def run(self, key: str, fetch, url: str):
+        """ Requests an url of the backend, hedging the request if it is slow.
+        Args:
+            key:
+                String - the query, latencies are tracked per query
+            fetch:
+                Callable - coroutine function fetch(base_url, url) performing one request
+            url:
+                String - the url starting with the base url of the primary backend
+
+        Returns:
+            Object - the result of the first successful request
+        """
+        self.stats["requests"] += 1
+        delay = self.hedge_delay(key)
+        started = time.time()
+
+        if delay is None:
+            result = await fetch(self.name, url)
+            self.record(key, time.time() - started)
+            return result
+
+        primary = asyncio.ensure_future(fetch(self.name, url))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                base_url = self.hedge_target()
+                tasks.add(asyncio.ensure_future(fetch(base_url, base_url + url[len(self.name):])))
+                self.stats["hedges_issued"] += 1
+                logging.debug("hedging query %s after %.3fs to %s", key, delay, base_url)
+
+            pending = tasks
+            failed = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        failed = task
+                        continue
+                    if task is not primary:
+                        self.stats["hedges_won"] += 1
+                    self.record(key, time.time() - started)
+                    return task.result()
+            # all requests failed
+            return failed.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> dict:
+        """ Returns the counters and the number of tracked queries. """
+        stats = dict(self.stats)
+        stats["queries"] = len(self.latencies)
+        return stats
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+import logging
+import time
+from pandas import DataFrame
+
+logger = logging.getLogger(__name__)
+
+
+class StaticMetricCache:
+    """ In-memory cache for slowly-changing ("static") metrics such as cpu requests/limits or node memory.
+    These metrics are fetched with a single instant query and only refetched after `ttl` seconds or when
+    the version passed by the caller (e.g. the pod set of a PodIndex) changes. The cached values are
+    broadcast over the timestamp grid of the current cycle, so they merge like range query results.
+    """
+
+    def __init__(self, ttl: int = 600):
+        """
+        Args:
+            ttl:
+                Integer - seconds after which a cached metric is fetched again
+        """
+        self.ttl = ttl
+        # measurement field name -> (fetched at, version, frame)
+        self.entries = {}
+        self.stats = {"hits": 0, "fetches": 0}
+
+    def is_fresh(self, key: str, version=None) -> bool:
+        if key not in self.entries:
+            return False
+        fetched_at, cached_version, _ = self.entries[key]
+        return time.time() - fetched_at < self.ttl and cached_version == version
+
+    async def get(self, key: str, fetch, version=None) -> DataFrame:
+        """ Returns the cached frame for a metric, fetching it if it is missing or stale.
+        Args:
+            key:
+                String - name of the metric (usually the measurement field name)
+            fetch:
+                Callable - coroutine function returning the current values as DataFrame (without timestamps)
+            version:
+                Object, optional - the metric is refetched whenever this value changes
+
+        Returns:
+            DataFrame - the latest values of the metric
+        """
+        if self.is_fresh(key, version):
+            self.stats["hits"] += 1
+            return self.entries[key][2]
+
+        frame = await fetch()
+        self.stats["fetches"] += 1
+        # keep serving the last known values if the backend returned nothing
+        if frame.empty and key in self.entries:
+            return self.entries[key][2]
+        self.entries[key] = (time.time(), version, frame)
+        logging.debug("static metric %s fetched, cache stats: %s", key, self.stats)
+        return frame
+
+    def invalidate(self, key: str = None) -> None:
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key, None)
+
+    @staticmethod
+    def broadcast(frame: DataFrame, start: int, end: int, step: int) -> DataFrame:
+        """ Repeats the values of a frame for every timestamp of a range query (start, start + step, ... <= end).
+        Args:
+            frame:
+                DataFrame - values without timestamps
+            start:
+                Integer - A timestamp, where the query range starts
+            end:
+                Integer - A timestamp, where the query range ends
+            step:
+                Integer - step of the query range
+
+        Returns:
+            DataFrame - the frame with an additional 'timestamp' column as first column
+        """
+        if frame.empty:
+            return DataFrame()
+
+        grid = DataFrame({"timestamp": range(start, end + 1, step)})
+        result = grid.merge(frame, how="cross")
+        return result
@@ -1,5 +1,14 @@
 from .BaseCollector import BaseCollector
-from .Google import GCFCollector
-from .OpenWhisk import OpenWhiskCollector
-from .AWS import AWSCollector
-from .OpenFaas import OpenFaasCollector
+from .StaticMetricCache import StaticMetricCache
+from .CycleDeadline import CycleDeadline, CycleJob
+from .BackendGuard import BackendGuard, BackendError, CircuitOpenError
+from .RequestHedger import RequestHedger
+from .CollectorRegistry import CollectorRegistry
+
+
+def __getattr__(name):
+    # the collectors (GCFCollector, OpenWhiskCollector, AWSCollector, OpenFaasCollector) are imported on first use
+    collector_class = CollectorRegistry.by_class_name(name)
+    if collector_class is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    return collector_class
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+import asyncio
+import logging
+import os
+
+from decouple import RepositoryEnv
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigWatcher:
+    """ Polls configuration sources and applies their changes while the monitor keeps running.
+    A source is a blocking fingerprint function (e.g. the modification time of a file or the etag of an object) and a
+    coroutine function applying the changed source. Sources are checked every `interval` seconds; a change that
+    fails to apply is logged and the previous configuration stays active until the source changes again.
+    """
+
+    def __init__(self, interval: float = 30.0):
+        """
+        Args:
+            interval:
+                Float - seconds between two checks of the sources
+        """
+        self.interval = interval
+        # name -> [fingerprint function, apply coroutine function, last fingerprint]
+        self.sources = {}
+        self.stats = {"checks": 0, "reloads": 0, "failed_reloads": 0}
+
+    def watch(self, name: str, fingerprint, apply) -> None:
+        """ Adds a source, its current state is considered applied.
+        Args:
+            name:
+                String - name of the source in logs
+            fingerprint:
+                Callable - blocking function returning a value that changes with the source
+            apply:
+                Callable - coroutine function applying the changed source
+        """
+        self.sources[name] = [fingerprint, apply, fingerprint()]
+
+    async def watch_forever(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            for name, source in list(self.sources.items()):
+                fingerprint, apply, last_fingerprint = source
+                self.stats["checks"] += 1
+                try:
+                    # fingerprints may stat files or request object stores
+                    current_fingerprint = await loop.run_in_executor(None, fingerprint)
+                except Exception as e:
+                    logging.warning("checking configuration source %s failed: %s", name, e)
+                    continue
+                if current_fingerprint == last_fingerprint:
+                    continue
+                source[2] = current_fingerprint
+                logging.info("configuration source %s changed, reloading", name)
+                try:
+                    await apply()
+                    self.stats["reloads"] += 1
+                except Exception as e:
+                    self.stats["failed_reloads"] += 1
+                    logging.exception("applying configuration source %s failed: %s", name, e)
+
+    @staticmethod
+    def file_fingerprint(path: str) -> tuple:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def read_env_file(path: str) -> dict:
+        """ Reads the KEY=value entries of an env file. """
+        return dict(RepositoryEnv(path).data)
+
+    @staticmethod
+    def apply_env(previous: dict, current: dict) -> set:
+        """ Applies the entries of an env file to the process environment, which takes precedence in config().
+        Args:
+            previous:
+                dict - entries of the env file that have been applied before
+            current:
+                dict - entries of the env file now
+
+        Returns:
+            set - keys that have been added, changed or removed
+        """
+        changed_keys = set()
+        for key, value in current.items():
+            if previous.get(key) != value or os.environ.get(key) != value:
+                os.environ[key] = value
+                changed_keys.add(key)
+        for key in set(previous) - set(current):
+            os.environ.pop(key, None)
+            changed_keys.add(key)
+        return changed_keys
@@ -0,0 +1 @@
+from .ConfigWatcher import ConfigWatcher
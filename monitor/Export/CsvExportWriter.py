@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+from pandas import DataFrame
+
+from .ExportWriter import ExportWriter
+
+
+class CsvExportWriter(ExportWriter):
+    """ Writes the points in long format, one row per timestamp, series and field, so the header does not depend on
+    the fields collected in a chunk: timestamp (UTC), data_category, the label columns, field and value.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.file = self.open_text(path)
+        self.columns = ['timestamp', 'data_category'] + list(self.tag_columns) + ['field', 'value']
+        self.file.write(",".join(self.columns) + "\n")
+
+    def write_frame(self, data_category: str, frame: DataFrame) -> None:
+        tags, fields = self.split_columns(frame)
+        frame = frame.rename_axis('timestamp').reset_index()
+        rows = frame.melt(id_vars=['timestamp'] + tags, value_vars=fields, var_name='field').dropna(subset=['value'])
+        rows['data_category'] = data_category
+        rows.reindex(columns=self.columns).to_csv(self.file, header=False, index=False,
+                                                  date_format='%Y-%m-%dT%H:%M:%SZ')
+
+    def close(self) -> None:
+        self.file.close()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+import gzip
+from abc import abstractmethod
+
+from pandas import DataFrame
+
+
+class ExportWriter:
+    """Abstract ExportWriter class
+    Writes the frames of an export chunk by chunk to disk, so only the chunks being collected are held in memory.
+    Each frame is written with its data category 'functions_usage' or 'system_usage' and indexed by timestamp.
+    """
+
+    # label columns, the same as the tags of schema version 2 of the InfluxDBWriter
+    tag_columns = ('cluster_name', 'function_name', 'node', 'cpu', 'mode')
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path:
+                String - output file (directory for Parquet), files ending with .gz are gzip compressed
+        """
+        self.path = path
+        self.stats = {"frames": 0, "rows": 0}
+
+    @staticmethod
+    def open_text(path: str):
+        if path.endswith(".gz"):
+            return gzip.open(path, "wt", encoding="utf-8")
+        return open(path, "w", encoding="utf-8")
+
+    @classmethod
+    def split_columns(cls, frame: DataFrame) -> tuple:
+        """ Returns the label columns and the numeric field columns of a frame. """
+        tags = [column for column in cls.tag_columns if column in frame.columns]
+        fields = [column for column in frame.columns if column not in tags and frame[column].dtype.kind in "biuf"]
+        return tags, fields
+
+    def write(self, data_category: str, frame: DataFrame) -> None:
+        if frame is None or frame.empty:
+            return
+        self.write_frame(data_category, frame)
+        self.stats["frames"] += 1
+        self.stats["rows"] += len(frame)
+
+    @abstractmethod
+    def write_frame(self, data_category: str, frame: DataFrame) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def get_stats(self) -> dict:
+        return dict(self.stats)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+from influxdb_client.client.write.dataframe_serializer import data_frame_to_list_of_points
+from influxdb_client.client.write_api import PointSettings
+from pandas import DataFrame
+
+from .ExportWriter import ExportWriter
+
+
+class LineProtocolExportWriter(ExportWriter):
+    """ Writes the points as InfluxDB line protocol of schema version 2 with millisecond precision, e.g. for
+    `influx write --precision ms --file`. Missing values are omitted.
+    """
+
+    def __init__(self, path: str, measurements: dict):
+        """
+        Args:
+            path:
+                String - output file, gzip compressed if it ends with .gz
+            measurements:
+                dict - data category -> measurement name, e.g. {'functions_usage': 'functions_usage'}
+        """
+        super().__init__(path)
+        self.measurements = measurements
+        self.file = self.open_text(path)
+
+    def write_frame(self, data_category: str, frame: DataFrame) -> None:
+        tags, fields = self.split_columns(frame)
+        if not fields:
+            return
+        lines = data_frame_to_list_of_points(frame[tags + fields], PointSettings(), precision='ms',
+                                             data_frame_measurement_name=self.measurements[data_category],
+                                             data_frame_tag_columns=tags)
+        self.file.write("\n".join(lines) + "\n")
+
+    def close(self) -> None:
+        self.file.close()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame
+
+from .ExportWriter import ExportWriter
+
+
+class ParquetExportWriter(ExportWriter):
+    """ Writes every frame as a zstd compressed file <data category>/part-<number>.parquet of a dataset directory.
+    The fields of the chunks may differ; readers merge the schemas, e.g. pyarrow.dataset or DuckDB with
+    read_parquet('<path>/functions_usage/*.parquet', union_by_name=true).
+    """
+
+    def __init__(self, path: str, row_group_size: int = 128 * 1024):
+        super().__init__(path)
+        self.row_group_size = row_group_size
+
+    def write_frame(self, data_category: str, frame: DataFrame) -> None:
+        directory = os.path.join(self.path, data_category)
+        os.makedirs(directory, exist_ok=True)
+        frame = frame.rename_axis('timestamp').reset_index()
+        tags = [column for column in self.tag_columns if column in frame.columns]
+        for column in tags:
+            frame[column] = frame[column].astype(str).astype('category')
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        pq.write_table(table, os.path.join(directory, "part-{:06d}.parquet".format(self.stats["frames"])),
+                       row_group_size=self.row_group_size, compression="zstd", use_dictionary=tags or False)
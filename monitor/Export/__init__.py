@@ -0,0 +1,15 @@
+import importlib
+
+from .ExportWriter import ExportWriter
+from .CsvExportWriter import CsvExportWriter
+
+# writers with heavy dependencies (pyarrow, influxdb_client) are imported on first use
+lazy_writers = {"ParquetExportWriter": ".ParquetExportWriter", "LineProtocolExportWriter": ".LineProtocolExportWriter"}
+
+
+def __getattr__(name):
+    if name not in lazy_writers:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    # importing the submodule binds its module to the name in the package, the class replaces it
+    globals()[name] = getattr(importlib.import_module(lazy_writers[name], __name__), name)
+    return globals()[name]
@@ -1,24 +1,24 @@
 #!/usr/bin/env python
-import yaml
-from flask import Flask
 from decouple import config
 from influxdb_client import InfluxDBClient
+from influxdb_client.client.write.dataframe_serializer import data_frame_to_list_of_points
+from influxdb_client.client.write_api import SYNCHRONOUS, PointSettings
+from influxdb_client.rest import ApiException
 from influxdb_client.extras import pd, np
 import logging
+import threading
+import time
 from datetime import datetime
-"""
-Enable logging for DataFrame serializer
-"""
-loggerSerializer = logging.getLogger('influxdb_client.client.write.dataframe_serializer')
-loggerSerializer.setLevel(level=logging.DEBUG)
-handler = logging.StreamHandler()
-handler.setFormatter(logging.Formatter('%(asctime)s | %(message)s'))
-loggerSerializer.addHandler(handler)
+from .WriteSpool import WriteSpool
+from Observability import Metrics
 
-app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
 
 class InfluxDBWriter:
+    # schema version 2 tags these columns, other string columns (e.g. measurement_category) are not written
+    schema_v2_tags = ('cluster_name', 'function_name', 'node', 'cpu', 'mode')
+
     def __init__(self, data: object) -> None:
         
         self.url = 'http://' + data['host'] + ':' + str(data['port'])
@@ -27,38 +27,142 @@ class InfluxDBWriter:
         self.bucket = data['bucket']
         self.table_functions = data['table_functions']
         self.table_infra = data['table_infra']
+        # '1' (every string column a field), '2' or 'dual', which writes both while consumers are migrated
+        self.schema = str(data.get('schema', 'dual'))
+        if self.schema not in ('1', '2', 'dual'):
+            raise ValueError("unknown InfluxDB schema version {}, expected 1, 2 or dual".format(self.schema))
+        self.table_functions_v2 = data.get('table_functions_v2', 'functions_usage')
+        self.table_infra_v2 = data.get('table_infra_v2', 'infra_usage')
+
+        # every write goes through the spool first, so nothing is lost while InfluxDB is unavailable
+        self.spool = WriteSpool(data.get('spool_dir', 'Spool'),
+                                max_bytes=int(data.get('spool_max_mb', 512)) * 1024 * 1024,
+                                fsync=data.get('spool_fsync', 'always'))
+        # lines per second while a backlog is replayed, seconds between delivery attempts while InfluxDB is down
+        self.replay_rate = int(data.get('replay_rate', 50000))
+        self.retry_interval = int(data.get('retry_interval', 10))
+        self.batch_size = 5000
+
+        self.pending = threading.Event()
+        self.delivery_thread = threading.Thread(target=self.deliver_forever, name="influxdb-spool", daemon=True)
+        self.delivery_thread.start()
+        if self.spool.pending_segments():
+            self.pending.set()
+
+    def serialize(self, df, data_category) -> list:
+        """ Converts a functions_usage or system_usage frame to line protocol (ms precision) of the configured
+        schema versions. Missing (NaN) values are omitted.
+        """
+        if data_category not in ("functions_usage", "system_usage"):
+            return []
+        lines = []
+        with Metrics.stage_timer("serialize"):
+            if self.schema in ('1', 'dual'):
+                lines += self.serialize_v1(df, data_category)
+            if self.schema in ('2', 'dual'):
+                lines += self.serialize_v2(df, data_category)
+        return lines
+
+    def serialize_v1(self, df, data_category) -> list:
+        """ Schema version 1: cluster_name (and function_name) are tags, all other columns are fields. """
+        if data_category == "functions_usage":
+            measurement_name, tag_columns = self.table_functions, ['cluster_name', 'function_name']
+        else:
+            measurement_name, tag_columns = self.table_infra, ['cluster_name']
+        return data_frame_to_list_of_points(df, PointSettings(), precision='ms',
+                                            data_frame_measurement_name=measurement_name,
+                                            data_frame_tag_columns=tag_columns)
+
+    def serialize_v2(self, df, data_category) -> list:
+        """ Schema version 2: label columns (cluster, function, node, cpu, mode) are tags, only numeric columns are
+        fields. The data category is given by the measurement and not repeated on every point.
+        """
+        measurement_name = self.table_functions_v2 if data_category == "functions_usage" else self.table_infra_v2
+        tag_columns = [column for column in self.schema_v2_tags if column in df.columns]
+        field_columns = [column for column in df.columns
+                         if column not in tag_columns and pd.api.types.is_numeric_dtype(df[column])]
+        if not field_columns:
+            return []
+        return data_frame_to_list_of_points(df[tag_columns + field_columns], PointSettings(), precision='ms',
+                                            data_frame_measurement_name=measurement_name,
+                                            data_frame_tag_columns=tag_columns)
 
     def write_dataframe_influxdb(self, df, data_category):
 
         """
-        Ingest DataFrame
+        Spool the DataFrame as line protocol, it is written to InfluxDB by the delivery thread
         """
-        print()
-        print("=== Ingesting DataFrame via batching API ===")
-        print()
-        startTime = datetime.now()
-
-        with InfluxDBClient(url=self.url, token=self.token, org=self.org) as client:
-
-            """
-            Use batching API
-            """
-            if data_category == "functions_usage":
-                with client.write_api() as write_api:
-                    write_api.write(bucket=self.bucket, record=df,
-                                    data_frame_tag_columns=['cluster_name', 'function_name'],
-                                    data_frame_measurement_name=self.table_functions, write_precision='ms')
-                    print()
-                    print("Wait to finishing ingesting DataFrame...")
-                    print()
-            elif data_category == "system_usage":
-                with client.write_api() as write_api:
-                    write_api.write(bucket=self.bucket, record=df,
-                                    data_frame_tag_columns=['cluster_name'],
-                                    data_frame_measurement_name=self.table_infra, write_precision='ms')
-                    print()
-                    print("Wait to finishing ingesting DataFrame...")
-                    print()
-        print()
-        print(f'Import finished in: {datetime.now() - startTime}')
-        print()
+        lines = self.serialize(df, data_category)
+        if len(lines) == 0:
+            return
+        self.spool.append(lines)
+        self.pending.set()
+        logging.debug("spooled %s %s points, spool stats %s", len(lines), data_category, self.spool.get_stats())
+
+    def write_measurement(self, df, measurement_name: str, tag_columns: list) -> None:
+        """ Spools the DataFrame as points of a measurement, e.g. precomputed rollups. """
+        with Metrics.stage_timer("serialize"):
+            lines = data_frame_to_list_of_points(df, PointSettings(), precision='ms',
+                                                 data_frame_measurement_name=measurement_name,
+                                                 data_frame_tag_columns=tag_columns)
+        if len(lines) == 0:
+            return
+        self.spool.append(lines)
+        self.pending.set()
+        logging.debug("spooled %s %s points", len(lines), measurement_name)
+
+    def deliver_forever(self):
+        while True:
+            self.pending.wait()
+            self.pending.clear()
+            if not self.deliver_pending():
+                # records written in the meantime are collected in the active segment
+                time.sleep(self.retry_interval)
+                self.pending.set()
+
+    @staticmethod
+    def is_permanent(error: Exception) -> bool:
+        """ Client errors (malformed line protocol, field type conflicts, a missing bucket) fail again on every
+        retry, other than 429, server errors and connection errors. """
+        return isinstance(error, ApiException) and error.status is not None and 400 <= error.status < 500 and \
+            error.status != 429
+
+    def deliver_pending(self) -> bool:
+        """ Writes all spooled segments in order and acknowledges them. A segment rejected with a client error is
+        quarantined, so it does not block the segments after it.
+        Returns:
+            Boolean - False if InfluxDB is unavailable
+        """
+        self.spool.seal()
+        segments = self.spool.pending_segments()
+        replay = len(segments) > 1
+        if replay:
+            logging.info("replaying %s spooled segments to InfluxDB", len(segments))
+
+        try:
+            with InfluxDBClient(url=self.url, token=self.token, org=self.org) as client:
+                write_api = client.write_api(write_options=SYNCHRONOUS)
+                for path in segments:
+                    started = time.time()
+                    lines = WriteSpool.read_segment(path)
+                    # a segment interrupted by a failure is written again, points with the same series and
+                    # timestamp overwrite each other in InfluxDB
+                    try:
+                        with Metrics.stage_timer("write"):
+                            for offset in range(0, len(lines), self.batch_size):
+                                write_api.write(bucket=self.bucket, record=lines[offset:offset + self.batch_size],
+                                                write_precision='ms')
+                    except ApiException as e:
+                        if not self.is_permanent(e):
+                            raise
+                        logging.error("InfluxDB rejected spool segment %s (%s %s), moved it to %s", path, e.status,
+                                      e.body, self.spool.quarantine(path))
+                        continue
+                    self.spool.acknowledge(path)
+                    if replay:
+                        time.sleep(max(0.0, len(lines) / self.replay_rate - (time.time() - started)))
+        except Exception as e:
+            logging.error("writing to InfluxDB failed, %s segments stay spooled: %s",
+                          len(self.spool.pending_segments()), e)
+            return False
+        return True
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+import gzip
+import logging
+import os
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+class WriteSpool:
+    """ Local append-only write-ahead spool for line protocol records.
+    Records are appended as gzip members to the active segment file. Sealed segments are delivered in order and
+    removed once they are acknowledged, so data written while InfluxDB is unavailable survives restarts of the
+    monitor. Segments left over from a previous run are recovered on startup.
+    """
+
+    segment_prefix = "segment-"
+    segment_suffix = ".lp.gz"
+    quarantine_directory = "quarantine"
+
+    def __init__(self, directory: str, segment_max_bytes: int = 8 * 1024 * 1024, max_bytes: int = 512 * 1024 * 1024,
+                 fsync: str = "always"):
+        """
+        Args:
+            directory:
+                String - directory holding the segment files
+            segment_max_bytes:
+                Integer - the active segment is sealed when it grows beyond this size
+            max_bytes:
+                Integer - size cap of the spool, the oldest segments are dropped beyond it
+            fsync:
+                String - 'always' (after every record), 'segment' (when a segment is sealed) or 'never'
+        """
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        # segments of a previous run are unacknowledged, replay them first
+        self.sealed = sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                             if self.sequence_of(name) is not None)
+        self.next_sequence = max([self.sequence_of(path) for path in self.sealed], default=0) + 1
+
+        self.active = None
+        self.active_path = None
+        self.active_bytes = 0
+
+        self.stats = {"appended_records": 0, "recovered_segments": len(self.sealed), "acknowledged_segments": 0,
+                      "dropped_segments": 0, "quarantined_segments": 0}
+        if self.sealed:
+            logging.info("recovered %s unacknowledged spool segments from %s", len(self.sealed), self.directory)
+
+    @classmethod
+    def sequence_of(cls, path: str) -> int:
+        """ Returns the sequence number of a segment file or None for other file names. """
+        name = os.path.basename(path)
+        if not (name.startswith(cls.segment_prefix) and name.endswith(cls.segment_suffix)):
+            return None
+        try:
+            return int(name[len(cls.segment_prefix):-len(cls.segment_suffix)])
+        except ValueError:
+            return None
+
+    def append(self, lines: list) -> None:
+        """ Appends a record of line protocol lines to the active segment.
+        Args:
+            lines:
+                list - line protocol strings
+        """
+        data = gzip.compress(("\n".join(lines) + "\n").encode())
+        with self.lock:
+            if self.active is None:
+                self.active_path = os.path.join(self.directory, "{}{:012d}{}".format(
+                    self.segment_prefix, self.next_sequence, self.segment_suffix))
+                self.next_sequence += 1
+                self.active = open(self.active_path, "ab")
+                self.active_bytes = 0
+            self.active.write(data)
+            self.active.flush()
+            if self.fsync == "always":
+                os.fsync(self.active.fileno())
+            self.active_bytes += len(data)
+            self.stats["appended_records"] += 1
+
+            if self.active_bytes >= self.segment_max_bytes:
+                self.seal_active()
+            self.enforce_size_cap()
+
+    def seal(self) -> None:
+        """ Seals the active segment, so its records are delivered with the next replay. """
+        with self.lock:
+            self.seal_active()
+
+    def seal_active(self) -> None:
+        if self.active is None:
+            return
+        if self.fsync != "never":
+            os.fsync(self.active.fileno())
+        self.active.close()
+        if self.fsync != "never":
+            self.fsync_directory()
+        self.sealed.append(self.active_path)
+        self.active = None
+        self.active_path = None
+        self.active_bytes = 0
+
+    def fsync_directory(self) -> None:
+        directory_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+    def enforce_size_cap(self) -> None:
+        size = self.active_bytes + sum(os.path.getsize(path) for path in self.sealed)
+        while size > self.max_bytes and self.sealed:
+            path = self.sealed.pop(0)
+            size -= os.path.getsize(path)
+            os.remove(path)
+            self.stats["dropped_segments"] += 1
+            logging.warning("spool exceeds %s bytes, dropped the oldest segment %s", self.max_bytes, path)
+
+    def pending_segments(self) -> list:
+        """ Returns the sealed, unacknowledged segments in the order they were written. """
+        with self.lock:
+            return list(self.sealed)
+
+    def acknowledge(self, path: str) -> None:
+        """ Removes a segment after it has been delivered. """
+        with self.lock:
+            if path in self.sealed:
+                self.sealed.remove(path)
+                os.remove(path)
+                self.stats["acknowledged_segments"] += 1
+
+    def quarantine(self, path: str) -> str:
+        """ Moves a segment InfluxDB rejects permanently out of the delivery order, so later segments are still
+        delivered. Quarantined segments are kept for inspection and are not replayed.
+        Returns:
+            String - new path of the segment
+        """
+        quarantine_directory = os.path.join(self.directory, self.quarantine_directory)
+        os.makedirs(quarantine_directory, exist_ok=True)
+        quarantine_path = os.path.join(quarantine_directory, os.path.basename(path))
+        with self.lock:
+            if path in self.sealed:
+                self.sealed.remove(path)
+                os.replace(path, quarantine_path)
+                self.stats["quarantined_segments"] += 1
+        return quarantine_path
+
+    @staticmethod
+    def read_segment(path: str) -> list:
+        """ Reads the line protocol lines of a segment.
+        A record truncated by a crash while it was appended is skipped, all records before it are returned.
+        Args:
+            path:
+                String - path of the segment file
+
+        Returns:
+            list - line protocol strings
+        """
+        with open(path, "rb") as segment_file:
+            data = segment_file.read()
+
+        lines = []
+        while data:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            try:
+                record = decompressor.decompress(data)
+            except zlib.error:
+                logging.warning("skipping corrupt record in spool segment %s", path)
+                break
+            if not decompressor.eof:
+                logging.warning("skipping truncated record in spool segment %s", path)
+                break
+            lines.extend(record.decode().splitlines())
+            data = decompressor.unused_data
+        return lines
+
+    def get_stats(self) -> dict:
+        """ Returns the counters together with the number of pending segments. """
+        with self.lock:
+            stats = dict(self.stats)
+            stats["pending_segments"] = len(self.sealed) + (1 if self.active is not None else 0)
+        return stats
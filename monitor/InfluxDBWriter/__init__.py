@@ -1 +1,2 @@
+from .WriteSpool import WriteSpool
 from .InfluxdbWriter import InfluxDBWriter
\ No newline at end of file
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+
+class FrameSummary:
+    """ Formats a DataFrame as a one line summary (shape, distinct keys, time span) instead of dumping it.
+    The summary is only computed when the message is emitted, e.g. logging.debug("frame %s", FrameSummary(frame)).
+    """
+
+    key_columns = ('cluster_name', 'function_name', 'node', 'pod', 'measurement_category')
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def __str__(self) -> str:
+        frame = self.frame
+        if not isinstance(frame, pd.DataFrame):
+            return str(frame)
+        if frame.empty:
+            return "DataFrame empty, columns {}".format(list(frame.columns))
+
+        parts = ["DataFrame {}x{}".format(*frame.shape)]
+        for column in self.key_columns:
+            if column in frame.columns:
+                parts.append("{} {}".format(frame[column].nunique(), column))
+        timestamps = None
+        if 'timestamp' in frame.columns:
+            timestamps = frame['timestamp']
+        elif frame.index.name == 'timestamp':
+            timestamps = frame.index
+        if timestamps is not None:
+            parts.append("{} .. {}".format(timestamps.min(), timestamps.max()))
+        parts.append("columns {}".format(list(frame.columns)))
+        return ", ".join(parts)
+
+
+class SamplingFilter(logging.Filter):
+    """ Passes at most `burst` DEBUG records per call site (file and line) within `interval` seconds.
+    The first record of a call site after a window with suppressed records carries their count.
+    """
+
+    def __init__(self, burst: int = 10, interval: float = 60.0):
+        """
+        Args:
+            burst:
+                Integer - DEBUG records of a call site passed per interval
+            interval:
+                Float - seconds of a sampling window
+        """
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.lock = threading.Lock()
+        # (pathname, lineno) -> [window start, records passed, records suppressed]
+        self.windows = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        key = (record.pathname, record.lineno)
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or record.created - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self.windows[key] = [record.created, 1, 0]
+                if suppressed:
+                    record.msg = "{} ({} similar messages suppressed)".format(record.getMessage(), suppressed)
+                    record.args = None
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """ Enqueues records without ever blocking the caller, records are dropped while the queue is full. """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(path: str = "Logs/log.log", level: str = "DEBUG", max_bytes: int = 10 ** 9, backup_count: int = 2,
+                  sample_burst: int = 10, sample_interval: float = 60.0, queue_size: int = 10000,
+                  stream=sys.stdout, levels: dict = None) -> QueueListener:
+    """ Configures the root logger once for the whole monitor.
+    Records are put on a queue by the logging thread and written to the rotating log file and the stream by a
+    listener thread, so file I/O never blocks the collection loop.
+    Args:
+        path:
+            String - log file
+        level:
+            String - level of the root logger, e.g. DEBUG or INFO
+        max_bytes:
+            Integer - size at which the log file is rotated
+        backup_count:
+            Integer - rotated log files kept
+        sample_burst:
+            Integer - DEBUG records per call site and sampling interval, 0 disables sampling
+        sample_interval:
+            Float - seconds of a sampling window
+        queue_size:
+            Integer - records buffered for the listener, further records are dropped
+        stream:
+            Stream - additionally written stream, None for the log file only
+        levels:
+            Dictionary, optional - levels of single loggers, e.g. of a library, their records go through the queue
+
+    Returns:
+        QueueListener - the started listener, stopped (and flushed) at exit
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)]
+    if stream is not None:
+        handlers.append(logging.StreamHandler(stream))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    if sample_burst > 0:
+        queue_handler.addFilter(SamplingFilter(sample_burst, sample_interval))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
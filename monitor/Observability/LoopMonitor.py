@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+import logging
+import os
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+
+from . import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """ Watches the scheduling delay of the collection event loop from a separate thread.
+    Every `interval` seconds a callback is scheduled on the loop and the time until it runs is observed as loop lag.
+    If it has not run after `slow_callback_threshold` seconds, the loop is blocked by a callback (pandas work,
+    boto3 calls, synchronous writes, time.sleep); the stack of the loop thread is captured and, once the loop is
+    responsive again, logged together with the blocked duration and counted by the location in the monitor code.
+    """
+
+    def __init__(self, interval: float = 0.5, slow_callback_threshold: float = 0.25, stack_limit: int = 30):
+        """
+        Args:
+            interval:
+                Float - seconds between two lag measurements
+            slow_callback_threshold:
+                Float - callbacks blocking the loop longer than this (seconds) are reported
+            stack_limit:
+                Integer - innermost frames of the captured stack that are logged
+        """
+        self.interval = interval
+        self.slow_callback_threshold = slow_callback_threshold
+        self.stack_limit = stack_limit
+        self.loop = None
+        self.thread_id = None
+        self.watchdog = None
+        self.stopped = threading.Event()
+        self.library_paths = tuple({sysconfig.get_paths()["stdlib"], sysconfig.get_paths()["purelib"],
+                                    sysconfig.get_paths()["platlib"]})
+        self.stats = {"max_lag": 0.0, "slow_callbacks": 0, "max_blocked": 0.0}
+
+    def start(self, loop) -> None:
+        """ Starts watching the loop once it runs, may be called again after the loop has been restarted. """
+        self.loop = loop
+        loop.call_soon(self.attach)
+
+    def attach(self) -> None:
+        # runs on the loop, which is run by a different thread after a /stop and /start
+        self.thread_id = threading.get_ident()
+        if self.watchdog is None or not self.watchdog.is_alive():
+            self.stopped.clear()
+            self.watchdog = threading.Thread(target=self.watch_forever, name="loop-monitor", daemon=True)
+            self.watchdog.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def watch_forever(self) -> None:
+        while not self.stopped.wait(self.interval):
+            if not self.loop.is_running():
+                continue
+            scheduled = time.monotonic()
+            ran = threading.Event()
+            try:
+                self.loop.call_soon_threadsafe(ran.set)
+            except RuntimeError:
+                # the loop has been closed
+                return
+            if ran.wait(self.slow_callback_threshold):
+                self.observe_lag(time.monotonic() - scheduled)
+                continue
+
+            frame = sys._current_frames().get(self.thread_id)
+            stack = traceback.extract_stack(frame) if frame is not None else []
+            while not ran.wait(self.interval):
+                if self.stopped.is_set() or not self.loop.is_running():
+                    return
+            blocked = time.monotonic() - scheduled
+            self.observe_lag(blocked)
+            self.report_slow_callback(blocked, stack)
+
+    def observe_lag(self, lag: float) -> None:
+        self.stats["max_lag"] = max(self.stats["max_lag"], lag)
+        Metrics.loop_lag.labels(Metrics.cluster_name).observe(lag)
+
+    def location_of(self, stack: list) -> str:
+        """ Returns the innermost frame of the monitor's own code, e.g. AWSCollector.py:collect_data_from_logs """
+        for frame in reversed(stack):
+            if not frame.filename.startswith(self.library_paths) and not frame.filename.startswith("<"):
+                return "{}:{}".format(os.path.basename(frame.filename), frame.name)
+        return "unknown"
+
+    def report_slow_callback(self, blocked: float, stack: list) -> None:
+        location = self.location_of(stack)
+        self.stats["slow_callbacks"] += 1
+        self.stats["max_blocked"] = max(self.stats["max_blocked"], blocked)
+        Metrics.slow_callbacks.labels(Metrics.cluster_name, location).inc()
+        logging.warning("event loop blocked for %.3fs in %s:\n%s", blocked, location,
+                        "".join(traceback.format_list(stack[-self.stack_limit:])))
+
+    def get_stats(self) -> dict:
+        """ Returns the maximum lag and blocked duration since the last call, and the number of slow callbacks. """
+        stats = dict(self.stats)
+        self.stats["max_lag"] = 0.0
+        self.stats["max_blocked"] = 0.0
+        return stats
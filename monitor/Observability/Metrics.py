@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+import contextvars
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Histogram
+
+# the monitor collects a single cluster, set once at startup
+cluster_name = "unknown"
+# name of the collect function (e.g. collect_function_invocations) of the running query, set per query task
+current_metric = contextvars.ContextVar("current_metric", default="unknown")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(4 ** exponent for exponent in range(4, 15))
+
+query_duration = Histogram("fdn_monitor_query_duration_seconds", "HTTP latency of backend queries",
+                           ["cluster", "metric"], buckets=LATENCY_BUCKETS)
+query_response_bytes = Histogram("fdn_monitor_query_response_bytes", "Size of backend query responses",
+                                 ["cluster", "metric"], buckets=SIZE_BUCKETS)
+query_series = Histogram("fdn_monitor_query_series", "Series returned by a backend query",
+                         ["cluster", "metric"], buckets=SIZE_BUCKETS)
+query_rows = Histogram("fdn_monitor_query_rows", "Rows of the frame parsed from a backend query",
+                       ["cluster", "metric"], buckets=SIZE_BUCKETS)
+query_missed = Counter("fdn_monitor_query_missed_total", "Queries that failed or missed the cycle deadline",
+                       ["cluster", "metric"])
+stage_duration = Histogram("fdn_monitor_stage_duration_seconds",
+                           "Duration of the parse, merge, postprocess, serialize and write stages",
+                           ["cluster", "stage"], buckets=LATENCY_BUCKETS)
+sink_write_duration = Histogram("fdn_monitor_sink_write_duration_seconds", "Duration of a batch write of a sink",
+                                ["cluster", "sink"], buckets=LATENCY_BUCKETS)
+cycle_duration = Histogram("fdn_monitor_cycle_duration_seconds", "Duration of a collection cycle",
+                           ["cluster", "groups"], buckets=LATENCY_BUCKETS)
+cycle_overruns = Counter("fdn_monitor_cycle_overruns_total", "Collection cycles that took longer than their period",
+                         ["cluster", "groups"])
+
+loop_lag = Histogram("fdn_monitor_event_loop_lag_seconds", "Delay until a callback scheduled on the event loop runs",
+                     ["cluster"], buckets=LATENCY_BUCKETS)
+slow_callbacks = Counter("fdn_monitor_slow_callbacks_total", "Callbacks blocking the event loop beyond the threshold",
+                         ["cluster", "location"])
+
+
+def set_cluster(name: str) -> None:
+    global cluster_name
+    cluster_name = name
+
+
+def observe_query(duration: float, response_bytes: int) -> None:
+    metric = current_metric.get()
+    query_duration.labels(cluster_name, metric).observe(duration)
+    query_response_bytes.labels(cluster_name, metric).observe(response_bytes)
+
+
+def observe_result(series: int, rows: int) -> None:
+    metric = current_metric.get()
+    query_series.labels(cluster_name, metric).observe(series)
+    query_rows.labels(cluster_name, metric).observe(rows)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """ Observes the duration of the enclosed block as stage duration. """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_duration.labels(cluster_name, stage).observe(time.perf_counter() - started)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+
+class CycleProfiler:
+    """ Profiles the collection event loop for a number of collection cycles on request.
+    A capture requested with `start` begins with the next collection cycle and ends after `cycles` cycles (of any
+    metric group) have finished. Mode 'cprofile' writes a pstats file (readable with pstats, snakeviz), mode
+    'sampling' samples the stack of the event loop thread every `sample_interval` seconds and writes collapsed
+    stacks (readable with flamegraph.pl, speedscope). Only one capture runs at a time.
+    """
+
+    modes = ("cprofile", "sampling")
+
+    def __init__(self, directory: str = "Profiles", sample_interval: float = 0.01):
+        """
+        Args:
+            directory:
+                String - directory the artifacts are written to
+            sample_interval:
+                Float - seconds between two stack samples in sampling mode
+        """
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.lock = threading.Lock()
+
+        # idle -> requested -> running -> idle
+        self.state = "idle"
+        self.mode = None
+        self.remaining_cycles = 0
+        self.started = None
+        self.artifact = None
+
+        self.profile = None
+        self.sampler = None
+        self.stop_sampling = threading.Event()
+        # collapsed stack -> number of samples
+        self.samples = {}
+
+    def start(self, mode: str = "sampling", cycles: int = 1) -> dict:
+        """ Requests a capture of the next collection cycles, called from the control api.
+        Args:
+            mode:
+                String - 'cprofile' or 'sampling'
+            cycles:
+                Integer - collection cycles to capture
+
+        Returns:
+            dict - the status of the profiler
+        """
+        if mode not in self.modes:
+            raise ValueError("unknown profiling mode {}, expected one of {}".format(mode, ", ".join(self.modes)))
+        if cycles < 1:
+            raise ValueError("at least one cycle has to be profiled")
+        with self.lock:
+            if self.state != "idle":
+                raise RuntimeError("a {} capture is already {}".format(self.mode, self.state))
+            self.state = "requested"
+            self.mode = mode
+            self.remaining_cycles = cycles
+            self.artifact = None
+        logging.info("profiling the next %s collection cycles (%s)", cycles, mode)
+        return self.get_status()
+
+    def cycle_started(self) -> None:
+        """ Starts a requested capture, called on the event loop thread at the start of every cycle. """
+        with self.lock:
+            if self.state != "requested":
+                return
+            self.state = "running"
+            self.started = time.time()
+            if self.mode == "cprofile":
+                # cProfile traces the thread it is enabled on, i.e. the event loop
+                self.profile = cProfile.Profile()
+                self.profile.enable()
+            else:
+                self.samples = {}
+                self.stop_sampling.clear()
+                self.sampler = threading.Thread(target=self.sample_forever, args=(threading.get_ident(),),
+                                                daemon=True)
+                self.sampler.start()
+
+    def cycle_finished(self) -> None:
+        """ Counts a finished cycle and writes the artifact after the last one, called on the event loop thread. """
+        with self.lock:
+            if self.state != "running":
+                return
+            self.remaining_cycles -= 1
+            if self.remaining_cycles > 0:
+                return
+            if self.mode == "cprofile":
+                self.profile.disable()
+            else:
+                self.stop_sampling.set()
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, "profile-{}.{}".format(
+            time.strftime('%Y%m%d-%H%M%S', time.gmtime(self.started)),
+            "pstats" if self.mode == "cprofile" else "collapsed"))
+        if self.mode == "cprofile":
+            self.profile.dump_stats(path)
+            self.profile = None
+        else:
+            self.write_collapsed(path)
+
+        with self.lock:
+            self.artifact = path
+            self.state = "idle"
+        logging.info("profile of %.1fs written to %s", time.time() - self.started, path)
+
+    def sample_forever(self, thread_id: int) -> None:
+        while not self.stop_sampling.wait(self.sample_interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w") as collapsed_file:
+            for stack, count in sorted(self.samples.items()):
+                collapsed_file.write("{} {}\n".format(stack, count))
+
+    def get_status(self) -> dict:
+        with self.lock:
+            return {"state": self.state, "mode": self.mode, "remaining_cycles": self.remaining_cycles,
+                    "artifact": self.artifact}
+
+
+class MemoryProfiler:
+    """ Reports the call sites allocating memory between collection cycles using tracemalloc.
+    While tracing, a snapshot is taken at the end of every cycle; the report compares the last two snapshots.
+    Tracing slows down allocations noticeably and should be stopped after the analysis.
+    """
+
+    def __init__(self, frames: int = 10):
+        """
+        Args:
+            frames:
+                Integer - frames stored per traceback of an allocation
+        """
+        self.frames = frames
+        self.lock = threading.Lock()
+        # the last two snapshots, taken at the end of a cycle
+        self.snapshots = []
+
+    def start(self) -> None:
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            self.snapshots = []
+
+    def stop(self) -> None:
+        with self.lock:
+            tracemalloc.stop()
+            self.snapshots = []
+
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def cycle_finished(self) -> None:
+        """ Takes a snapshot while tracing, called on the event loop thread at the end of every cycle. """
+        if not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        with self.lock:
+            self.snapshots = self.snapshots[-1:] + [snapshot]
+
+    def report(self, top: int = 20, key_type: str = "lineno") -> dict:
+        """ Returns the top allocating call sites.
+        Args:
+            top:
+                Integer - number of call sites
+            key_type:
+                String - 'lineno' (line of the allocation) or 'traceback' (full call stack)
+
+        Returns:
+            dict - size and count differences between the last two cycles, or the allocations of the last cycle
+                   if only one snapshot exists
+        """
+        with self.lock:
+            snapshots = list(self.snapshots)
+        if not snapshots:
+            return {"tracing": tracemalloc.is_tracing(), "snapshots": 0, "top": []}
+
+        if len(snapshots) == 2:
+            statistics = snapshots[1].compare_to(snapshots[0], key_type)
+        else:
+            statistics = snapshots[0].statistics(key_type)
+        top_statistics = []
+        for statistic in statistics[:top]:
+            entry = {"traceback": statistic.traceback.format(), "size": statistic.size, "count": statistic.count}
+            if len(snapshots) == 2:
+                entry["size_diff"] = statistic.size_diff
+                entry["count_diff"] = statistic.count_diff
+            top_statistics.append(entry)
+        current, peak = tracemalloc.get_traced_memory()
+        return {"tracing": tracemalloc.is_tracing(), "snapshots": len(snapshots), "traced_bytes": current,
+                "peak_traced_bytes": peak, "top": top_statistics}
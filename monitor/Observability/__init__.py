@@ -0,0 +1,4 @@
+from . import Metrics
+from .Profiler import CycleProfiler, MemoryProfiler
+from .LoopMonitor import LoopMonitor
+from .LogSetup import FrameSummary, SamplingFilter, setup_logging
@@ -1 +1,2 @@
-from .periodic_async_thread import PeriodicAsyncThread
\ No newline at end of file
+from .periodic_async_thread import PeriodicAsyncThread
+from .collection_scheduler import CollectionScheduler, ScheduledCollection
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+
+from .periodic_async_thread import PeriodicAsyncThread
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledCollection:
+    """ A periodic collection of one or more metric groups with the same period, window and resolution. """
+
+    def __init__(self, groups: tuple, period: float, window: int, high_resolution: bool):
+        self.groups = groups
+        self.periodic = PeriodicAsyncThread(period)
+        self.window = window
+        self.high_resolution = high_resolution
+        self.task = None
+        self.stats = {"cycles": 0, "failed_cycles": 0, "overruns": 0, "last_duration": None,
+                      "average_duration": None, "last_finished": None}
+
+    def get_status(self) -> dict:
+        return dict(groups=list(self.groups), period=self.periodic.period, window=self.window,
+                    high_resolution=self.high_resolution, running=self.task is not None and not self.task.done(),
+                    **self.stats)
+
+
+class CollectionScheduler:
+    """ Runs the periodic collections of the metric groups as tasks on the event loop.
+    Collections can be stopped and started, their periods changed and single metric groups disabled while the
+    monitor (and its caches, connections and sink queues) keeps running.
+    """
+
+    def __init__(self, collect_data_obj, deadline_share: float = 0.8):
+        """
+        Args:
+            collect_data_obj:
+                CollectData - provides group_schedule and collect_data
+            deadline_share:
+                Float - share of the period a collection may take before slow queries are cancelled
+        """
+        self.collect_data_obj = collect_data_obj
+        self.deadline_share = deadline_share
+        self.collections = [ScheduledCollection(groups, period, window, high_resolution)
+                            for groups, period, window, high_resolution in collect_data_obj.group_schedule]
+        self.disabled_groups = set()
+        self.running = False
+
+    def start(self) -> None:
+        """ Starts the collections that are not running, on the running event loop. """
+        self.running = True
+        for collection in self.collections:
+            self.start_collection(collection)
+
+    def start_collection(self, collection: ScheduledCollection) -> None:
+        if collection.task is not None and not collection.task.done():
+            return
+        logging.info("collecting %s every %ss over the last %ss (high resolution: %s)", collection.groups,
+                     collection.periodic.period, collection.window, collection.high_resolution)
+        collection.task = asyncio.ensure_future(
+            collection.periodic.invoke_forever(lambda: self.run_cycle(collection)))
+
+    def stop(self) -> None:
+        """ Cancels the collections, a running cycle is cancelled as well. """
+        self.running = False
+        for collection in self.collections:
+            if collection.task is not None:
+                collection.task.cancel()
+                collection.task = None
+
+    async def run_cycle(self, collection: ScheduledCollection) -> None:
+        groups = tuple(group for group in collection.groups if group not in self.disabled_groups)
+        if not groups:
+            return
+        # the period may have been changed since the last cycle
+        period = collection.periodic.period
+        started = time.time()
+        try:
+            await self.collect_data_obj.collect_data(groups, collection.window, collection.high_resolution,
+                                                     period * self.deadline_share, period)
+        except Exception as e:
+            # a failed cycle must not end the periodic collection
+            collection.stats["failed_cycles"] += 1
+            logging.exception("collection of %s failed: %s", groups, e)
+        duration = time.time() - started
+
+        stats = collection.stats
+        stats["cycles"] += 1
+        if duration > period:
+            stats["overruns"] += 1
+        stats["last_duration"] = duration
+        stats["average_duration"] = duration if stats["average_duration"] is None else \
+            0.9 * stats["average_duration"] + 0.1 * duration
+        stats["last_finished"] = time.time()
+
+    def find_collection(self, group: str) -> ScheduledCollection:
+        for collection in self.collections:
+            if group in collection.groups:
+                return collection
+        raise ValueError("unknown metric group {}".format(group))
+
+    def set_period(self, group: str, period: float) -> dict:
+        """ Changes the period of a metric group, effective after the current cycle.
+        A group sharing its collection with other groups gets its own collection.
+        Args:
+            group:
+                String - metric group, e.g. request
+            period:
+                Float - seconds between two collections
+
+        Returns:
+            dict - the status of the collection of the group
+        """
+        if period <= 0:
+            raise ValueError("the period has to be positive")
+        collection = self.find_collection(group)
+        if len(collection.groups) > 1:
+            collection.groups = tuple(other for other in collection.groups if other != group)
+            collection = ScheduledCollection((group,), period, collection.window, collection.high_resolution)
+            self.collections.append(collection)
+            if self.running:
+                self.start_collection(collection)
+        else:
+            collection.periodic.set_period(period)
+        logging.info("collecting %s every %ss", group, period)
+        return collection.get_status()
+
+    def apply_schedule(self, group_schedule: list) -> None:
+        """ Replaces the schedule. Collections of the same groups, window and resolution keep running (with the new
+        period), others are cancelled or started.
+        Args:
+            group_schedule:
+                list - tuples of (groups, period, window, high_resolution)
+        """
+        collections = []
+        for groups, period, window, high_resolution in group_schedule:
+            collection = next((collection for collection in self.collections
+                               if set(collection.groups) == set(groups) and collection.window == window and
+                               collection.high_resolution == high_resolution), None)
+            if collection is None:
+                collection = ScheduledCollection(groups, period, window, high_resolution)
+                if self.running:
+                    self.start_collection(collection)
+            else:
+                self.collections.remove(collection)
+                collection.periodic.set_period(period)
+            collections.append(collection)
+
+        for collection in self.collections:
+            if collection.task is not None:
+                collection.task.cancel()
+            logging.info("stopped collecting %s", collection.groups)
+        self.collections = collections
+
+    def set_enabled(self, group: str, enabled: bool) -> None:
+        """ Enables or disables the collection of a metric group. """
+        self.find_collection(group)
+        if enabled:
+            self.disabled_groups.discard(group)
+        else:
+            self.disabled_groups.add(group)
+        logging.info("collection of %s %s", group, "enabled" if enabled else "disabled")
+
+    def get_status(self) -> dict:
+        return {"running": self.running, "disabled_groups": sorted(self.disabled_groups),
+                "collections": [collection.get_status() for collection in self.collections]}
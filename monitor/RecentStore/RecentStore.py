@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from .SeriesBuffer import SeriesBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class RecentStore:
+    """ Keeps the last hours of every series in memory to answer dashboard and api queries without InfluxDB.
+    A series is a numeric column of the frames of one (data category, cluster, function, node, field); function is ''
+    for system_usage frames, node is '' for frames without a node tag. Each series is a SeriesBuffer of `capacity` points. With a `directory`, the buffers are
+    memory-mapped files listed in an index file, so a restarted monitor serves the recent window right away.
+    The store is not thread safe, frames are added and queries answered on the event loop.
+    """
+
+    index_file = "index.json"
+    # tag columns of a series, the values of the other columns are fields
+    tag_columns = ('cluster_name', 'function_name', 'node')
+    aggregates = {"min": np.min, "max": np.max, "mean": np.mean, "sum": np.sum, "count": len,
+                  "first": lambda values: values[0], "last": lambda values: values[-1]}
+    # seconds between two removals of series without points in the retention window
+    expire_interval = 600
+
+    def __init__(self, capacity: int, retention_seconds: int, directory: str = None):
+        """
+        Args:
+            capacity:
+                Integer - points kept per series, e.g. the retention divided by the collection step
+            retention_seconds:
+                Integer - queries only return points of the last `retention_seconds`
+            directory:
+                String, optional - directory of the memory-mapped buffers
+        """
+        self.capacity = capacity
+        self.retention_seconds = retention_seconds
+        self.directory = directory
+        # (data category, cluster, function, node, field) -> SeriesBuffer
+        self.series_buffers = {}
+        # series key -> file name of its buffer
+        self.files = {}
+        self.last_expiry = time.time()
+        self.stats = {"series": 0, "points_added": 0, "series_expired": 0}
+        if directory is not None:
+            self.load()
+
+    def load(self) -> None:
+        """ Opens the buffers of the index file of the directory. """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, self.index_file)
+        if not os.path.exists(path):
+            return
+        with open(path) as index_file:
+            index = json.load(index_file)
+        for file_name, key in index.items():
+            # keys of an index saved before series were keyed by node have no node
+            key = tuple(key) if len(key) == 5 else tuple(key[:3]) + ('',) + tuple(key[3:])
+            self.files[key] = file_name
+            self.series_buffers[key] = SeriesBuffer(self.capacity, os.path.join(self.directory, file_name))
+        self.stats["series"] = len(self.series_buffers)
+        logging.info("loaded %s recent series from %s", len(self.series_buffers), self.directory)
+
+    def save_index(self) -> None:
+        path = os.path.join(self.directory, self.index_file)
+        with open(path + ".tmp", "w") as index_file:
+            json.dump({file_name: list(key) for key, file_name in self.files.items()}, index_file)
+        os.replace(path + ".tmp", path)
+
+    def get_buffer(self, key: tuple) -> SeriesBuffer:
+        series_buffer = self.series_buffers.get(key)
+        if series_buffer is None:
+            path = None
+            if self.directory is not None:
+                file_name = "series-{}.bin".format(max((int(name[7:-4]) for name in self.files.values()),
+                                                       default=-1) + 1)
+                self.files[key] = file_name
+                path = os.path.join(self.directory, file_name)
+            series_buffer = self.series_buffers[key] = SeriesBuffer(self.capacity, path)
+            if path is not None:
+                self.save_index()
+            self.stats["series"] = len(self.series_buffers)
+        return series_buffer
+
+    def add_frame(self, data_category: str, frame: DataFrame) -> None:
+        """ Adds the numeric columns of a frame indexed by timestamp to their series. """
+        if frame is None or frame.empty:
+            return
+        frame = frame[~frame.index.isna()]
+        timestamps = np.asarray((pd.to_datetime(frame.index, utc=True) - pd.Timestamp(0, tz='UTC')) //
+                                pd.Timedelta(milliseconds=1), dtype=np.int64)
+        frame = frame.reset_index(drop=True).assign(_timestamp=timestamps)
+        fields = [column for column in frame.columns if column not in self.tag_columns + ('_timestamp',)
+                  and pd.api.types.is_numeric_dtype(frame[column])]
+        group_columns = [column for column in self.tag_columns if column in frame.columns]
+        groups = frame.groupby(group_columns, sort=False) if group_columns else [((), frame)]
+
+        for group, rows in groups:
+            labels = dict(zip(group_columns, group if isinstance(group, tuple) else (group,)))
+            rows = rows.sort_values('_timestamp', kind='mergesort')
+            row_timestamps = rows['_timestamp'].values
+            for field in fields:
+                values = rows[field].values.astype(np.float64)
+                present = ~np.isnan(values)
+                timestamps, values = row_timestamps[present], values[present]
+                # one point per timestamp and field, the last row with a value wins
+                last = np.append(timestamps[1:] != timestamps[:-1], True)
+                key = (data_category, str(labels.get('cluster_name', '')), str(labels.get('function_name', '')),
+                       str(labels.get('node', '')), field)
+                self.get_buffer(key).append(timestamps[last], values[last])
+                self.stats["points_added"] += int(last.sum())
+
+        if time.time() - self.last_expiry > self.expire_interval:
+            self.expire()
+
+    def expire(self) -> None:
+        """ Removes the series without points in the retention window, e.g. of deleted functions. """
+        self.last_expiry = time.time()
+        oldest = int((self.last_expiry - self.retention_seconds) * 1000)
+        expired = [key for key, series_buffer in self.series_buffers.items()
+                   if series_buffer.last_timestamp() is None or series_buffer.last_timestamp() < oldest]
+        for key in expired:
+            del self.series_buffers[key]
+            file_name = self.files.pop(key, None)
+            if file_name is not None:
+                os.remove(os.path.join(self.directory, file_name))
+        if expired and self.directory is not None:
+            self.save_index()
+        self.stats["series"] = len(self.series_buffers)
+        self.stats["series_expired"] += len(expired)
+
+    @staticmethod
+    def matches(key: tuple, filters: dict) -> bool:
+        """ Returns if a series key matches the filters of category, cluster, function, node and field.
+        A filter is a collection of accepted values, a missing or empty filter accepts every value.
+        """
+        for position, name in enumerate(("category", "cluster", "function", "node", "field")):
+            accepted = filters.get(name)
+            if accepted and key[position] not in accepted:
+                return False
+        return True
+
+    def select(self, filters: dict = None, start: int = None, end: int = None):
+        """ Yields the series key, timestamps and values of the matching series within [start, end] (ms).
+        Points older than the retention are not returned.
+        """
+        oldest = int((time.time() - self.retention_seconds) * 1000)
+        start = oldest if start is None else max(start, oldest)
+        for key, series_buffer in self.series_buffers.items():
+            if not self.matches(key, filters or {}):
+                continue
+            timestamps, values = series_buffer.range(start, end)
+            if len(timestamps):
+                yield key, timestamps, values
+
+    def series(self, filters: dict = None) -> list:
+        """ Returns the keys, point counts and time ranges of the matching series. """
+        return [dict(self.key_to_dict(key), points=len(timestamps), first=int(timestamps[0]),
+                     last=int(timestamps[-1]))
+                for key, timestamps, values in self.select(filters)]
+
+    def latest(self, filters: dict = None) -> list:
+        """ Returns the last point of the matching series. """
+        return [dict(self.key_to_dict(key), timestamp=int(timestamps[-1]), value=float(values[-1]))
+                for key, timestamps, values in self.select(filters)]
+
+    def range(self, filters: dict = None, start: int = None, end: int = None) -> list:
+        """ Returns the points of the matching series within [start, end] (ms). """
+        return [dict(self.key_to_dict(key), timestamps=timestamps.tolist(), values=values.tolist())
+                for key, timestamps, values in self.select(filters, start, end)]
+
+    def aggregate(self, function: str, filters: dict = None, start: int = None, end: int = None) -> list:
+        """ Returns one aggregate (min, max, mean, sum, count, first or last) per matching series within
+        [start, end] (ms).
+        """
+        if function not in self.aggregates:
+            raise ValueError("unknown aggregate {}, expected one of {}".format(function, ", ".join(self.aggregates)))
+        aggregate = self.aggregates[function]
+        return [dict(self.key_to_dict(key), value=float(aggregate(values)), points=len(values))
+                for key, timestamps, values in self.select(filters, start, end)]
+
+    def to_arrow(self, filters: dict = None, start: int = None, end: int = None):
+        """ Returns the points of the matching series as a pyarrow Table in long format. """
+        import pyarrow as pa
+
+        keys, timestamps, values = [], [], []
+        for key, series_timestamps, series_values in self.select(filters, start, end):
+            keys.append((key, len(series_timestamps)))
+            timestamps.append(series_timestamps)
+            values.append(series_values)
+        columns = {}
+        for position, name in enumerate(("category", "cluster_name", "function_name", "node", "field")):
+            columns[name] = pa.DictionaryArray.from_arrays(
+                pa.array(np.repeat(np.arange(len(keys), dtype=np.int32), [count for _, count in keys])),
+                pa.array([key[position] for key, _ in keys], type=pa.string()))
+        columns["timestamp"] = pa.array(np.concatenate(timestamps) if timestamps else np.array([], dtype=np.int64),
+                                        type=pa.timestamp('ms', tz='UTC'))
+        columns["value"] = pa.array(np.concatenate(values) if values else np.array([], dtype=np.float64))
+        return pa.table(columns)
+
+    @staticmethod
+    def key_to_dict(key: tuple) -> dict:
+        return {"category": key[0], "cluster_name": key[1], "function_name": key[2], "node": key[3], "field": key[4]}
+
+    def flush(self) -> None:
+        for series_buffer in self.series_buffers.values():
+            series_buffer.flush()
+
+    def get_stats(self) -> dict:
+        return dict(self.stats)
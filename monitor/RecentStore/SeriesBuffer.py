@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SeriesBuffer:
+    """ Fixed size ring buffer of the most recent points of one series.
+    Timestamps (int64, ms) and values (float64) are kept in two preallocated arrays, ordered by time. With a `path`,
+    the arrays live in a memory-mapped file, so the buffer is available again right after a restart.
+    """
+
+    # start and size of the ring, followed by the timestamps and the values
+    header_length = 2
+
+    def __init__(self, capacity: int, path: str = None):
+        """
+        Args:
+            capacity:
+                Integer - points kept, the oldest point is overwritten by a newer one
+            path:
+                String, optional - file backing the buffer
+        """
+        self.capacity = capacity
+        self.path = path
+        length = self.header_length + 2 * capacity
+        if path is None:
+            storage = np.zeros(length, dtype=np.int64)
+        else:
+            size = length * 8
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                logging.warning("discarding %s, it was written with another capacity", path)
+                os.remove(path)
+            storage = np.memmap(path, dtype=np.int64, mode="r+" if os.path.exists(path) else "w+", shape=(length,))
+        self.storage = storage
+        self.header = storage[:self.header_length]
+        self.timestamps = storage[self.header_length:self.header_length + capacity]
+        # the values share the file with the timestamps, viewed as float64
+        self.values = storage[self.header_length + capacity:].view(np.float64)
+
+    def __len__(self) -> int:
+        return int(self.header[1])
+
+    def positions(self) -> np.ndarray:
+        """ Returns the array positions of the points from the oldest to the newest. """
+        start, size = int(self.header[0]), int(self.header[1])
+        return (start + np.arange(size)) % self.capacity
+
+    def last_timestamp(self) -> int:
+        size = int(self.header[1])
+        if size == 0:
+            return None
+        return int(self.timestamps[(int(self.header[0]) + size - 1) % self.capacity])
+
+    def append(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """ Adds points sorted by timestamp. Points newer than the last point are appended, points with the timestamp
+        of a buffered point replace its value (overlapping collection windows), older points are ignored.
+        Args:
+            timestamps:
+                ndarray - int64 timestamps in ms, ascending
+            values:
+                ndarray - float64 values
+        """
+        last_timestamp = self.last_timestamp()
+        if last_timestamp is not None:
+            positions = self.positions()
+            buffered = self.timestamps[positions]
+            old = timestamps <= last_timestamp
+            matches = np.searchsorted(buffered, timestamps[old])
+            found = matches < len(buffered)
+            found[found] = buffered[matches[found]] == timestamps[old][found]
+            self.values[positions[matches[found]]] = values[old][found]
+            timestamps, values = timestamps[~old], values[~old]
+
+        # only the newest `capacity` points fit
+        timestamps, values = timestamps[-self.capacity:], values[-self.capacity:]
+        if len(timestamps) == 0:
+            return
+        start, size = int(self.header[0]), int(self.header[1])
+        positions = (start + size + np.arange(len(timestamps))) % self.capacity
+        self.timestamps[positions] = timestamps
+        self.values[positions] = values
+        overflow = max(size + len(timestamps) - self.capacity, 0)
+        self.header[0] = (start + overflow) % self.capacity
+        self.header[1] = size + len(timestamps) - overflow
+
+    def range(self, start: int = None, end: int = None) -> tuple:
+        """ Returns copies of the timestamps and values within [start, end] (ms). """
+        positions = self.positions()
+        timestamps = self.timestamps[positions]
+        first = 0 if start is None else np.searchsorted(timestamps, start, side="left")
+        last = len(timestamps) if end is None else np.searchsorted(timestamps, end, side="right")
+        positions = positions[first:last]
+        return self.timestamps[positions], self.values[positions]
+
+    def flush(self) -> None:
+        if isinstance(self.storage, np.memmap):
+            self.storage.flush()
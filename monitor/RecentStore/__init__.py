@@ -0,0 +1,2 @@
+from .SeriesBuffer import SeriesBuffer
+from .RecentStore import RecentStore
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+import math
+
+import numpy as np
+
+
+class LatencySketch:
+    """ Mergeable quantile sketch with a relative error guarantee (logarithmic buckets as in DDSketch).
+    A value v is counted in bucket ceil(log_gamma(v)) with gamma = (1 + a) / (1 - a), so every quantile is returned
+    within a relative error of a. Sketches of the same accuracy are merged by adding their bucket counts, which
+    allows to build the quantiles of an hour from the sketches of its 5 minute rollups.
+    """
+
+    # values at or below are counted as zero
+    min_value = 1e-9
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        """
+        Args:
+            relative_accuracy:
+                Float - relative error of the quantiles, e.g. 0.01 for 1%
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # bucket index -> count
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        positive = values > self.min_value
+        self.zero_count += int(len(values) - positive.sum())
+        indices, counts = np.unique(np.ceil(np.log(values[positive]) / self.log_gamma).astype(np.int64),
+                                    return_counts=True)
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += len(values)
+
+    def merge(self, other: "LatencySketch") -> None:
+        if other.gamma != self.gamma:
+            raise ValueError("sketches of different accuracy cannot be merged")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def to_state(self) -> list:
+        """ Returns the counts as JSON serializable [zero count, count, [[bucket index, count], ...]]. """
+        return [self.zero_count, self.count, [[index, count] for index, count in self.bins.items()]]
+
+    def load_state(self, state: list) -> None:
+        self.zero_count, self.count = int(state[0]), int(state[1])
+        self.bins = {int(index): int(count) for index, count in state[2]}
+
+    def quantile(self, q: float) -> float:
+        """ Returns the q-quantile (0 <= q <= 1) of the added values, NaN without values. """
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        cumulative = self.zero_count
+        if rank < cumulative:
+            return 0.0
+        for index in sorted(self.bins):
+            cumulative += self.bins[index]
+            if cumulative > rank:
+                # the value in the middle (relative to gamma) of the bucket
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
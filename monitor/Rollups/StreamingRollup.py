@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+import json
+import logging
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from .LatencySketch import LatencySketch
+
+logger = logging.getLogger(__name__)
+
+
+class RollupAggregate:
+    """ Count, sum, minimum and maximum (and for latency fields a LatencySketch) of the points of one series in one
+    rollup interval. Aggregates of the same series are merged into the aggregate of a coarser interval.
+    """
+
+    __slots__ = ("count", "sum", "min", "max", "sketch")
+    quantiles = (0.5, 0.9, 0.99)
+
+    def __init__(self, sketch: LatencySketch = None):
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = sketch
+
+    def update(self, values: np.ndarray) -> None:
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        if self.sketch is not None:
+            self.sketch.add(values)
+
+    def merge(self, other: "RollupAggregate") -> None:
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if self.sketch is not None and other.sketch is not None:
+            self.sketch.merge(other.sketch)
+
+    def to_state(self) -> list:
+        """ Returns the aggregate as JSON serializable [count, sum, min, max, sketch state or None]. """
+        return [self.count, self.sum, self.min, self.max, self.sketch.to_state() if self.sketch is not None else None]
+
+    def load_state(self, state: list) -> None:
+        self.count, self.sum, self.min, self.max = int(state[0]), float(state[1]), float(state[2]), float(state[3])
+        if self.sketch is not None and state[4] is not None:
+            self.sketch.load_state(state[4])
+
+    def fields(self, field: str) -> dict:
+        """ Returns the rollup fields of a field, e.g. replicas_min, replicas_mean and for latencies
+        average_execution_time_p99.
+        """
+        fields = {field + "_min": self.min, field + "_max": self.max, field + "_mean": self.sum / self.count,
+                  field + "_sum": self.sum, field + "_count": self.count}
+        if self.sketch is not None:
+            for q in self.quantiles:
+                fields["{}_p{}".format(field, int(q * 100))] = self.sketch.quantile(q)
+        return fields
+
+
+class StreamingRollup:
+    """ Maintains rollups of the collected series while the frames flow through the monitor.
+    Points are aggregated into 5 minute intervals per series (data category, cluster, function, node, field). Once
+    the newest point of a data category is `grace` seconds past the end of an interval, the interval is closed: it
+    is returned by `flush` and merged into its 1 hour interval, which is closed the same way. Points at or before
+    the newest point of their series (overlapping collection windows) and points of closed intervals are ignored.
+    The open intervals are saved to a JSON snapshot, so they are continued after a restart. Without a recent
+    snapshot, intervals that started before the rollup was created miss points and are not returned by `flush`.
+    """
+
+    # (name, seconds), every interval is merged from the closed intervals of the previous one
+    resolutions = (("5m", 300), ("1h", 3600))
+    tag_columns = ("cluster_name", "function_name", "node")
+
+    def __init__(self, grace: float = 300, latency_fields=(), relative_accuracy: float = 0.01, path: str = None,
+                 save_interval: float = 60):
+        """
+        Args:
+            grace:
+                Float - seconds after the end of an interval before it is closed, at least the collection window
+            latency_fields:
+                Iterable - fields whose quantiles are tracked with a LatencySketch, e.g. ['average_execution_time']
+            relative_accuracy:
+                Float - relative error of the quantiles
+            path:
+                String, optional - JSON snapshot of the open intervals, kept in memory only without
+            save_interval:
+                Float - seconds between two saves of the snapshot
+        """
+        self.grace = int(grace * 1000)
+        self.latency_fields = set(latency_fields)
+        self.relative_accuracy = relative_accuracy
+        # (data category, tags, field) -> timestamp (ms) of the newest point
+        self.last_seen = {}
+        # data category -> timestamp (ms) of its newest point
+        self.watermarks = {}
+        # resolution name -> {(data category, interval start): {(tags, field): RollupAggregate}}
+        self.intervals = {name: {} for name, _ in self.resolutions}
+        # (resolution name, data category) -> start of the first interval that is not closed
+        self.closed_until = {}
+        self.stats = {"points": 0, "late_points": 0, "intervals_flushed": 0, "partial_intervals_dropped": 0}
+        self.path = path
+        self.save_interval = save_interval
+        self.last_save = time.time()
+        # intervals starting before are incomplete, the points collected before the start are missing
+        self.complete_from = int(time.time() * 1000)
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def new_aggregate(self, field: str) -> RollupAggregate:
+        return RollupAggregate(LatencySketch(self.relative_accuracy) if field in self.latency_fields else None)
+
+    def add_frame(self, data_category: str, frame: DataFrame) -> None:
+        """ Adds the numeric columns of a frame indexed by timestamp to the open 5 minute intervals. """
+        if frame is None or frame.empty:
+            return
+        timestamps = np.asarray((pd.to_datetime(frame.index, utc=True) - pd.Timestamp(0, tz='UTC')) //
+                                pd.Timedelta(milliseconds=1), dtype=np.int64)
+        tag_columns = [column for column in self.tag_columns if column in frame.columns]
+        fields = [column for column in frame.columns
+                  if column not in tag_columns and pd.api.types.is_numeric_dtype(frame[column])]
+        if tag_columns:
+            groups = frame.reset_index(drop=True).groupby(tag_columns, sort=False, dropna=False).indices
+        else:
+            groups = {(): np.arange(len(frame))}
+        name, seconds = self.resolutions[0]
+        length = seconds * 1000
+        intervals = self.intervals[name]
+        closed_until = self.closed_until.get((name, data_category), -1)
+
+        for group, positions in groups.items():
+            tags = tuple(zip(tag_columns, (str(tag) for tag in (group if isinstance(group, tuple) else (group,)))))
+            positions = positions[np.argsort(timestamps[positions], kind='stable')]
+            group_timestamps = timestamps[positions]
+            for field in fields:
+                values = frame[field].values[positions].astype(np.float64)
+                key = (data_category, tags, field)
+                new = ~np.isnan(values) & (group_timestamps > self.last_seen.get(key, -1))
+                if not new.any():
+                    continue
+                series_timestamps, values = group_timestamps[new], values[new]
+                self.last_seen[key] = int(series_timestamps[-1])
+                starts = series_timestamps - series_timestamps % length
+                late = starts < closed_until
+                if late.any():
+                    self.stats["late_points"] += int(late.sum())
+                    starts, values = starts[~late], values[~late]
+                self.stats["points"] += len(values)
+                # the timestamps are sorted, so every interval is a contiguous slice
+                unique_starts, offsets = np.unique(starts, return_index=True)
+                for start, values_of_interval in zip(unique_starts.tolist(), np.split(values, offsets[1:])):
+                    aggregates = intervals.setdefault((data_category, start), {})
+                    aggregate = aggregates.get((tags, field))
+                    if aggregate is None:
+                        aggregate = aggregates[(tags, field)] = self.new_aggregate(field)
+                    aggregate.update(values_of_interval)
+            if len(group_timestamps):
+                self.watermarks[data_category] = max(self.watermarks.get(data_category, -1),
+                                                     int(group_timestamps[-1]))
+
+    def flush(self) -> list:
+        """ Closes the intervals that ended `grace` before the newest point of their data category.
+        Returns:
+            list - tuples of (resolution name, data category, DataFrame indexed by the interval start with the tag
+            columns and the rollup fields of every series)
+        """
+        closed = []
+        for position, (name, seconds) in enumerate(self.resolutions):
+            length = seconds * 1000
+            intervals = self.intervals[name]
+            for data_category, start in sorted(intervals):
+                if start + length + self.grace > self.watermarks.get(data_category, -1):
+                    continue
+                aggregates = intervals.pop((data_category, start))
+                self.closed_until[(name, data_category)] = max(self.closed_until.get((name, data_category), -1),
+                                                               start + length)
+                if start < self.complete_from:
+                    self.stats["partial_intervals_dropped"] += 1
+                else:
+                    closed.append((name, data_category, self.to_frame(start, aggregates)))
+                    self.stats["intervals_flushed"] += 1
+                if position + 1 < len(self.resolutions):
+                    self.merge_into(self.resolutions[position + 1], data_category, start, aggregates)
+
+        # series without points in open intervals, e.g. of deleted functions; their older points would be late anyway
+        name = self.resolutions[0][0]
+        self.last_seen = {key: timestamp for key, timestamp in self.last_seen.items()
+                          if timestamp >= self.closed_until.get((name, key[0]), -1)}
+        if time.time() - self.last_save >= self.save_interval:
+            self.save()
+        return closed
+
+    def merge_into(self, resolution: tuple, data_category: str, start: int, aggregates: dict) -> None:
+        """ Merges the aggregates of a closed interval into the interval of the coarser resolution. """
+        name, seconds = resolution
+        start -= start % (seconds * 1000)
+        if start < self.closed_until.get((name, data_category), -1):
+            self.stats["late_points"] += sum(aggregate.count for aggregate in aggregates.values())
+            return
+        coarse_aggregates = self.intervals[name].setdefault((data_category, start), {})
+        for key, aggregate in aggregates.items():
+            coarse_aggregate = coarse_aggregates.get(key)
+            if coarse_aggregate is None:
+                coarse_aggregate = coarse_aggregates[key] = self.new_aggregate(key[1])
+            coarse_aggregate.merge(aggregate)
+
+    @staticmethod
+    def to_frame(start: int, aggregates: dict) -> DataFrame:
+        rows = {}
+        for (tags, field), aggregate in aggregates.items():
+            rows.setdefault(tags, {}).update(aggregate.fields(field))
+        frame = DataFrame([dict(tags, **fields) for tags, fields in rows.items()])
+        frame.index = pd.DatetimeIndex([pd.Timestamp(start, unit='ms')] * len(frame), name='timestamp')
+        return frame
+
+    def save(self) -> None:
+        """ Saves the open intervals and the newest point of every series. The points collected after the save are
+        collected again by the overlapping window of the first cycle after a restart.
+        """
+        self.last_save = time.time()
+        if self.path is None:
+            return
+        state = {
+            "saved_at": self.last_save,
+            "complete_from": self.complete_from,
+            "last_seen": [[data_category, tags, field, timestamp]
+                          for (data_category, tags, field), timestamp in self.last_seen.items()],
+            "watermarks": self.watermarks,
+            "closed_until": [[name, data_category, start] for (name, data_category), start in self.closed_until.items()],
+            "intervals": {name: [[data_category, start, [[tags, field, aggregate.to_state()]
+                                                         for (tags, field), aggregate in aggregates.items()]]
+                                 for (data_category, start), aggregates in intervals.items()]
+                          for name, intervals in self.intervals.items()}
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # written to a temporary file first, a crash never leaves a truncated file
+        temporary_path = self.path + ".tmp"
+        try:
+            with open(temporary_path, "w") as file:
+                json.dump(state, file)
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            logging.warning("could not save the rollups to %s: %s", self.path, repr(e))
+
+    def load(self) -> None:
+        """ Continues the open intervals of a snapshot saved at most `grace` before, older snapshots miss points
+        the first collection window does not cover.
+        """
+        try:
+            with open(self.path) as file:
+                state = json.load(file)
+            if time.time() - state["saved_at"] > self.grace / 1000:
+                logging.warning("ignoring the rollups in %s, saved %.0fs ago", self.path,
+                                time.time() - state["saved_at"])
+                return
+            intervals = {name: {} for name, _ in self.resolutions}
+            for name, saved_intervals in state["intervals"].items():
+                for data_category, start, aggregates in saved_intervals:
+                    restored = intervals[name][(data_category, int(start))] = {}
+                    for tags, field, aggregate_state in aggregates:
+                        aggregate = restored[(tuple(tuple(tag) for tag in tags), field)] = self.new_aggregate(field)
+                        aggregate.load_state(aggregate_state)
+            self.last_seen = {(data_category, tuple(tuple(tag) for tag in tags), field): int(timestamp)
+                              for data_category, tags, field, timestamp in state["last_seen"]}
+        except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+            logging.warning("ignoring the rollups in %s: %s", self.path, repr(e))
+            return
+        self.intervals = intervals
+        self.watermarks = {data_category: int(timestamp) for data_category, timestamp in state["watermarks"].items()}
+        self.closed_until = {(name, data_category): int(start) for name, data_category, start in state["closed_until"]}
+        self.complete_from = int(state["complete_from"])
+        logging.info("continuing %s open rollup intervals from %s",
+                     sum(len(intervals) for intervals in self.intervals.values()), self.path)
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, series=len(self.last_seen),
+                    open_intervals=sum(len(intervals) for intervals in self.intervals.values()))
@@ -0,0 +1,2 @@
+from .LatencySketch import LatencySketch
+from .StreamingRollup import StreamingRollup, RollupAggregate
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+import asyncio
+import functools
+from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BaseSink:
+    """Abstract Sink class
+    A sink receives the frames of the collection cycles from a SinkFanout. Each frame is a tuple of
+    (data category, DataFrame) with the data category 'functions_usage' or 'system_usage'.
+    """
+
+    # name used in logs and stats
+    name = "sink"
+    # maximum number of frames passed to one write call
+    batch_size = 10
+    # single worker thread of run_blocking, created on first use
+    executor = None
+
+    @abstractmethod
+    async def write(self, frames: list) -> None:
+        """ Writes a batch of frames.
+        Args:
+            frames:
+                list - tuples of (data category, DataFrame)
+        """
+        pass
+
+    async def close(self) -> None:
+        await self.shutdown_executor()
+
+    async def run_blocking(self, function, *args, **kwargs):
+        """ Runs blocking IO in the worker thread of the sink, so a slow sink does not block the event loop.
+        A call cancelled by the write timeout of the fanout keeps running in the thread and the next call only starts
+        after it returned, so the state of a sink is never changed by two threads at once.
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sink-" + self.name)
+        return await asyncio.get_event_loop().run_in_executor(self.executor,
+                                                              functools.partial(function, *args, **kwargs))
+
+    async def shutdown_executor(self) -> None:
+        """ Waits for the running call of the worker thread without blocking the event loop. """
+        if self.executor is not None:
+            executor, self.executor = self.executor, None
+            await asyncio.get_event_loop().run_in_executor(None, executor.shutdown)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeFilter:
+    """ Removes the unchanged points of gauge fields before they are written.
+    Fields like pods-cpu-limits or replicas keep their value for hours. For every series (data category, tags,
+    field) the last written value is remembered; a point is only kept when its value differs from it or the last
+    written point is at least `heartbeat` seconds old, so a query over the heartbeat interval still finds a value.
+    Points at or before the last timestamp seen of a series are dropped as well, they have been decided by a
+    previous cycle with an overlapping window. Removed points are set to NaN, which InfluxDB writers omit.
+    """
+
+    def __init__(self, fields, heartbeat: float = 300):
+        """
+        Args:
+            fields:
+                Iterable - names of the gauge fields, e.g. ['replicas', 'pods-cpu-limits']
+            heartbeat:
+                Float - seconds after which an unchanged value is written again
+        """
+        self.fields = set(fields)
+        self.heartbeat = int(heartbeat * 1000)
+        # series key -> [last written value, its timestamp (ms), last timestamp seen (ms)]
+        self.last_points = {}
+        self.last_expiry = time.time()
+        self.stats = {"points": 0, "suppressed": 0}
+
+    def filter(self, data_category: str, frame: DataFrame) -> DataFrame:
+        """ Returns a copy of a frame indexed by timestamp without the unchanged points of the gauge fields. """
+        fields = [column for column in frame.columns if column in self.fields]
+        if not fields or frame.empty:
+            return frame
+        tag_columns = [column for column in frame.columns if not pd.api.types.is_numeric_dtype(frame[column])]
+        timestamps = np.asarray((pd.to_datetime(frame.index, utc=True) - pd.Timestamp(0, tz='UTC')) //
+                                pd.Timedelta(milliseconds=1), dtype=np.int64)
+        # the frame is shared with the other sinks
+        frame = frame.copy()
+        if tag_columns:
+            groups = frame.reset_index(drop=True).groupby(tag_columns, sort=False, dropna=False).indices
+        else:
+            groups = {(): np.arange(len(frame))}
+
+        for field in fields:
+            values = frame[field].values.astype(np.float64)
+            suppressed = np.zeros(len(frame), dtype=bool)
+            for group, positions in groups.items():
+                key = (data_category, group if isinstance(group, tuple) else (group,), field)
+                state = self.last_points.get(key)
+                for position in positions[np.argsort(timestamps[positions], kind='stable')].tolist():
+                    value, timestamp = values[position], timestamps[position]
+                    if np.isnan(value):
+                        continue
+                    self.stats["points"] += 1
+                    if state is None:
+                        state = self.last_points[key] = [value, timestamp, timestamp]
+                    elif timestamp <= state[2]:
+                        suppressed[position] = True
+                    else:
+                        state[2] = timestamp
+                        if value == state[0] and timestamp - state[1] < self.heartbeat:
+                            suppressed[position] = True
+                        else:
+                            state[0], state[1] = value, timestamp
+            if suppressed.any():
+                values[suppressed] = np.nan
+                frame[field] = values
+                self.stats["suppressed"] += int(suppressed.sum())
+
+        if time.time() - self.last_expiry > self.heartbeat / 1000:
+            self.expire()
+        return frame
+
+    def expire(self) -> None:
+        """ Forgets the series whose next point is written anyway, e.g. of deleted functions. """
+        self.last_expiry = time.time()
+        oldest = int(self.last_expiry * 1000) - self.heartbeat
+        self.last_points = {key: state for key, state in self.last_points.items() if state[1] >= oldest}
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, series=len(self.last_points))
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+from InfluxDBWriter import InfluxDBWriter
+from .BaseSink import BaseSink
+from .ChangeFilter import ChangeFilter
+
+
+class InfluxDBSink(BaseSink):
+    """ Writes the frames to InfluxDB through the spool of an InfluxDBWriter.
+    With a ChangeFilter, unchanged points of gauge fields are not written.
+    """
+
+    name = "influxdb"
+
+    def __init__(self, writer: InfluxDBWriter, change_filter: ChangeFilter = None):
+        self.writer = writer
+        self.change_filter = change_filter
+
+    def write_frames(self, frames: list) -> None:
+        for data_category, frame in frames:
+            if self.change_filter is not None:
+                frame = self.change_filter.filter(data_category, frame)
+            self.writer.write_dataframe_influxdb(frame, data_category)
+
+    async def write(self, frames: list) -> None:
+        await self.run_blocking(self.write_frames, frames)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+import glob
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame
+
+from .BaseSink import BaseSink
+
+logger = logging.getLogger(__name__)
+
+
+class ParquetSink(BaseSink):
+    """ Writes the frames to a local Parquet dataset for offline analysis.
+    The dataset is hive partitioned as <data category>/cluster_name=<name>/date=<YYYY-MM-DD>/hour=<HH>, so
+    readers like pyarrow.dataset or DuckDB can prune partitions and push predicates down to the row group
+    statistics. Tag columns are dictionary encoded and files are zstd compressed.
+    Every write adds a small file. Once an hour is closed, its files are compacted into one file without the
+    duplicate points written by overlapping collection windows.
+    """
+
+    name = "parquet"
+    tag_columns = ('function_name', 'measurement_category')
+    partition_columns = ('cluster_name', 'date', 'hour')
+
+    def __init__(self, directory: str = "Parquet", row_group_size: int = 128 * 1024, compression: str = "zstd",
+                 compact_min_files: int = 2, compact_grace: int = 15 * 60):
+        """
+        Args:
+            directory:
+                String - root directory of the dataset
+            row_group_size:
+                Integer - maximum rows per row group
+            compression:
+                String - parquet compression codec
+            compact_min_files:
+                Integer - a closed partition is compacted when it holds at least this many files
+            compact_grace:
+                Integer - seconds after the end of an hour before its partition is compacted (late points)
+        """
+        self.directory = directory
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.compact_min_files = compact_min_files
+        self.compact_grace = compact_grace
+        # partition directory -> end of its hour, partitions written since their last compaction
+        self.dirty_partitions = {}
+        self.stats = {"files_written": 0, "rows_written": 0, "partitions_compacted": 0}
+        self.scan_partitions()
+
+    def scan_partitions(self) -> None:
+        """ Marks the partitions left with several files by a previous run as dirty, so they are compacted once
+        they are closed. """
+        pattern = os.path.join(self.directory, "*", "cluster_name=*", "date=*", "hour=*")
+        for partition_directory in glob.glob(pattern):
+            if len(glob.glob(os.path.join(partition_directory, "part-*.parquet"))) < self.compact_min_files:
+                continue
+            date = os.path.basename(os.path.dirname(partition_directory))[len("date="):]
+            hour = os.path.basename(partition_directory)[len("hour="):]
+            try:
+                hour_start = datetime.strptime(date + hour, '%Y-%m-%d%H')
+            except ValueError:
+                continue
+            self.dirty_partitions[partition_directory] = hour_start + timedelta(hours=1)
+        if self.dirty_partitions:
+            logging.info("found %s uncompacted partitions in %s", len(self.dirty_partitions), self.directory)
+
+    async def write(self, frames: list) -> None:
+        await self.run_blocking(self.write_frames, frames)
+
+    def write_frames(self, frames: list) -> None:
+        for data_category, frame in frames:
+            frame = frame.reset_index()
+            timestamps = pd.to_datetime(frame['timestamp'])
+            frame['date'] = timestamps.dt.strftime('%Y-%m-%d')
+            frame['hour'] = timestamps.dt.strftime('%H')
+            for (cluster_name, date, hour), partition in frame.groupby(list(self.partition_columns)):
+                partition_directory = os.path.join(self.directory, data_category, "cluster_name=" + str(cluster_name),
+                                                   "date=" + date, "hour=" + hour)
+                self.write_file(partition_directory, partition.drop(columns=list(self.partition_columns)))
+                self.dirty_partitions[partition_directory] = datetime.strptime(date + hour, '%Y-%m-%d%H') + \
+                    timedelta(hours=1)
+        self.compact_closed_partitions()
+
+    def to_table(self, frame: DataFrame) -> pa.Table:
+        frame = frame.copy()
+        for column in self.tag_columns:
+            if column in frame.columns:
+                frame[column] = frame[column].astype(str).astype('category')
+        return pa.Table.from_pandas(frame, preserve_index=False)
+
+    def write_file(self, partition_directory: str, frame: DataFrame, name: str = None) -> None:
+        os.makedirs(partition_directory, exist_ok=True)
+        if name is None:
+            name = "part-{}-{}.parquet".format(int(time.time() * 1000), uuid.uuid4().hex[:8])
+        table = self.to_table(frame)
+        dictionary_columns = [column for column in self.tag_columns if column in table.column_names]
+        # written under a temporary name, readers never see partial files
+        temporary_path = os.path.join(partition_directory, "." + name + ".tmp")
+        pq.write_table(table, temporary_path, row_group_size=self.row_group_size, compression=self.compression,
+                       use_dictionary=dictionary_columns if dictionary_columns else False, write_statistics=True)
+        os.replace(temporary_path, os.path.join(partition_directory, name))
+        self.stats["files_written"] += 1
+        self.stats["rows_written"] += len(frame)
+
+    def compact_closed_partitions(self) -> None:
+        closed_before = datetime.utcnow() - timedelta(seconds=self.compact_grace)
+        for partition_directory, hour_end in list(self.dirty_partitions.items()):
+            if hour_end > closed_before:
+                continue
+            try:
+                self.compact(partition_directory)
+            except Exception as e:
+                logging.error("compacting %s failed: %s", partition_directory, e)
+            del self.dirty_partitions[partition_directory]
+
+    def compact(self, partition_directory: str) -> None:
+        """ Merges the files of a partition into one file sorted by timestamp, combining duplicate points. """
+        paths = sorted(glob.glob(os.path.join(partition_directory, "part-*.parquet")))
+        if len(paths) < self.compact_min_files:
+            return
+
+        # files are named by write time, later files hold the more complete values of a point. The metric groups
+        # write separate files with different columns for the same point, so the last non-null value of every
+        # column is kept instead of the last row
+        frame = pd.concat([pq.read_table(path).to_pandas() for path in paths], ignore_index=True)
+        keys = ['timestamp'] + [column for column in self.tag_columns if column in frame.columns]
+        frame = frame.groupby(keys, sort=True, observed=True, dropna=False).last().reset_index()
+
+        self.write_file(partition_directory, frame, "part-{}-compacted.parquet".format(int(time.time() * 1000)))
+        for path in paths:
+            os.remove(path)
+        self.stats["partitions_compacted"] += 1
+        logging.debug("compacted %s files of %s, %s rows", len(paths), partition_directory, len(frame))
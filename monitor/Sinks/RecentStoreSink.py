@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+import logging
+
+from RecentStore import RecentStore
+
+from .BaseSink import BaseSink
+
+logger = logging.getLogger(__name__)
+
+
+class RecentStoreSink(BaseSink):
+    """ Adds the frames to a RecentStore, which answers the /recent queries of the control api.
+    Frames are added on the event loop, the store is not shared with other threads.
+    """
+
+    name = "recent_store"
+
+    def __init__(self, store: RecentStore):
+        """
+        Args:
+            store:
+                RecentStore - in-memory store of the recent points
+        """
+        self.store = store
+
+    async def write(self, frames: list) -> None:
+        for data_category, frame in frames:
+            self.store.add_frame(data_category, frame)
+
+    async def close(self) -> None:
+        self.store.flush()
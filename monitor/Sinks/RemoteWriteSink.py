@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+import asyncio
+import logging
+import re
+import struct
+import time
+import zlib
+
+import aiohttp
+import cramjam
+import pandas as pd
+
+from .BaseSink import BaseSink
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteWriteError(Exception):
+    """ Raised for responses of the remote-write endpoint that should be retried. """
+    pass
+
+
+class RemoteWriteSink(BaseSink):
+    """ Sends the frames to a Prometheus remote-write endpoint (Prometheus, Mimir, Cortex, Thanos receive).
+    Every numeric column becomes a metric 'fdn_<column>' (e.g. fdn_average_execution_time) labelled by the string
+    columns of the frame (cluster_name, function_name, ...). Series are sharded by their labels over parallel
+    senders, so the samples of a series are always sent in order by the same shard. Each shard sends
+    snappy compressed protobuf WriteRequests of at most `batch_size` samples and retries on 5xx and 429. The series
+    are built and the WriteRequests encoded in the worker thread of the sink, only the requests run on the event loop.
+    Samples already sent for a series (overlapping collection windows) are skipped; series without a sample within
+    `max_age` seconds are forgotten, e.g. of functions that were removed.
+    """
+
+    name = "remote_write"
+    metric_prefix = "fdn_"
+
+    def __init__(self, url: str, shards: int = 4, batch_size: int = 2000, max_retries: int = 3,
+                 retry_backoff: float = 1.0, timeout: float = 30.0, headers: dict = None, max_age: int = 3600):
+        """
+        Args:
+            url:
+                String - remote-write url, e.g. http://mimir:9009/api/v1/push
+            shards:
+                Integer - parallel senders
+            batch_size:
+                Integer - maximum samples per WriteRequest
+            max_retries:
+                Integer - retries of a failed WriteRequest
+            retry_backoff:
+                Float - seconds before the first retry, doubled for every further retry
+            timeout:
+                Float - seconds a request may take
+            headers:
+                dict, optional - additional http headers (e.g. Authorization, X-Scope-OrgID)
+            max_age:
+                Integer - seconds the last sent sample of a series is remembered, at least the longest collection
+                window
+        """
+        self.url = url
+        self.shards = shards
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.headers = {"Content-Encoding": "snappy", "Content-Type": "application/x-protobuf",
+                        "X-Prometheus-Remote-Write-Version": "0.1.0"}
+        self.headers.update(headers or {})
+        self.session = None
+        # series labels -> timestamp (ms) of the last sample sent
+        self.last_sent = {}
+        self.max_age = max_age
+        self.last_eviction = time.time()
+        self.stats = {"samples_sent": 0, "samples_skipped": 0, "requests": 0, "retries": 0, "failed_requests": 0,
+                      "series_evicted": 0}
+
+    @classmethod
+    def metric_name(cls, column: str) -> str:
+        return cls.metric_prefix + re.sub(r"[^a-zA-Z0-9_]", "_", column)
+
+    def frame_to_series(self, frame) -> dict:
+        """ Converts a frame indexed by timestamp into series.
+        Returns:
+            dict - tuple of sorted (label name, label value) pairs -> list of (timestamp in ms, value)
+        """
+        frame = frame.reset_index()
+        label_columns = [column for column in frame.columns
+                         if column != 'timestamp' and not pd.api.types.is_numeric_dtype(frame[column])]
+        value_columns = [column for column in frame.columns
+                         if column != 'timestamp' and column not in label_columns]
+        if not value_columns or frame.empty:
+            return {}
+        # one row per (timestamp, labels, field) with a value, grouped into series at once instead of row by row
+        frame = frame[label_columns + value_columns].astype({column: str for column in label_columns}).assign(
+            _timestamp=(pd.to_datetime(frame['timestamp'], utc=True) - pd.Timestamp(0, tz='UTC')) //
+            pd.Timedelta(milliseconds=1))
+        frame = frame.melt(id_vars=['_timestamp'] + label_columns, value_vars=value_columns, var_name='_field',
+                           value_name='_value').dropna(subset=['_value'])
+
+        series = {}
+        for group, rows in frame.groupby(label_columns + ['_field'], sort=False):
+            group = group if isinstance(group, tuple) else (group,)
+            labels = tuple(sorted(list(zip(label_columns, group[:-1])) + [("__name__", self.metric_name(group[-1]))]))
+            series[labels] = list(zip(rows['_timestamp'].tolist(), rows['_value'].astype(float).tolist()))
+        return series
+
+    @staticmethod
+    def encode_varint(value: int) -> bytes:
+        encoded = bytearray()
+        while True:
+            byte = value & 0x7f
+            value >>= 7
+            if value:
+                encoded.append(byte | 0x80)
+            else:
+                encoded.append(byte)
+                return bytes(encoded)
+
+    @classmethod
+    def encode_field(cls, field_number: int, payload: bytes) -> bytes:
+        # length delimited field (wire type 2)
+        return cls.encode_varint(field_number << 3 | 2) + cls.encode_varint(len(payload)) + payload
+
+    @classmethod
+    def encode_write_request(cls, series: list) -> bytes:
+        """ Encodes prometheus.WriteRequest { repeated TimeSeries timeseries = 1; } as protobuf.
+        TimeSeries { repeated Label labels = 1; repeated Sample samples = 2; },
+        Label { string name = 1; string value = 2; }, Sample { double value = 1; int64 timestamp = 2; }
+        Args:
+            series:
+                list - tuples of (labels, samples)
+
+        Returns:
+            bytes - the serialized WriteRequest
+        """
+        request = bytearray()
+        for labels, samples in series:
+            timeseries = bytearray()
+            for name, value in labels:
+                timeseries += cls.encode_field(1, cls.encode_field(1, name.encode()) +
+                                               cls.encode_field(2, value.encode()))
+            for timestamp, value in samples:
+                sample = b"\x09" + struct.pack("<d", value) + b"\x10" + cls.encode_varint(timestamp & (2 ** 64 - 1))
+                timeseries += cls.encode_field(2, sample)
+            request += cls.encode_field(1, bytes(timeseries))
+        return bytes(request)
+
+    def new_samples(self, series: dict) -> dict:
+        """ Sorts the samples of every series and removes duplicates and samples that have already been sent. """
+        new_series = {}
+        for labels, samples in series.items():
+            last_sent = self.last_sent.get(labels, -1)
+            # one sample per timestamp, the last value wins
+            samples = sorted(dict(sample for sample in samples if sample[0] > last_sent).items())
+            self.stats["samples_skipped"] += len(series[labels]) - len(samples)
+            if samples:
+                new_series[labels] = samples
+        return new_series
+
+    def evict(self, now: float) -> None:
+        """ Forgets the series whose last sent sample is older than `max_age`, no later window overlaps it. """
+        oldest = int((now - self.max_age) * 1000)
+        expired = [labels for labels, timestamp in self.last_sent.items() if timestamp < oldest]
+        for labels in expired:
+            del self.last_sent[labels]
+        self.stats["series_evicted"] += len(expired)
+
+    async def write(self, frames: list) -> None:
+        shards = await self.run_blocking(self.encode_frames, frames, time.time())
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        results = await asyncio.gather(*[self.send_shard(shard) for shard in shards if shard],
+                                       return_exceptions=True)
+        failures = [result for result in results if isinstance(result, Exception)]
+        if failures:
+            raise failures[0]
+
+    def encode_frames(self, frames: list, now: float) -> list:
+        """ Converts the frames into the compressed WriteRequests of every shard, run in the worker thread.
+        Returns:
+            list - per shard, the tuples of (compressed WriteRequest, batch of (labels, samples)) in sending order
+        """
+        if now - self.last_eviction >= self.max_age:
+            self.evict(now)
+            self.last_eviction = now
+        series = {}
+        for data_category, frame in frames:
+            for labels, samples in self.frame_to_series(frame).items():
+                series.setdefault(labels, []).extend(samples)
+        series = self.new_samples(series)
+
+        # the same series always goes to the same shard, which keeps its samples in order
+        shards = [[] for _ in range(self.shards)]
+        for labels, samples in series.items():
+            shards[zlib.crc32(repr(labels).encode()) % self.shards].append((labels, samples))
+        return [[(bytes(cramjam.snappy.compress_raw(self.encode_write_request(batch))), batch)
+                 for batch in self.batches(shard)] for shard in shards]
+
+    def batches(self, shard: list) -> list:
+        """ Splits the series of a shard into batches of at most `batch_size` samples. """
+        batches, batch, batch_samples = [], [], 0
+        for labels, samples in shard:
+            for offset in range(0, len(samples), self.batch_size):
+                chunk = samples[offset:offset + self.batch_size]
+                if batch_samples + len(chunk) > self.batch_size and batch:
+                    batches.append(batch)
+                    batch, batch_samples = [], 0
+                batch.append((labels, chunk))
+                batch_samples += len(chunk)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def send_shard(self, shard: list) -> None:
+        for body, batch in shard:
+            await self.send_batch(body, batch)
+
+    async def send_batch(self, body: bytes, batch: list) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.stats["requests"] += 1
+                async with self.session.post(self.url, data=body, headers=self.headers) as response:
+                    if response.status >= 500 or response.status == 429:
+                        raise RemoteWriteError("remote write returned status {}".format(response.status))
+                    if response.status >= 400:
+                        # not retryable (e.g. out of order samples), the batch is dropped and not sent again
+                        self.stats["failed_requests"] += 1
+                        logging.error("remote write rejected %s series: %s %s", len(batch), response.status,
+                                      await response.text())
+                    else:
+                        self.stats["samples_sent"] += sum(len(samples) for _, samples in batch)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError, RemoteWriteError) as e:
+                if attempt == self.max_retries:
+                    self.stats["failed_requests"] += 1
+                    raise
+                self.stats["retries"] += 1
+                logging.debug("remote write failed (%s), retrying", e)
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+        for labels, samples in batch:
+            self.last_sent[labels] = max(self.last_sent.get(labels, -1), samples[-1][0])
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+        await super().close()
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, series=len(self.last_sent))
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+import logging
+
+from InfluxDBWriter import InfluxDBWriter
+from Rollups import StreamingRollup
+
+from .BaseSink import BaseSink
+
+logger = logging.getLogger(__name__)
+
+
+class RollupSink(BaseSink):
+    """ Adds the frames to a StreamingRollup and writes its closed intervals through the spool of an InfluxDBWriter,
+    usually of a bucket with a longer retention. The rollups of a data category are written to the measurement of
+    the category with the resolution as suffix, e.g. functions_usage_5m and functions_usage_1h.
+    """
+
+    name = "rollup"
+
+    def __init__(self, rollup: StreamingRollup, writer: InfluxDBWriter, measurements: dict):
+        """
+        Args:
+            rollup:
+                StreamingRollup - aggregates the frames
+            writer:
+                InfluxDBWriter - writer of the rollup bucket
+            measurements:
+                dict - data category -> measurement name prefix, e.g. {'functions_usage': 'functions_usage'}
+        """
+        self.rollup = rollup
+        self.writer = writer
+        self.measurements = measurements
+
+    async def write(self, frames: list) -> None:
+        await self.run_blocking(self.write_frames, frames)
+
+    def write_frames(self, frames: list) -> None:
+        for data_category, frame in frames:
+            self.rollup.add_frame(data_category, frame)
+        for resolution, data_category, frame in self.rollup.flush():
+            if data_category not in self.measurements:
+                continue
+            tag_columns = [column for column in StreamingRollup.tag_columns if column in frame.columns]
+            self.writer.write_measurement(frame, "{}_{}".format(self.measurements[data_category], resolution),
+                                          tag_columns)
+
+    async def close(self) -> None:
+        # the open intervals are continued by the next start, saved after the running write
+        await self.run_blocking(self.rollup.save)
+        await super().close()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+import asyncio
+import logging
+import time
+
+from Observability import Metrics
+from .BaseSink import BaseSink
+
+logger = logging.getLogger(__name__)
+
+
+class SinkFanout:
+    """ Passes the frames of every collection cycle to several sinks concurrently.
+    Every sink has its own bounded queue and worker task, which writes the queued frames in batches. A failing
+    or slow sink only drops its own oldest frames when its queue is full, it never blocks the collection or
+    the other sinks.
+    """
+
+    def __init__(self, sinks: list, queue_size: int = 100, write_timeout: float = 60.0):
+        """
+        Args:
+            sinks:
+                list - BaseSink instances
+            queue_size:
+                Integer - frames queued per sink before the oldest are dropped
+            write_timeout:
+                Float - seconds a write of a sink may take before it is cancelled (blocking writes of a sink keep
+                running in its worker thread, see BaseSink.run_blocking)
+        """
+        self.sinks = sinks
+        self.queue_size = queue_size
+        self.write_timeout = write_timeout
+        # sink name -> queue, worker task and counters, created on the event loop with the first publish
+        self.queues = {}
+        self.workers = {}
+        self.stats = {sink.name: {"queued": 0, "written": 0, "batches": 0, "failed": 0, "dropped": 0,
+                                  "last_write_seconds": 0.0} for sink in sinks}
+
+    def start(self) -> None:
+        for sink in self.sinks:
+            if sink.name not in self.workers:
+                self.queues[sink.name] = asyncio.Queue(self.queue_size)
+                self.workers[sink.name] = asyncio.ensure_future(self.run_sink(sink))
+
+    def publish(self, data_list: dict) -> None:
+        """ Queues the non empty frames of a collection result for every sink.
+        Args:
+            data_list:
+                dict - data category ('functions_usage', 'system_usage') -> DataFrame
+        """
+        self.start()
+        frames = [(data_category, frame) for data_category, frame in data_list.items()
+                  if frame is not None and not frame.empty]
+        for sink in self.sinks:
+            queue = self.queues[sink.name]
+            stats = self.stats[sink.name]
+            for frame in frames:
+                if queue.full():
+                    queue.get_nowait()
+                    stats["dropped"] += 1
+                    logging.warning("sink %s is not keeping up, dropped its oldest frame", sink.name)
+                queue.put_nowait(frame)
+                stats["queued"] += 1
+
+    async def run_sink(self, sink: BaseSink) -> None:
+        queue = self.queues[sink.name]
+        stats = self.stats[sink.name]
+        while True:
+            frames = [await queue.get()]
+            while len(frames) < sink.batch_size and not queue.empty():
+                frames.append(queue.get_nowait())
+
+            started = time.time()
+            try:
+                await asyncio.wait_for(sink.write(frames), self.write_timeout)
+                stats["written"] += len(frames)
+                stats["batches"] += 1
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                stats["failed"] += len(frames)
+                logging.error("sink %s did not write %s frames within %ss, its next write waits for the running one",
+                              sink.name, len(frames), self.write_timeout)
+            except Exception as e:
+                stats["failed"] += len(frames)
+                logging.error("sink %s failed to write %s frames: %s", sink.name, len(frames), repr(e))
+            stats["last_write_seconds"] = time.time() - started
+            Metrics.sink_write_duration.labels(Metrics.cluster_name, sink.name).observe(stats["last_write_seconds"])
+
+    async def close(self) -> None:
+        for worker in self.workers.values():
+            worker.cancel()
+        await asyncio.gather(*self.workers.values(), return_exceptions=True)
+        for sink in self.sinks:
+            await sink.close()
+
+    def get_stats(self) -> dict:
+        """ Returns the counters and queue length per sink. """
+        stats = {}
+        for name, sink_stats in self.stats.items():
+            stats[name] = dict(sink_stats)
+            stats[name]["queue_length"] = self.queues[name].qsize() if name in self.queues else 0
+        return stats
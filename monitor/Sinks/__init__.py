@@ -0,0 +1,19 @@
+import importlib
+
+from .BaseSink import BaseSink
+from .SinkFanout import SinkFanout
+from .ChangeFilter import ChangeFilter
+from .InfluxDBSink import InfluxDBSink
+from .RecentStoreSink import RecentStoreSink
+from .RollupSink import RollupSink
+
+# sinks with heavy dependencies (pyarrow, cramjam) are imported on first use
+lazy_sinks = {"ParquetSink": ".ParquetSink", "RemoteWriteSink": ".RemoteWriteSink"}
+
+
+def __getattr__(name):
+    if name not in lazy_sinks:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    # importing the submodule binds its module to the name in the package, the class replaces it
+    globals()[name] = getattr(importlib.import_module(lazy_sinks[name], __name__), name)
+    return globals()[name]
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+""" Latency benchmark of the provisioned Grafana dashboards on the raw and the downsampled retention tier.
+
+Seeds a running InfluxDB (set up by influxdb/influxDB-scripts/setup-v1.sh) with synthetic version 2 points of the
+fields the dashboards query: the raw bucket with one point per --step seconds for the last --raw-days, the
+downsampled bucket with their 5 minute means (as written by the downsampling tasks) for the last --days. Then loads
+every dashboard like Grafana does, all panels in parallel through the v1 query api, with the InfluxQL of the
+panels for each time range on both tiers, and reports the load time, the number of points returned and the tier
+the dashboard selects for the range.
+
+Usage (from the monitor directory):
+    python benchmarks/dashboard_queries.py --token <admin token> --functions 20 --days 30
+    python benchmarks/dashboard_queries.py --token <admin token> --skip-seed --ranges 6h,2d,7d,30d --repeat 10
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+from influxdb_client import InfluxDBClient
+from influxdb_client.client.write_api import SYNCHRONOUS
+
+DASHBOARD_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'grafana',
+                                                   'grafana-provisioning', 'dashboards'))
+DASHBOARDS = ("FDN Functions Usage Dashboard-*.json", "FDN Infrastructure Usage Dashboard-*.json")
+# the tier variable of the dashboards selects the downsampled tier for wider ranges
+RAW_MAX_SPAN = 2 * 86400
+DOWNSAMPLED_STEP = 300
+# Grafana requests about one point per pixel of a panel
+MAX_DATA_POINTS = 1000
+NODES = 3
+
+
+def load_panels(patterns) -> dict:
+    """ Returns dashboard title -> list of panels, each a list of (measurement, fields, InfluxQL query). """
+    dashboards = {}
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(DASHBOARD_DIRECTORY, pattern)):
+            with open(path) as file:
+                dashboard = json.load(file)
+            panels = []
+            for panel in dashboard["panels"]:
+                targets = [(target["measurement"],
+                            [part["params"][0] for select in target["select"] for part in select
+                             if part["type"] == "field"],
+                            target["query"])
+                           for target in panel.get("targets", []) if not target.get("hide")]
+                if targets:
+                    panels.append(targets)
+            dashboards[dashboard["title"]] = panels
+    return dashboards
+
+
+def synthetic_frame(measurement: str, fields: list, clusters: int, functions: int, start: pd.Timestamp,
+                    end: pd.Timestamp, step: int, seed: int) -> pd.DataFrame:
+    """ Returns a smooth daily pattern with noise per series, tagged by cluster and function or node. """
+    timestamps = pd.date_range(start, end, freq="{}s".format(step), inclusive="left", tz="UTC")
+    if measurement == "functions_usage":
+        tag, names = "function_name", ["function-{}".format(function) for function in range(functions)]
+    else:
+        tag, names = "node", ["node-{}".format(node) for node in range(NODES)]
+    rng = np.random.default_rng(seed)
+    daily = np.sin(2 * np.pi * (timestamps.asi8 // 10 ** 9 % 86400) / 86400)
+    frames = []
+    for cluster in range(clusters):
+        for name in names:
+            frame = pd.DataFrame({field: np.abs(10 * (1 + daily) + rng.normal(0, 1, len(timestamps)))
+                                  for field in fields}, index=timestamps)
+            frame["cluster_name"] = "cluster-{}".format(cluster)
+            frame[tag] = name
+            frames.append(frame)
+    return pd.concat(frames)
+
+
+def seed(args, fields: dict) -> None:
+    now = pd.Timestamp.now(tz="UTC").floor("{}s".format(DOWNSAMPLED_STEP))
+    raw_start = now - pd.Timedelta(days=args.raw_days)
+    start = now - pd.Timedelta(days=args.days)
+    with InfluxDBClient(url=args.url, token=args.token, org=args.org, timeout=120000) as client:
+        write_api = client.write_api(write_options=SYNCHRONOUS)
+        # a day at a time, so the memory stays bounded for many functions
+        for day, day_start in enumerate(pd.date_range(start, now, freq="1D", inclusive="left")):
+            day_end = min(day_start + pd.Timedelta(days=1), now)
+            for measurement, measurement_fields in fields.items():
+                tag_columns = ["cluster_name", "function_name" if measurement == "functions_usage" else "node"]
+                frame = synthetic_frame(measurement, sorted(measurement_fields), args.clusters, args.functions,
+                                        day_start, day_end, args.step, day)
+                # the 5 minute means of the downsampling tasks, with the start of the window as time
+                downsampled = (frame.groupby(tag_columns + [frame.index.floor("{}s".format(DOWNSAMPLED_STEP))])
+                               .mean().reset_index(tag_columns))
+                write_api.write(bucket=args.downsampled_bucket, record=downsampled,
+                                data_frame_measurement_name=measurement, data_frame_tag_columns=tag_columns)
+                if day_end > raw_start:
+                    write_api.write(bucket=args.bucket, record=frame[frame.index >= raw_start],
+                                    data_frame_measurement_name=measurement, data_frame_tag_columns=tag_columns)
+            print("seeded {} of {} days".format(day + 1, args.days), end="\r", flush=True)
+    print()
+
+
+def render(query: str, tier: str, seconds: int, minimum_interval: int, variables: dict) -> str:
+    """ Interpolates the dashboard variables as Grafana does for a range ending now. """
+    interval = max(seconds // MAX_DATA_POINTS, minimum_interval)
+    query = query.replace("$timeFilter", "time >= now() - {}s".format(seconds))
+    query = query.replace("$__interval", "{}s".format(interval)).replace("$tier", tier)
+    for name, values in variables.items():
+        # multi value variables with All selected become an alternation of all values
+        query = query.replace("$" + name, "({})".format("|".join(re.escape(value) for value in values)))
+    return query
+
+
+def load_dashboard(session: requests.Session, args, panels: list, tier: str, seconds: int, variables: dict):
+    """ Queries all panels in parallel, returns the load time in seconds and the number of points returned. """
+    minimum_interval = args.step if tier == "raw" else DOWNSAMPLED_STEP
+
+    def query_panel(targets):
+        queries = ";".join(render(query, tier, seconds, minimum_interval, variables) for _, _, query in targets)
+        response = session.get(args.url + "/query", params={"db": args.db, "q": queries, "epoch": "ms"},
+                               headers={"Authorization": "Token " + args.token})
+        response.raise_for_status()
+        return sum(len(series["values"]) for result in response.json()["results"]
+                   for series in result.get("series", []))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(len(panels)) as executor:
+        points = sum(executor.map(query_panel, panels))
+    return time.perf_counter() - started, points
+
+
+def parse_range(value: str) -> int:
+    return int(pd.Timedelta(value).total_seconds())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8086")
+    parser.add_argument("--token", required=True, help="token with read and write access to both buckets")
+    parser.add_argument("--org", default="fdn_org")
+    parser.add_argument("--bucket", default="fdn_monitoring_bucket", help="raw bucket")
+    parser.add_argument("--downsampled-bucket", help="default: <bucket>_downsampled")
+    parser.add_argument("--db", default="fdn_monitoring_db", help="V1_DB_NAME of the DBRP mappings")
+    parser.add_argument("--clusters", type=int, default=2)
+    parser.add_argument("--functions", type=int, default=20)
+    parser.add_argument("--days", type=int, default=30, help="days of downsampled points")
+    parser.add_argument("--raw-days", type=int, default=14, help="days of raw points, at most RAW_RETENTION")
+    parser.add_argument("--step", type=int, default=60, help="seconds between raw points")
+    parser.add_argument("--skip-seed", action="store_true", help="query the points of a previous run")
+    parser.add_argument("--ranges", default="1h,12h,2d,7d,30d", help="dashboard time ranges ending now")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    args.downsampled_bucket = args.downsampled_bucket or args.bucket + "_downsampled"
+
+    dashboards = load_panels(DASHBOARDS)
+    fields = {}
+    for panels in dashboards.values():
+        for targets in panels:
+            for measurement, target_fields, _ in targets:
+                fields.setdefault(measurement, set()).update(target_fields)
+    if not args.skip_seed:
+        started = time.perf_counter()
+        seed(args, fields)
+        print("seeding took {:.0f} s".format(time.perf_counter() - started))
+
+    variables = {"cluster_name": ["cluster-{}".format(cluster) for cluster in range(args.clusters)],
+                 "function_name": ["function-{}".format(function) for function in range(args.functions)]}
+    print("{:<40} {:>6} {:>12} {:>12} {:>12} {:>10}".format("dashboard", "range", "tier", "median ms",
+                                                            "max ms", "points"))
+    with requests.Session() as session:
+        for title, panels in dashboards.items():
+            for value in args.ranges.split(","):
+                seconds = parse_range(value)
+                selected = "downsampled" if seconds > RAW_MAX_SPAN or seconds > args.raw_days * 86400 else "raw"
+                for tier in ("raw", "downsampled"):
+                    # the first load fills the caches of InfluxDB
+                    load_dashboard(session, args, panels, tier, seconds, variables)
+                    runs = [load_dashboard(session, args, panels, tier, seconds, variables)
+                            for _ in range(args.repeat)]
+                    durations = [duration * 1000 for duration, _ in runs]
+                    print("{:<40} {:>6} {:>12} {:>12.1f} {:>12.1f} {:>10}".format(
+                        title[:40], value, tier + (" *" if tier == selected else ""), statistics.median(durations),
+                        max(durations), runs[-1][1]))
+    print("* tier selected by the dashboard")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+""" Load benchmark for the collection, merge and write paths.
+
+Synthesizes Prometheus range query responses for a cluster and measures the per-cycle CPU time of
+parsing, function name resolution, merging, postprocessing and line protocol serialization for the
+default resolution (step 60s) and the high resolution mode (step 5s, 12x more points), comparing the
+previous per-series parse / chained merge implementation with the current one.
+
+Usage (from the monitor directory):
+    python benchmarks/high_resolution_load.py --functions 50 --pods 3 --window 300
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import pandas as pd
+from pandas import DataFrame
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.makedirs('Logs', exist_ok=True)
+
+from Clusters.OpenFaas import PrometheusCollector  # noqa: E402
+
+# the collectors log whole frames on DEBUG, which would dominate the measurement
+logging.disable(logging.CRITICAL)
+
+POD_FIELDS = ['pods-cpu-sum', 'pods-mem-sum-bytes', 'pods-file-descp-sum', 'pods-iops-reads-sum',
+              'pods-iops-writes-sum', 'pods-network-transmit-bytes', 'pods-network-receive-bytes',
+              'pods-fs-write-bytes', 'pods-fs-read-bytes', 'replicas']
+GATEWAY_FIELDS = ['average_execution_time', 'percentile_90_exec_time', 'success_invocations',
+                  '500_error_invocations', '502_error_invocations']
+
+
+def make_response(field: str, functions: int, pods: int, start: int, end: int, step: int) -> dict:
+    timestamps = list(range(start, end + 1, step))
+    result = []
+    for function in range(functions):
+        if field in POD_FIELDS:
+            for pod in range(pods):
+                labels = {"pod": "function-{}-5d8f6b7c9-{:05d}".format(function, pod), "node": "node-{}".format(pod)}
+                result.append({"metric": labels, "values": [[t, str(0.5 + pod)] for t in timestamps]})
+        else:
+            labels = {"function_name": "function-{}.openfaas-fn".format(function)}
+            result.append({"metric": labels, "values": [[t, str(1.5 + function)] for t in timestamps]})
+    return {"data": {"result": result}}
+
+
+def legacy_parse(field: str, response: dict) -> DataFrame:
+    """ Previous implementation: one DataFrame per series, values converted with apply. """
+    frames = []
+    for metric in response['data']['result']:
+        new_frame = DataFrame(metric['values'], columns=['timestamp', field])
+        new_frame["node"] = metric["metric"].get("node", "test")
+        if "pod" in metric["metric"]:
+            new_frame['function_name'] = '-'.join(metric['metric']["pod"].split("-")[:-2]) + '.openfaas-fn'
+        else:
+            new_frame['function_name'] = metric['metric']['function_name']
+        frames.append(new_frame)
+    frame = pd.concat(frames, join="inner")
+    frame[field] = frame[field].apply(lambda v: float(v))
+    return frame
+
+
+def legacy_merge(frames: list) -> DataFrame:
+    """ Previous implementation: chained outer merges. """
+    combined_frame = DataFrame()
+    for frame in frames:
+        if combined_frame.empty:
+            combined_frame = frame
+        else:
+            combined_frame = pd.merge(combined_frame, frame, on=['timestamp', 'function_name'], how="outer")
+    return combined_frame
+
+
+def aggregate(frame: DataFrame, field: str) -> DataFrame:
+    frame = frame.groupby(['timestamp', 'function_name'])[field].mean().reset_index()
+    return frame.set_index("timestamp")
+
+
+def serialize(frame: DataFrame) -> int:
+    try:
+        from influxdb_client.client.write.dataframe_serializer import data_frame_to_list_of_points
+        from influxdb_client.client.write_api import PointSettings
+    except ImportError:
+        return 0
+    points = data_frame_to_list_of_points(frame, PointSettings(), precision='ms',
+                                          data_frame_measurement_name="functions_usage_table",
+                                          data_frame_tag_columns=['cluster_name', 'function_name'])
+    return len(points)
+
+
+def run_cycle(responses: dict, legacy: bool) -> dict:
+    prom_obj = PrometheusCollector("http://localhost")
+    timings = {}
+
+    started = time.process_time()
+    parsed = {}
+    for field, response in responses.items():
+        if legacy:
+            parsed[field] = legacy_parse(field, response)
+        else:
+            frame = PrometheusCollector.parse_result_to_dataframe("function_usage", field, response)
+            parsed[field] = asyncio.run(prom_obj.resolve_function_names(frame))
+    timings["parse"] = time.process_time() - started
+
+    started = time.process_time()
+    frames = [aggregate(frame, field) for field, frame in parsed.items()]
+    combined_frame = legacy_merge(frames) if legacy else PrometheusCollector.merge_frames(
+        frames, ['timestamp', 'function_name'])
+    timings["merge"] = time.process_time() - started
+
+    started = time.process_time()
+    combined_frame = prom_obj.do_frame_postprocessing(combined_frame, "benchmark", "function_usage")
+    timings["postprocess"] = time.process_time() - started
+
+    started = time.process_time()
+    points = serialize(combined_frame)
+    timings["serialize"] = time.process_time() - started
+
+    timings["total"] = sum(timings.values())
+    timings["rows"] = len(combined_frame)
+    timings["points"] = points
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", type=int, default=50)
+    parser.add_argument("--pods", type=int, default=3)
+    parser.add_argument("--window", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    end = 1700000000
+    start = end - args.window
+    results = []
+    for step in (60, 5):
+        responses = {field: make_response(field, args.functions, args.pods, start, end, step)
+                     for field in POD_FIELDS + GATEWAY_FIELDS}
+        for legacy in (True, False):
+            runs = [run_cycle(responses, legacy) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run["total"])
+            results.append((step, "legacy" if legacy else "current", best))
+
+    print("{:>5} {:>8} {:>8} {:>8} {:>8} {:>8} {:>11} {:>8}".format(
+        "step", "impl", "parse", "merge", "post", "serial", "total [s]", "rows"))
+    for step, implementation, timings in results:
+        print("{:>5} {:>8} {:>8.3f} {:>8.3f} {:>8.3f} {:>8.3f} {:>11.3f} {:>8}".format(
+            step, implementation, timings["parse"], timings["merge"], timings["postprocess"],
+            timings["serialize"], timings["total"], timings["rows"]))
+
+    baseline = results[0][2]["total"]
+    high_resolution = results[3][2]["total"]
+    print("high resolution (current) / default resolution (legacy) CPU time: {:.2f}x".format(
+        high_resolution / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+""" Import time benchmark and budget check of the monitor startup.
+
+Imports main.py and the collector of a cluster type in a fresh interpreter with `python -X importtime` and
+reports the total import time, the slowest imports and the dependencies of the InfluxDB writer, which every monitor
+imports at startup. With --eager, all collectors, minio and the Parquet and
+remote-write sinks are imported as well, which is what the monitor did before they were imported on demand.
+With --budget-ms, the exit code is 1 if the import time of a cluster type exceeds the budget, or if a module the
+monitor no longer uses (e.g. Flask of the former control api) is imported at startup.
+
+Usage (from the monitor directory):
+    python benchmarks/import_time.py --cluster-type OPENFAAS --eager --budget-ms 1500
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+MONITOR_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CLUSTER_TYPES = ("OPENFAAS", "OPENWHISK", "GCF", "AWS")
+EAGER_IMPORTS = "import Clusters.OpenFaas, Clusters.OpenWhisk, Clusters.Google, Clusters.AWS, minio; " \
+                "from Sinks import ParquetSink, RemoteWriteSink; "
+# packages imported at startup by main and the InfluxDB writer, measured separately in the breakdown
+WRITER_PACKAGE = "InfluxDBWriter"
+# top level packages the monitor does not use, importing them at startup fails the budget check, mapped to the
+# cluster types whose collector uses them
+UNUSED_PACKAGES = {"flask": (), "werkzeug": (), "jinja2": (), "yaml": ("GCF",)}
+
+
+def import_times(cluster_type: str, eager: bool) -> tuple:
+    """ Returns the (cumulative microseconds, nesting level, module) of the imports of a fresh interpreter up to the
+    modules imported by the top level imports (e.g. main and the packages main imports), the (cumulative
+    microseconds, module) of the modules the InfluxDB writer imports itself, and the names of all imported modules. """
+    code = "import main, {}; from Clusters import CollectorRegistry; CollectorRegistry.get({!r})".format(
+        WRITER_PACKAGE, cluster_type)
+    if eager:
+        code = EAGER_IMPORTS + code
+    environment = dict(os.environ, PYTHONPATH=MONITOR_DIRECTORY, CLUSTER_TYPE=cluster_type)
+    # main.py creates its Logs directory in the working directory
+    with tempfile.TemporaryDirectory() as directory:
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=directory, env=environment,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        raise RuntimeError("importing main failed:\n" + process.stderr[-2000:])
+
+    times, writer_dependencies, modules = [], [], set()
+    # imports not yet assigned to the module importing them, a module is reported after the modules it imports
+    nested = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        # nested imports are indented by two spaces per level
+        level = (len(module) - len(module.lstrip()) - 1) // 2
+        module = module.strip()
+        modules.add(module)
+        children = []
+        while nested and nested[-1][1] > level:
+            children.append(nested.pop())
+        if module.split(".")[0] == WRITER_PACKAGE:
+            writer_dependencies.extend((child_cumulative, child) for child_cumulative, child_level, child in children
+                                       if child_level == level + 1 and child.split(".")[0] != WRITER_PACKAGE)
+        nested.append((int(cumulative), level, module))
+        if level <= 1:
+            times.append((int(cumulative), level, module))
+    return times, writer_dependencies, modules
+
+
+def measure(cluster_type: str, eager: bool, repeat: int) -> tuple:
+    """ Returns the total import time in ms, the slowest imports, the dependencies of the InfluxDB writer and the
+    unused packages imported of the fastest of `repeat` runs. """
+    totals = []
+    for _ in range(repeat):
+        times, writer_dependencies, modules = import_times(cluster_type, eager)
+        totals.append((sum(cumulative for cumulative, level, _ in times if level == 0), times, writer_dependencies,
+                       modules))
+    total, times, writer_dependencies, modules = min(totals, key=lambda run: run[0])
+    top_level = [module for _, level, module in times if level == 0]
+    # main is broken down into the packages it imports
+    slowest = sorted((cumulative, module) for cumulative, level, module in times
+                     if (level == 1 and "main" in top_level) or (level == 0 and module != "main"))
+    unused = sorted(package for package in {module.split(".")[0] for module in modules}
+                    if package in UNUSED_PACKAGES and cluster_type not in UNUSED_PACKAGES[package])
+    return total / 1000, slowest[::-1], sorted(writer_dependencies)[::-1], unused
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cluster-type", choices=CLUSTER_TYPES, action="append",
+                        help="cluster types to measure, all by default")
+    parser.add_argument("--eager", action="store_true", help="also measure importing all collectors")
+    parser.add_argument("--budget-ms", type=float, help="fail if the import time exceeds this budget")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    over_budget = []
+    for cluster_type in args.cluster_type or CLUSTER_TYPES:
+        total, times, writer_dependencies, unused = measure(cluster_type, False, args.repeat)
+        line = "{:>10} {:>10.0f} ms".format(cluster_type, total)
+        if args.eager:
+            eager_total = measure(cluster_type, True, args.repeat)[0]
+            line += "   eager {:>6.0f} ms   saved {:>6.0f} ms".format(eager_total, eager_total - total)
+        print(line)
+        for cumulative, module in times[:args.top]:
+            print("{:>18.0f} ms  {}".format(cumulative / 1000, module))
+        # modules imported before by main or other packages are not imported again and not listed
+        for cumulative, module in writer_dependencies[:args.top]:
+            print("{:>18.0f} ms  {} (InfluxDB writer)".format(cumulative / 1000, module))
+        if unused:
+            print("{:>21}  unused packages imported: {}".format("", ", ".join(unused)))
+        if args.budget_ms is not None and (total > args.budget_ms or unused):
+            over_budget.append(cluster_type)
+
+    if over_budget:
+        print("import time of {} exceeds the budget of {:.0f} ms or imports unused packages".format(
+            ", ".join(over_budget), args.budget_ms))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+""" Benchmark of the logging overhead of a collection cycle with DEBUG enabled.
+
+Parses synthesized Prometheus responses for a cluster like a collection cycle does and logs as the collectors do:
+a few debug messages per query and the parsed and combined frames. Compares the previous setup (synchronous
+RotatingFileHandler and stream handler, whole frames dumped with unlimited pandas display options) with the
+current one (QueueHandler with a listener thread, frame summaries, sampling of repeated debug messages).
+The cycle time is the wall time of the collecting thread; the listener time is the time until the current setup
+has written all queued records.
+
+Usage (from the monitor directory):
+    python benchmarks/logging_overhead.py --functions 50 --pods 3 --window 300 --step 5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from high_resolution_load import GATEWAY_FIELDS, POD_FIELDS, aggregate, make_response  # noqa: E402
+from Clusters.OpenFaas import PrometheusCollector  # noqa: E402
+from Observability import FrameSummary, setup_logging  # noqa: E402
+
+
+def legacy_setup(path: str, stream) -> None:
+    pd.set_option('display.max_rows', None)
+    pd.set_option('display.max_columns', None)
+    pd.set_option('display.width', None)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in (RotatingFileHandler(path, maxBytes=10 ** 9, backupCount=2), logging.StreamHandler(stream)):
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+        root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
+
+
+def run_cycle(responses: dict, summarize: bool) -> None:
+    prom_obj = PrometheusCollector("http://localhost")
+    frames = []
+    for field, response in responses.items():
+        logging.debug("query %s", field)
+        logging.debug("prometheus response of %s series", len(response['data']['result']))
+        frame = PrometheusCollector.parse_result_to_dataframe("function_usage", field, response)
+        frame = asyncio.run(prom_obj.resolve_function_names(frame))
+        if summarize:
+            logging.debug("frame, %s %s", field, FrameSummary(frame))
+        else:
+            logging.debug("frame, %s", field)
+            logging.debug(frame)
+        frames.append(aggregate(frame, field))
+    combined_frame = PrometheusCollector.merge_frames(frames, ['timestamp', 'function_name'])
+    if summarize:
+        logging.debug("functions_usage %s", FrameSummary(combined_frame))
+    else:
+        logging.debug("functions_usage")
+        logging.debug("%s", combined_frame)
+
+
+def measure(setup: str, responses: dict, cycles: int, directory: str) -> dict:
+    path = os.path.join(directory, setup + ".log")
+    stream = open(os.devnull, "w")
+    listener = None
+    if setup == "legacy":
+        legacy_setup(path, stream)
+    else:
+        pd.reset_option('display.max_rows')
+        pd.reset_option('display.max_columns')
+        pd.reset_option('display.width')
+        listener = setup_logging(path, "DEBUG", stream=stream)
+
+    timings = []
+    for _ in range(cycles):
+        started = time.perf_counter()
+        run_cycle(responses, setup != "legacy")
+        timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    if listener is not None:
+        listener.queue.join()
+    drained = time.perf_counter() - started
+    logging.getLogger().handlers.clear()
+    stream.close()
+    return {"cycle": sorted(timings)[len(timings) // 2], "listener": drained,
+            "log_bytes": os.path.getsize(path) / cycles}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", type=int, default=50)
+    parser.add_argument("--pods", type=int, default=3)
+    parser.add_argument("--window", type=int, default=300)
+    parser.add_argument("--step", type=int, default=5)
+    parser.add_argument("--cycles", type=int, default=5)
+    args = parser.parse_args()
+
+    end = 1700000000
+    responses = {field: make_response(field, args.functions, args.pods, end - args.window, end, args.step)
+                 for field in POD_FIELDS + GATEWAY_FIELDS}
+
+    # pandas and the collectors are warmed up before the first measured cycle
+    logging.disable(logging.CRITICAL)
+    run_cycle(responses, True)
+    logging.disable(logging.NOTSET)
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [(setup, measure(setup, responses, args.cycles, directory)) for setup in ("legacy", "current")]
+
+    print("{:>8} {:>14} {:>14} {:>16}".format("setup", "cycle [s]", "listener [s]", "log per cycle"))
+    for setup, result in results:
+        print("{:>8} {:>14.3f} {:>14.3f} {:>13.1f} kB".format(setup, result["cycle"], result["listener"],
+                                                              result["log_bytes"] / 1024))
+    print("cycle time current / legacy: {:.2f}x".format(results[1][1]["cycle"] / results[0][1]["cycle"]))
+
+
+if __name__ == '__main__':
+    main()
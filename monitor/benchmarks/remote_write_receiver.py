@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+""" Local stand-in of a Prometheus remote-write receiver and checks of the remote_write sink against it.
+
+The receiver decodes the snappy compressed protobuf WriteRequests like Prometheus, Mimir or Cortex and keeps the
+received samples per series. It can answer the next requests with given status codes and delay its responses.
+Without --serve, the RemoteWriteSink sends synthetic frames to it and the labels and samples received are checked
+for batching, sharding, retries of 5xx/429, dropped 4xx batches, skipped overlapping samples and the eviction of
+series. With --serve, it only runs the receiver, e.g. for a monitor with REMOTE_WRITE_URL=http://localhost:19201/push.
+
+Usage (from the monitor directory):
+    python benchmarks/remote_write_receiver.py
+    python benchmarks/remote_write_receiver.py --serve --port 19201
+"""
+import argparse
+import asyncio
+import os
+import struct
+import sys
+import time
+
+import cramjam
+import pandas as pd
+from aiohttp import web
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Sinks import RemoteWriteSink  # noqa: E402
+
+
+def decode_varint(data: bytes, position: int) -> tuple:
+    value, shift = 0, 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def decode_fields(data: bytes) -> list:
+    """ Decodes a protobuf message into (field number, value) pairs, bytes for length delimited fields. """
+    fields, position = [], 0
+    while position < len(data):
+        key, position = decode_varint(data, position)
+        field_number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = decode_varint(data, position)
+        elif wire_type == 1:
+            value, position = data[position:position + 8], position + 8
+        elif wire_type == 2:
+            length, position = decode_varint(data, position)
+            value, position = data[position:position + length], position + length
+        else:
+            raise ValueError("unsupported wire type {}".format(wire_type))
+        fields.append((field_number, value))
+    return fields
+
+
+def decode_write_request(body: bytes) -> list:
+    """ Decodes a snappy compressed prometheus.WriteRequest.
+    Returns:
+        list - tuples of (labels as a tuple of (name, value), samples as a list of (timestamp in ms, value))
+    """
+    series = []
+    for field_number, timeseries in decode_fields(bytes(cramjam.snappy.decompress_raw(body))):
+        assert field_number == 1, "unexpected WriteRequest field {}".format(field_number)
+        labels, samples = [], []
+        for number, value in decode_fields(timeseries):
+            if number == 1:
+                label = dict(decode_fields(value))
+                labels.append((label[1].decode(), label[2].decode()))
+            elif number == 2:
+                sample = dict(decode_fields(value))
+                timestamp = sample.get(2, 0)
+                samples.append((timestamp - (1 << 64) if timestamp >= 1 << 63 else timestamp,
+                                struct.unpack("<d", sample.get(1, b"\0" * 8))[0]))
+        series.append((tuple(labels), samples))
+    return series
+
+
+class RemoteWriteReceiver:
+    """ Receives WriteRequests on /push and keeps the samples of every series in the order they arrived. """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        # status codes of the next requests, afterwards requests are accepted with 204
+        self.fail_statuses = []
+        self.series = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.runner = None
+
+    def reset(self) -> None:
+        self.fail_statuses = []
+        self.series = {}
+        self.requests = []
+        self.max_in_flight = 0
+
+    async def push(self, request: web.Request) -> web.Response:
+        assert request.headers["Content-Encoding"] == "snappy"
+        assert request.headers["Content-Type"] == "application/x-protobuf"
+        assert request.headers["X-Prometheus-Remote-Write-Version"] == "0.1.0"
+        body = await request.read()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            status = self.fail_statuses.pop(0) if self.fail_statuses else 204
+            write_request = decode_write_request(body)
+            self.requests.append((status, write_request, dict(request.headers)))
+            if status >= 400:
+                return web.Response(status=status, text="stand-in rejected the request")
+            for labels, samples in write_request:
+                self.series.setdefault(labels, []).extend(samples)
+            return web.Response(status=status)
+        finally:
+            self.in_flight -= 1
+
+    async def start(self, port: int) -> str:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/push", self.push)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+        return "http://127.0.0.1:{}/push".format(port)
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+
+def create_frame(functions: int, start: int, points: int, step: int = 60) -> pd.DataFrame:
+    """ Creates a functions_usage frame with a string label and two fields, the second missing on odd rows. """
+    timestamps = pd.to_datetime([start + step * point for point in range(points)], unit='s')
+    rows = []
+    for function in range(functions):
+        for point, timestamp in enumerate(timestamps):
+            rows.append({"timestamp": timestamp, "cluster_name": "edge", "function_name": "f{}".format(function),
+                         "success_invocations": float(function * 1000 + point),
+                         "average_execution_time": float(point) if point % 2 == 0 else float("nan")})
+    return pd.DataFrame(rows).set_index("timestamp")
+
+
+def labels_of(function: int, field: str) -> tuple:
+    return (("__name__", "fdn_" + field), ("cluster_name", "edge"), ("function_name", "f{}".format(function)))
+
+
+async def check_batching(receiver: RemoteWriteReceiver, url: str, start: int) -> None:
+    sink = RemoteWriteSink(url, shards=1, batch_size=5, retry_backoff=0.01)
+    await sink.write([("functions_usage", create_frame(2, start, 12))])
+    await sink.close()
+    assert all(sum(len(samples) for _, samples in write_request) <= 5 for _, write_request, _ in receiver.requests)
+    for function in range(2):
+        assert receiver.series[labels_of(function, "success_invocations")] == [
+            ((start + 60 * point) * 1000, float(function * 1000 + point)) for point in range(12)]
+        # missing values are not sent
+        assert receiver.series[labels_of(function, "average_execution_time")] == [
+            ((start + 60 * point) * 1000, float(point)) for point in range(0, 12, 2)]
+    assert len(receiver.series) == 4 and sink.stats["samples_sent"] == 36
+    print("batching: {} requests of at most 5 samples, {} samples".format(len(receiver.requests),
+                                                                           sink.stats["samples_sent"]))
+
+
+async def check_sharding(receiver: RemoteWriteReceiver, url: str, start: int) -> None:
+    receiver.delay = 0.05
+    sink = RemoteWriteSink(url, shards=4, batch_size=20, retry_backoff=0.01)
+    # the second window overlaps the first by 5 points, which are not sent again
+    await sink.write([("functions_usage", create_frame(40, start, 10))])
+    await sink.write([("functions_usage", create_frame(40, start + 5 * 60, 10))])
+    await sink.close()
+    receiver.delay = 0.0
+    assert receiver.max_in_flight > 1, "shards were not sent in parallel"
+    for function in range(40):
+        timestamps = [timestamp for timestamp, _ in receiver.series[labels_of(function, "success_invocations")]]
+        assert timestamps == [(start + 60 * point) * 1000 for point in range(15)], "series out of order"
+    # average_execution_time was last sent at point 8, its points 5 and 7 of the second window are skipped
+    assert sink.stats["samples_skipped"] == 40 * (5 + 2)
+    print("sharding: {} requests, up to {} in parallel, {} overlapping samples skipped".format(
+        len(receiver.requests), receiver.max_in_flight, sink.stats["samples_skipped"]))
+
+
+async def check_retries(receiver: RemoteWriteReceiver, url: str, start: int) -> None:
+    receiver.fail_statuses = [503, 429]
+    sink = RemoteWriteSink(url, shards=1, batch_size=1000, retry_backoff=0.01, headers={"X-Scope-OrgID": "fdn"})
+    await sink.write([("functions_usage", create_frame(1, start, 3))])
+    assert [status for status, _, _ in receiver.requests] == [503, 429, 204]
+    assert all(headers["X-Scope-OrgID"] == "fdn" for _, _, headers in receiver.requests)
+    assert sink.stats["retries"] == 2 and len(receiver.series[labels_of(0, "success_invocations")]) == 3
+
+    # client errors are not retried, the batch is dropped and its samples are sent again with the next window
+    receiver.reset()
+    receiver.fail_statuses = [400]
+    await sink.write([("functions_usage", create_frame(1, start + 3 * 60, 3))])
+    assert [status for status, _, _ in receiver.requests] == [400] and not receiver.series
+    assert sink.stats["failed_requests"] == 1
+
+    # retries are exhausted, the write fails and the fanout counts the frames as failed
+    receiver.reset()
+    receiver.fail_statuses = [500] * (sink.max_retries + 1)
+    try:
+        await sink.write([("functions_usage", create_frame(1, start + 6 * 60, 3))])
+        raise AssertionError("exhausted retries did not raise")
+    except Exception as e:
+        assert "500" in str(e)
+    assert len(receiver.requests) == sink.max_retries + 1
+    await sink.close()
+    print("retries: 503 and 429 retried, 400 dropped, {} attempts before giving up".format(sink.max_retries + 1))
+
+
+async def check_eviction(receiver: RemoteWriteReceiver, url: str, start: int) -> None:
+    sink = RemoteWriteSink(url, shards=2, retry_backoff=0.01, max_age=600)
+    await sink.write([("functions_usage", create_frame(50, start, 3))])
+    assert len(sink.last_sent) == 100
+    # the next write after max_age forgets the series of the old window
+    sink.last_eviction -= sink.max_age
+    await sink.write([("functions_usage", create_frame(1, int(time.time()) - 60, 1))])
+    await sink.close()
+    assert len(sink.last_sent) == 2 and sink.stats["series_evicted"] == 100
+    print("eviction: {} series forgotten, {} remembered".format(sink.stats["series_evicted"], len(sink.last_sent)))
+
+
+async def run_checks(port: int) -> None:
+    receiver = RemoteWriteReceiver()
+    url = await receiver.start(port)
+    start = int(time.time()) // 60 * 60 - 3600
+    try:
+        for check in (check_batching, check_sharding, check_retries, check_eviction):
+            receiver.reset()
+            await check(receiver, url, start)
+    finally:
+        await receiver.stop()
+    print("all checks passed")
+
+
+async def serve(port: int) -> None:
+    receiver = RemoteWriteReceiver()
+    print("receiving on", await receiver.start(port))
+    received = 0
+    while True:
+        await asyncio.sleep(10)
+        samples = sum(len(samples) for samples in receiver.series.values())
+        print("{} requests, {} series, {} new samples".format(len(receiver.requests), len(receiver.series),
+                                                              samples - received))
+        received = samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=19201)
+    parser.add_argument("--serve", action="store_true", help="only run the receiver")
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(serve(args.port) if args.serve else run_checks(args.port))
+
+
+if __name__ == '__main__':
+    main()
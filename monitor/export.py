@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+""" Exports the metrics of a cluster in a time range to disk, e.g. for incident reviews.
+
+Uses the collectors of the monitor with the cluster settings of the monitor (environment, .env or --env-file),
+but neither the control api, the periodic collection nor the InfluxDB writer are started. The range is split into
+step aligned chunks (at most 11000 points per series), --concurrency chunks are collected at a time and every
+chunk is written as soon as it and the chunks before it are collected, so the memory is bounded by the chunks in
+flight. Static pod and node metrics (cpu requests and limits, node memory) are the current values.
+
+Formats: parquet (a dataset directory per data category), csv (long format: one row per timestamp, series and
+field) and lp (InfluxDB line protocol of schema version 2, ms precision). Files ending with .gz are compressed.
+
+Usage (from the monitor directory):
+    python export.py --start 2026-10-18T12:00:00Z --end 2026-10-18T18:00:00Z --format parquet --output incident
+    python export.py --start -6h --groups request --format csv --output request.csv.gz
+    python export.py --start -1d --format lp --output last_day.lp.gz
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"parquet": ("ParquetExportWriter", ""), "csv": ("CsvExportWriter", ".csv.gz"),
+           "lp": ("LineProtocolExportWriter", ".lp.gz")}
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_time(value: str, now: float) -> int:
+    """ Parses epoch seconds, a duration before now (e.g. -6h, -90m, -3600) or an ISO 8601 time (UTC if no offset
+    is given) into epoch seconds. """
+    if value.startswith("-"):
+        amount = value[1:]
+        unit = DURATION_UNITS.get(amount[-1:], None)
+        seconds = float(amount[:-1]) * unit if unit is not None else float(amount)
+        return int(now - seconds)
+    if value.replace(".", "", 1).isdigit():
+        return int(float(value))
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def parse_args(argv: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", required=True, help="epoch seconds, ISO 8601 time or duration before now (-6h)")
+    parser.add_argument("--end", default="-0s", help="same formats as --start, default now")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--output", help="output file or directory, default <cluster>_<start>_<end>")
+    parser.add_argument("--groups", help="comma separated metric groups, default all")
+    parser.add_argument("--cluster-name", help="value of the cluster_name column, default CLUSTER_NAME")
+    parser.add_argument("--env-file", help="env file with the cluster settings of the monitor")
+    parser.add_argument("--high-resolution", action="store_true",
+                        help="collect Prometheus metrics with HIGH_RESOLUTION_STEP instead of 60s")
+    parser.add_argument("--chunk-seconds", type=int, default=3600, help="longest range of a chunk")
+    parser.add_argument("--concurrency", type=int, default=4, help="chunks collected at the same time")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds the queries of a chunk may take")
+    parser.add_argument("--retries", type=int, default=2, help="attempts of a chunk with missed queries")
+    parser.add_argument("--verbose", action="store_true")
+    # durations like -6h would be taken for options
+    argv = list(argv)
+    for position, value in enumerate(argv[:-1]):
+        if value in ("--start", "--end"):
+            argv[position:position + 2] = ["", value + "=" + argv[position + 1]]
+    args = parser.parse_args([value for value in argv if value])
+    now = time.time()
+    args.start, args.end = parse_time(args.start, now), parse_time(args.end, now)
+    if args.end <= args.start:
+        parser.error("--end has to be after --start")
+    return args
+
+
+def create_collector(cluster_type: str, high_resolution: bool) -> tuple:
+    """ Creates the collector of the configured cluster like the monitor does.
+    Returns:
+        tuple - (collector, step of its range queries)
+    """
+    from decouple import config
+    from Clusters import CollectorRegistry
+
+    collector_class = CollectorRegistry.get(cluster_type)
+    if cluster_type in ("OPENFAAS", "OPENWHISK"):
+        step, interval = 60, '1m'
+        if high_resolution:
+            step = int(config('HIGH_RESOLUTION_STEP', default=5))
+            interval = config('HIGH_RESOLUTION_INTERVAL', default=str(max(3 * step, 15)) + 's')
+        host = "http://" + config('CLUSTER_HOST') + ':'
+        return collector_class(host + str(config('CLUSTER_SERVERLESS_PLATFROM_PROMETHEUS_PORT')),
+                               host + str(config('CLUSTER_KUBERNETES_PROMETHEUS_PORT')),
+                               config('POWER_COLLECTION', default='False') == "True", step, interval), step
+
+    if cluster_type == "GCF":
+        import json
+        from minio import Minio
+        minio_client = Minio(config('MINIO_ENDPOINT'), config('MINIO_ACCESS_KEY'), config('MINIO_SECRET_KEY'),
+                             secure=False)
+        path = '/tmp/' + config('CLUSTER_CONFIG_OBJECT')
+        minio_client.fget_object(config('CLUSTER_CONFIG_BUCKET'), config('CLUSTER_CONFIG_OBJECT'), path)
+        with open(path) as file:
+            return collector_class(json.load(file), path, False), 60
+
+    return collector_class(config('AWS_ACCESS_KEY_ID'), config('AWS_SECRET_ACCESS_KEY'),
+                           config('CLUSTER_REGION')), 60
+
+
+async def collect_chunk(collector, cluster_name: str, chunk, retries: int) -> tuple:
+    """ Collects a chunk, again while queries are missed.
+    Returns:
+        tuple - (data category -> DataFrame, False if queries were still missed)
+    """
+    for attempt in range(retries + 1):
+        missed = sum(collector.cycle_deadline.missed.values())
+        data_list = await collector.collect(cluster_name, chunk.start, chunk.end, chunk.groups)
+        if sum(collector.cycle_deadline.missed.values()) == missed:
+            return data_list, True
+        logging.warning("queries of the chunk %s - %s were missed (attempt %s)", chunk.start, chunk.end, attempt + 1)
+    return data_list, False
+
+
+async def export(collector, cluster_name: str, chunks: list, writer, concurrency: int, retries: int) -> int:
+    """ Collects the chunks concurrently and writes them in order. Returns the number of incomplete chunks. """
+    incomplete = 0
+    written = 0
+    pending = deque()
+    remaining = iter(chunks)
+    started = time.time()
+    while True:
+        # keep `concurrency` chunks in flight, the oldest is written first
+        for chunk in remaining:
+            pending.append(asyncio.ensure_future(collect_chunk(collector, cluster_name, chunk, retries)))
+            if len(pending) >= concurrency:
+                break
+        if not pending:
+            break
+        data_list, complete = await pending.popleft()
+        written += 1
+        incomplete += not complete
+        for data_category, frame in data_list.items():
+            writer.write(data_category, frame)
+        print("\r{}/{} chunks, {} rows, {:.0f}s".format(written, len(chunks), writer.get_stats()["rows"],
+                                                       time.time() - started), end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    return incomplete
+
+
+def main(argv: list = None) -> int:
+    # the collectors (pandas, aiohttp) are only imported after the arguments are valid
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format='%(asctime)s | %(levelname)s | %(message)s')
+    if args.env_file:
+        from Configuration import ConfigWatcher
+        ConfigWatcher.apply_env({}, ConfigWatcher.read_env_file(args.env_file))
+
+    from decouple import config
+    from Backfill import BackfillWorker
+    from Clusters import BaseCollector
+    import Export
+
+    cluster_type = config('CLUSTER_TYPE')
+    cluster_name = args.cluster_name or config('CLUSTER_NAME')
+    groups = tuple(group.strip() for group in args.groups.split(',')) if args.groups else BaseCollector.metric_groups
+    unknown_groups = set(groups) - set(BaseCollector.metric_groups)
+    if unknown_groups:
+        print("unknown metric groups {}, valid groups: {}".format(sorted(unknown_groups),
+                                                                  ", ".join(BaseCollector.metric_groups)))
+        return 2
+
+    collector, step = create_collector(cluster_type, args.high_resolution)
+    # a chunk is not bounded by the period of a live cycle
+    collector.cycle_deadline.budget = args.timeout
+    chunks = BackfillWorker.split(groups, args.start, args.end, step, args.high_resolution, args.chunk_seconds)
+
+    class_name, extension = FORMATS[args.format]
+    output = args.output or "{}_{}_{}{}".format(
+        cluster_name, datetime.utcfromtimestamp(args.start).strftime('%Y%m%dT%H%M%S'),
+        datetime.utcfromtimestamp(args.end).strftime('%Y%m%dT%H%M%S'), extension)
+    if args.format == "lp":
+        writer = Export.LineProtocolExportWriter(output, {
+            "functions_usage": config('INFLUXDB_TABLE_FUNCTIONS_V2', default='functions_usage'),
+            "system_usage": config('INFLUXDB_TABLE_INFRA_V2', default='infra_usage')})
+    else:
+        writer = getattr(Export, class_name)(output)
+
+    logging.info("exporting %s of %s from %s to %s in %s chunks", groups, cluster_name,
+                 datetime.utcfromtimestamp(args.start), datetime.utcfromtimestamp(args.end), len(chunks))
+    try:
+        incomplete = asyncio.get_event_loop().run_until_complete(
+            export(collector, cluster_name, chunks, writer, args.concurrency, args.retries))
+    finally:
+        writer.close()
+    stats = writer.get_stats()
+    print("wrote {} rows of {} chunks to {}".format(stats["rows"], len(chunks), output))
+    if incomplete:
+        print("{} chunks are incomplete, see the warnings".format(incomplete))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,54 +1,71 @@
 #!/usr/bin/env python
 from pickle import TRUE
-from flask import Flask, Response, request
+from aiohttp import web
 from typing import List
 import asyncio
+import functools
 import requests
 from decouple import config
 from Clusters import BaseCollector
-from Clusters import OpenFaasCollector
-from Clusters import OpenWhiskCollector
-from Clusters import GCFCollector
-from Clusters import AWSCollector
+from Clusters import RequestHedger
+from Clusters import CollectorRegistry
 from datetime import datetime
-from PeriodicAsync import PeriodicAsyncThread
+from PeriodicAsync import CollectionScheduler
+from Configuration import ConfigWatcher
 from InfluxDBWriter import InfluxDBWriter
+import Sinks
+from Sinks import SinkFanout, InfluxDBSink, RecentStoreSink, RollupSink, ChangeFilter
+from RecentStore import RecentStore
+from Rollups import StreamingRollup
+from Backfill import Watermarks, InfluxGapFinder, BackfillWorker, BackfillChunk
 import logging
-from logging.handlers import RotatingFileHandler
 import sys
-from minio import Minio
 import pandas as pd
 import json
-pd.set_option('display.max_rows', None)
-pd.set_option('display.max_columns', None)
-pd.set_option('display.width', None)
-
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        RotatingFileHandler("Logs/log.log", maxBytes=1e9, backupCount=2),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+import os
+import signal
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from Observability import Metrics, CycleProfiler, MemoryProfiler, LoopMonitor, FrameSummary, setup_logging
+# records are written by a listener thread, frames are logged as summaries, e.g. LOG_LEVEL=INFO
+setup_logging(level=config('LOG_LEVEL', default='DEBUG'),
+              sample_burst=int(config('LOG_SAMPLE_BURST', default=10)),
+              sample_interval=float(config('LOG_SAMPLE_INTERVAL', default=60)),
+              levels={'influxdb_client.client.write.dataframe_serializer':
+                      config('SERIALIZER_LOG_LEVEL', default='DEBUG')})
 
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+routes = web.RouteTableDef()
 loop = asyncio.get_event_loop()
-apt = PeriodicAsyncThread(int(config('DEFAULT_LOGGING_PERIOD')))
 
 default_config = {
     'step': 60,
     'interval': '1m',
+    'window': 5*60,
+    'high_resolution_step': 5,
 }
 
 
 class CollectData:
+    # configuration applied by configure_schedule, changes of other keys reconfigure the cluster
+    schedule_keys = {'DEFAULT_LOGGING_PERIOD', 'METRIC_GROUP_PERIODS', 'METRIC_GROUP_WINDOWS', 'CYCLE_DEADLINE_SHARE',
+                     'CYCLE_QUERY_TIMEOUTS', 'DISABLED_METRIC_GROUPS', 'HIGH_RESOLUTION', 'HIGH_RESOLUTION_GROUPS'}
+    # configuration of the writer and the sinks, only applied on a restart
+    restart_key_prefixes = ('INFLUXDB_', 'SINK', 'PARQUET_', 'REMOTE_WRITE_', 'RECENT_STORE_', 'CHANGE_ONLY_',
+                            'ROLLUP_', 'BACKFILL', 'CONTROL_PORT', 'PROFILE_DIR', 'LOOP_LAG_INTERVAL', 'SLOW_CALLBACK_THRESHOLD', 'LOG_SAMPLE_', 'CONFIG_')
+    # configuration of the cluster and its collectors, other keys (e.g. of other services sharing the env file) are
+    # not used by the monitor
+    cluster_key_prefixes = ('CLUSTER_', 'POWER_COLLECTION', 'MINIO_', 'AWS_')
+    # settings of the hedgers, applied without recreating the collectors
+    hedging_keys = {'PROMETHEUS_HEDGING', 'CLUSTER_SERVERLESS_PLATFORM_PROMETHEUS_REPLICAS',
+                    'CLUSTER_KUBERNETES_PROMETHEUS_REPLICAS'}
+
     def __init__(self) -> None:
 
         self.step = default_config["step"]
         self.interval = default_config["interval"]
+        self.configure_schedule()
 
         # INFLUXDB configuration
         self.influx_config = {
@@ -58,14 +75,99 @@ class CollectData:
             "org": config('INFLUXDB_ORG'),
             "bucket": config('INFLUXDB_BUCKET'),
             "table_functions": config('INFLUXDB_TABLE_FUNCTIONS'),
-            "table_infra": config('INFLUXDB_TABLE_INFRA')
+            "table_infra": config('INFLUXDB_TABLE_INFRA'),
+            # dual writes the version 1 and 2 measurements until all consumers of version 1 have moved, 2 is opt-in
+            "schema": config('INFLUXDB_SCHEMA', default='dual'),
+            "table_functions_v2": config('INFLUXDB_TABLE_FUNCTIONS_V2', default='functions_usage'),
+            "table_infra_v2": config('INFLUXDB_TABLE_INFRA_V2', default='infra_usage'),
+            # write-ahead spool used while InfluxDB is unavailable
+            "spool_dir": config('INFLUXDB_SPOOL_DIR', default='Spool'),
+            "spool_max_mb": int(config('INFLUXDB_SPOOL_MAX_MB', default=512)),
+            "spool_fsync": config('INFLUXDB_SPOOL_FSYNC', default='always'),
+            "replay_rate": int(config('INFLUXDB_REPLAY_RATE', default=50000))
         }
 
         self.influx_db_writer_obj = InfluxDBWriter(self.influx_config)
 
+        # in-memory store of the recent points, created by the recent_store sink
+        self.recent_store = None
+        # 5 minute and 1 hour rollups, created by the rollup sink
+        self.streaming_rollup = None
+        # gauge fields only written to InfluxDB when they change or every CHANGE_ONLY_HEARTBEAT seconds,
+        # e.g. CHANGE_ONLY_FIELDS=replicas,pods-cpu-limits
+        change_only_fields = [field.strip() for field in config('CHANGE_ONLY_FIELDS', default='').split(',')
+                              if field.strip()]
+        self.change_filter = ChangeFilter(change_only_fields, float(config('CHANGE_ONLY_HEARTBEAT', default=300))) \
+            if change_only_fields else None
+        # every collection result is passed to all configured sinks, e.g. SINKS=influxdb
+        self.sink_fanout = SinkFanout(self.create_sinks(config('SINKS', default='influxdb')),
+                                      int(config('SINK_QUEUE_SIZE', default=100)))
+
+        self.configure_cluster()
+        self.configure_backfill()
+
+    def configure_schedule(self) -> None:
+        """ Reads the periods, windows and resolution of the metric groups. """
+        # Metric group scheduling, e.g. METRIC_GROUP_PERIODS=request=10,node=120
+        # groups without an entry use DEFAULT_LOGGING_PERIOD and the default window
+        self.default_period = int(config('DEFAULT_LOGGING_PERIOD'))
+        self.default_window = default_config["window"]
+
+        # High resolution (sub-minute step) collection for the whole cluster or single metric groups,
+        # e.g. HIGH_RESOLUTION_GROUPS=request. Cloud metrics have a minimum resolution of one minute.
+        if config('HIGH_RESOLUTION', default='False') == "True":
+            self.high_resolution_groups = tuple(group for group in BaseCollector.metric_groups if group != "cloud")
+        else:
+            self.high_resolution_groups = tuple(
+                group.strip() for group in config('HIGH_RESOLUTION_GROUPS', default='').split(',')
+                if group.strip() in BaseCollector.metric_groups and group.strip() != "cloud")
+        self.high_resolution_step = int(config('HIGH_RESOLUTION_STEP',
+                                               default=default_config["high_resolution_step"]))
+        # rate/increase windows need a few scrapes, so they are wider than the step
+        self.high_resolution_interval = config('HIGH_RESOLUTION_INTERVAL',
+                                               default=str(max(3 * self.high_resolution_step, 15)) + 's')
+
+        self.group_schedule = self.build_group_schedule(
+            self.parse_group_config(config('METRIC_GROUP_PERIODS', default='')),
+            self.parse_group_config(config('METRIC_GROUP_WINDOWS', default='')))
+        # share of the period a collection may take before slow queries are cancelled
+        self.cycle_deadline_share = float(config('CYCLE_DEADLINE_SHARE', default=0.8))
+        # per-query deadlines of single metrics, e.g. CYCLE_QUERY_TIMEOUTS=collect_cold_starts=5; other queries are
+        # cancelled after three times their 95th percentile duration
+        self.query_timeouts = {}
+        for entry in config('CYCLE_QUERY_TIMEOUTS', default='').split(','):
+            if '=' in entry:
+                name, seconds = entry.split('=', 1)
+                self.query_timeouts[name.strip()] = float(seconds)
+        self.apply_query_timeouts()
+        # metric groups that are not collected, e.g. DISABLED_METRIC_GROUPS=power,node
+        self.disabled_groups = {group.strip() for group in config('DISABLED_METRIC_GROUPS', default='').split(',')
+                                if group.strip() in BaseCollector.metric_groups}
+
+    def configure_cluster(self) -> None:
+        """ Creates the collectors of the configured cluster. Backend guards and hedgers of unchanged Prometheus
+        instances are kept, the caches of the previous collectors are discarded.
+        """
+        self.read_cluster_config()
+        self.apply_collectors(self.create_collectors())
+
+    async def reconfigure_cluster(self, high_resolution_only: bool = False) -> None:
+        """ Recreates the collectors on a reload. They are created in the executor, so the download of the GCF
+        cluster config and the creation of the clients do not stall the collection and the control api.
+        Args:
+            high_resolution_only:
+                Boolean - only recreate the high resolution collectors, the others keep their caches
+        """
+        if not high_resolution_only:
+            self.read_cluster_config()
+        self.apply_collectors(await loop.run_in_executor(None, self.create_collectors, high_resolution_only))
+
+    def read_cluster_config(self) -> None:
+        """ Reads the settings of the configured cluster. """
         # Cluster Configuration
         self.cluster_type = config('CLUSTER_TYPE')
         self.cluster_name = config('CLUSTER_NAME')
+        Metrics.set_cluster(self.cluster_name)
         self.power_collection = False
 
         if config('POWER_COLLECTION') == "True":
@@ -82,12 +184,7 @@ class CollectData:
                 'CLUSTER_SERVERLESS_PLATFROM_PROMETHEUS_PORT')
             self.cluster_kubernetes_prometheus_port = config(
                 'CLUSTER_KUBERNETES_PROMETHEUS_PORT')
-            self.cluster_collector_obj = OpenFaasCollector("http://" + self.cluster_host + ':' + str(self.cluster_serverless_platform_prometheus_port),
-                                                           "http://" + self.cluster_host + ':' +
-                                                           str(self.cluster_kubernetes_prometheus_port),
-                                                           self.power_collection,
-                                                           self.step,
-                                                           self.interval)
+            self.configure_hedging()
 
         elif self.cluster_type == "OPENWHISK":
             self.cluster_auth = config('CLUSTER_AUTH')
@@ -102,11 +199,7 @@ class CollectData:
                 'CLUSTER_SERVERLESS_PLATFROM_PROMETHEUS_PORT')
             self.cluster_kubernetes_prometheus_port = config(
                 'CLUSTER_KUBERNETES_PROMETHEUS_PORT')
-            self.cluster_collector_obj = OpenWhiskCollector("http://" + self.cluster_host + ':' + str(self.cluster_serverless_platform_prometheus_port),
-                                                            "http://" + self.cluster_host + ':' + str(self.cluster_kubernetes_prometheus_port), 
-                                                            self.power_collection,
-                                                            self.step,
-                                                            self.interval)
+            self.configure_hedging()
 
         elif self.cluster_type == "GCF":
             self.minio_host = config('MINIO_ENDPOINT')
@@ -115,13 +208,61 @@ class CollectData:
             self.cluster_config_bucket = config('CLUSTER_CONFIG_BUCKET')
             self.cluster_config_object = config('CLUSTER_CONFIG_OBJECT')
 
-            self.MINIO_CLIENT = Minio(self.minio_host,
-                                      self.minio_access_key,
-                                      self.minio_secret_key,
-                                      secure=False)
+        elif self.cluster_type == "AWS":
+            self.aws_secret_access_key = config('AWS_SECRET_ACCESS_KEY')
+            self.aws_access_key_id = config('AWS_ACCESS_KEY_ID')
+            self.cluster_region = config('CLUSTER_REGION')
+
+    def create_collectors(self, high_resolution_only: bool = False) -> dict:
+        """ Creates the collectors of the cluster read by read_cluster_config. Blocking: the collector module is
+        imported, clients are created and the GCF cluster config is downloaded from MinIO.
+        Args:
+            high_resolution_only:
+                Boolean - only create the high resolution collectors, the others are kept
+
+        Returns:
+            dict - attribute name -> collector (or attribute value), applied by apply_collectors
+        """
+        # only the collector (and client libraries) of the configured platform is imported
+        collector_class = CollectorRegistry.get(self.cluster_type)
+        collectors = {"high_resolution_collector_obj": None}
+        # gaps are re-collected by collectors of their own, so missed queries and caches are not shared with the
+        # live cycles; the cloud metrics of GCF and AWS are not backfilled
+        backfill = config('BACKFILL', default='False') == "True"
+        if high_resolution_only:
+            collectors["backfill_collector_objs"] = {
+                False: self.backfill_collector_objs[False]} if False in self.backfill_collector_objs else {}
+        else:
+            collectors["backfill_collector_objs"] = {}
+
+        if self.cluster_type in ("OPENFAAS", "OPENWHISK"):
+            if not high_resolution_only:
+                collectors["cluster_collector_obj"] = self.create_prometheus_collector(collector_class, self.step,
+                                                                                       self.interval)
+                if backfill:
+                    collectors["backfill_collector_objs"][False] = self.create_prometheus_collector(
+                        collector_class, self.step, self.interval)
+            if len(self.high_resolution_groups) > 0:
+                collectors["high_resolution_collector_obj"] = self.create_prometheus_collector(
+                    collector_class, self.high_resolution_step, self.high_resolution_interval)
+                if backfill:
+                    collectors["backfill_collector_objs"][True] = self.create_prometheus_collector(
+                        collector_class, self.high_resolution_step, self.high_resolution_interval)
+
+        elif high_resolution_only:
+            # GCF and AWS have no high resolution collection
+            return {}
 
-            get = self.MINIO_CLIENT.fget_object(
+        elif self.cluster_type == "GCF":
+            from minio import Minio
+            collectors["MINIO_CLIENT"] = Minio(self.minio_host,
+                                               self.minio_access_key,
+                                               self.minio_secret_key,
+                                               secure=False)
+
+            get = collectors["MINIO_CLIENT"].fget_object(
                 self.cluster_config_bucket, self.cluster_config_object, '/tmp/' + self.cluster_config_object)
+            collectors["cluster_config_etag"] = get.etag
 
             # Opening JSON file
             f = open('/tmp/' + self.cluster_config_object)
@@ -130,16 +271,228 @@ class CollectData:
             # a dictionary
             config_object = json.load(f)
             logging.debug('project_id %s', config_object['project_id'])
-            self.cluster_collector_obj = GCFCollector(
+            collectors["cluster_collector_obj"] = collector_class(
                 config_object, '/tmp/' + self.cluster_config_object, False)
 
         elif self.cluster_type == "AWS":
-            self.aws_secret_access_key = config('AWS_SECRET_ACCESS_KEY')
-            self.aws_access_key_id = config('AWS_ACCESS_KEY_ID')
-            self.cluster_region = config('CLUSTER_REGION')
-            self.cluster_collector_obj = AWSCollector(self.aws_access_key_id, self.aws_secret_access_key, self.cluster_region)
-
-    async def collect_from_clusters(self) -> None:
+            collectors["cluster_collector_obj"] = collector_class(self.aws_access_key_id, self.aws_secret_access_key,
+                                                                  self.cluster_region)
+        return collectors
+
+    def apply_collectors(self, collectors: dict) -> None:
+        """ Replaces the collectors on the event loop, the next cycles use the new collectors. """
+        for name, value in collectors.items():
+            setattr(self, name, value)
+        self.apply_query_timeouts()
+        self.high_resolution_settings = (len(self.high_resolution_groups) > 0, self.high_resolution_step,
+                                         self.high_resolution_interval)
+
+    def apply_query_timeouts(self) -> None:
+        """ Sets the configured per-query deadlines on the collectors. """
+        # the collectors do not exist yet while the schedule is configured the first time
+        collector_objs = [getattr(self, 'cluster_collector_obj', None),
+                          getattr(self, 'high_resolution_collector_obj', None)]
+        collector_objs += list(getattr(self, 'backfill_collector_objs', {}).values())
+        for collector_obj in collector_objs:
+            if collector_obj is not None:
+                collector_obj.cycle_deadline.timeouts = dict(self.query_timeouts)
+
+    def configure_backfill(self) -> None:
+        """ Creates the backfill of gaps longer than the collection windows, e.g. BACKFILL=True.
+        BACKFILL_DETECT=watermark finds the gaps with the watermarks of the metric groups, saved to
+        BACKFILL_STATE_FILE; influxdb searches InfluxDB for ranges without points when the collection starts.
+        """
+        self.watermarks = None
+        self.influx_gap_finder = None
+        self.backfill = None
+        if config('BACKFILL', default='False') != "True":
+            return
+        if not self.backfill_collector_objs:
+            logging.warning("backfill is only supported for the Prometheus based cluster types OPENFAAS and OPENWHISK")
+            return
+        max_age = int(float(config('BACKFILL_MAX_HOURS', default=24)) * 3600)
+        detect = {method.strip() for method in config('BACKFILL_DETECT', default='watermark').split(',')}
+        if "watermark" in detect:
+            self.watermarks = Watermarks(config('BACKFILL_STATE_FILE', default=os.path.join(
+                self.influx_config["spool_dir"], 'watermarks.json')), max_age)
+        if "influxdb" in detect:
+            schema_v1 = self.influx_config["schema"] == '1'
+            self.influx_gap_finder = InfluxGapFinder(
+                self.influx_db_writer_obj.url, self.influx_config["token"], self.influx_config["org"],
+                self.influx_config["bucket"],
+                {"functions_usage": self.influx_config["table_functions" if schema_v1 else "table_functions_v2"],
+                 "system_usage": self.influx_config["table_infra" if schema_v1 else "table_infra_v2"]},
+                max([self.default_window] + [period for groups, period, window, high_resolution
+                                             in self.group_schedule]))
+        # the change filter only knows the newest points and would drop the older points of the gaps
+        self.backfill = BackfillWorker(self.collect_backfill_chunk, [InfluxDBSink(self.influx_db_writer_obj)],
+                                       int(config('BACKFILL_CONCURRENCY', default=2)),
+                                       float(config('BACKFILL_CHUNKS_PER_MINUTE', default=6)),
+                                       int(config('BACKFILL_CHUNK_SECONDS', default=3600)),
+                                       int(config('BACKFILL_RETRIES', default=3)))
+
+    def cluster_config_fingerprint(self) -> str:
+        """ Returns the etag of the GCF cluster config object in MinIO, None for other cluster types. """
+        if self.cluster_type != "GCF":
+            return None
+        return self.MINIO_CLIENT.stat_object(self.cluster_config_bucket, self.cluster_config_object).etag
+
+    async def reload_config(self, changed_keys: set) -> set:
+        """ Applies changed configuration keys to the running monitor. The writer, sinks and their queues are kept,
+        collectors are only recreated for changes of the cluster settings they use.
+        Args:
+            changed_keys:
+                set - configuration keys that have been added, changed or removed
+
+        Returns:
+            set - the reconfigured parts, 'schedule', 'hedging', 'high_resolution' and/or 'cluster'
+        """
+        restart_keys = {key for key in changed_keys if key.startswith(self.restart_key_prefixes)}
+        if restart_keys:
+            logging.warning("changes of %s are applied on the next restart", sorted(restart_keys))
+        changed_keys = set(changed_keys) - restart_keys
+        if 'LOG_LEVEL' in changed_keys:
+            logging.getLogger().setLevel(config('LOG_LEVEL', default='DEBUG'))
+            changed_keys.discard('LOG_LEVEL')
+
+        reconfigured = set()
+        high_resolution_keys = {key for key in changed_keys if key.startswith('HIGH_RESOLUTION')}
+        if changed_keys & self.schedule_keys or high_resolution_keys:
+            self.configure_schedule()
+            reconfigured.add("schedule")
+        hedging_keys = changed_keys & self.hedging_keys
+        cluster_keys = {key for key in changed_keys - hedging_keys if key.startswith(self.cluster_key_prefixes)}
+        ignored_keys = changed_keys - self.schedule_keys - high_resolution_keys - hedging_keys - cluster_keys
+        if ignored_keys:
+            logging.debug("the monitor does not use %s", sorted(ignored_keys))
+
+        if cluster_keys:
+            await self.reconfigure_cluster()
+            reconfigured.add("cluster")
+        else:
+            if hedging_keys and self.cluster_type in ("OPENFAAS", "OPENWHISK"):
+                # the hedgers are shared by the collectors of a Prometheus instance and updated in place
+                self.configure_hedging()
+                reconfigured.add("hedging")
+            # the high resolution collectors depend on the step and interval, not on the groups using them
+            high_resolution_settings = (len(self.high_resolution_groups) > 0, self.high_resolution_step,
+                                        self.high_resolution_interval)
+            if high_resolution_settings != self.high_resolution_settings:
+                await self.reconfigure_cluster(high_resolution_only=True)
+                reconfigured.add("high_resolution")
+        logging.info("reloaded configuration %s: %s", sorted(reconfigured), sorted(changed_keys - ignored_keys))
+        return reconfigured
+
+    def create_prometheus_collector(self, collector_class, step: int, interval: str) -> BaseCollector:
+        """ Creates an OpenFaas/OpenWhisk collector for the configured cluster with the given resolution. """
+        return collector_class("http://" + self.cluster_host + ':' + str(self.cluster_serverless_platform_prometheus_port),
+                               "http://" + self.cluster_host + ':' + str(self.cluster_kubernetes_prometheus_port),
+                               self.power_collection,
+                               step,
+                               interval)
+
+    def create_sinks(self, sink_names: str) -> list:
+        """ Creates the sinks of a comma separated list of sink names. """
+        sinks = []
+        for sink_name in sink_names.split(','):
+            sink_name = sink_name.strip()
+            if sink_name == "influxdb":
+                sinks.append(InfluxDBSink(self.influx_db_writer_obj, self.change_filter))
+            elif sink_name == "parquet":
+                sinks.append(Sinks.ParquetSink(config('PARQUET_DIR', default='Parquet'),
+                                         int(config('PARQUET_ROW_GROUP_SIZE', default=128 * 1024))))
+            elif sink_name == "remote_write":
+                headers = {}
+                if config('REMOTE_WRITE_TENANT', default=''):
+                    headers["X-Scope-OrgID"] = config('REMOTE_WRITE_TENANT')
+                # samples of a series are only sent twice within the longest collection window
+                max_age = max(max(period, window) for groups, period, window, high_resolution in self.group_schedule)
+                sinks.append(Sinks.RemoteWriteSink(config('REMOTE_WRITE_URL'),
+                                             int(config('REMOTE_WRITE_SHARDS', default=4)),
+                                             int(config('REMOTE_WRITE_BATCH_SIZE', default=2000)),
+                                             headers=headers, max_age=max_age))
+            elif sink_name == "recent_store":
+                self.recent_store = self.create_recent_store()
+                sinks.append(RecentStoreSink(self.recent_store))
+            elif sink_name == "rollup":
+                sinks.append(self.create_rollup_sink())
+            elif sink_name:
+                logging.warning("unknown sink %s", sink_name)
+        return sinks
+
+    def create_rollup_sink(self) -> RollupSink:
+        """ Creates the sink writing 5 minute and 1 hour rollups to ROLLUP_BUCKET, e.g. a bucket with a retention of
+        a year. Intervals are closed once the longest collection window has passed their end.
+        """
+        rollup_config = dict(self.influx_config,
+                             bucket=config('ROLLUP_BUCKET', default=self.influx_config["bucket"] + '_rollups'),
+                             spool_dir=os.path.join(self.influx_config["spool_dir"], 'rollups'))
+        grace = max(max(period, window) for groups, period, window, high_resolution in self.group_schedule)
+        latency_fields = [field.strip() for field in
+                          config('ROLLUP_LATENCY_FIELDS', default='average_execution_time,percentile_90_exec_time')
+                          .split(',') if field.strip()]
+        # the open intervals are saved, so a restart does not write a partial interval as complete
+        state_file = config('ROLLUP_STATE_FILE', default=os.path.join(self.influx_config["spool_dir"], 'rollups.json'))
+        self.streaming_rollup = StreamingRollup(grace, latency_fields, path=state_file)
+        return RollupSink(self.streaming_rollup, InfluxDBWriter(rollup_config),
+                          {"functions_usage": self.influx_config["table_functions_v2"],
+                           "system_usage": self.influx_config["table_infra_v2"]})
+
+    def create_recent_store(self) -> RecentStore:
+        """ Creates the store of the last RECENT_STORE_HOURS, with one point per step of the finest collection. """
+        retention_seconds = int(float(config('RECENT_STORE_HOURS', default=6)) * 3600)
+        step = self.high_resolution_step if self.high_resolution_groups else self.step
+        # e.g. RECENT_STORE_DIR=Recent keeps the store in memory-mapped files over restarts
+        return RecentStore(retention_seconds // step, retention_seconds, config('RECENT_STORE_DIR', default='') or None)
+
+    def configure_hedging(self) -> None:
+        """ Configures request hedging for both Prometheus instances of the cluster, e.g. PROMETHEUS_HEDGING=True and
+        CLUSTER_KUBERNETES_PROMETHEUS_REPLICAS=http://10.0.0.2:30009 (comma separated). Without replicas the hedge
+        is sent to the same instance.
+        """
+        enabled = config('PROMETHEUS_HEDGING', default='False') == "True"
+        prometheus_instances = {
+            self.cluster_serverless_platform_prometheus_port: 'CLUSTER_SERVERLESS_PLATFORM_PROMETHEUS_REPLICAS',
+            self.cluster_kubernetes_prometheus_port: 'CLUSTER_KUBERNETES_PROMETHEUS_REPLICAS'
+        }
+        for port, replicas_config in prometheus_instances.items():
+            replica_urls = [url.strip() for url in config(replicas_config, default='').split(',') if url.strip()]
+            hedger = RequestHedger.for_backend("http://" + self.cluster_host + ':' + str(port), enabled=enabled,
+                                               replica_urls=replica_urls)
+            # on a reload the hedger and its latency history are kept, only its settings change
+            hedger.enabled = enabled
+            hedger.replica_urls = replica_urls
+
+    @staticmethod
+    def parse_group_config(value: str) -> dict:
+        """ Parses 'group=seconds,group=seconds' into a dict. """
+        group_config = {}
+        for entry in value.split(','):
+            if '=' not in entry:
+                continue
+            group, seconds = entry.split('=', 1)
+            group = group.strip()
+            if group not in BaseCollector.metric_groups:
+                logging.warning("unknown metric group %s, valid groups: %s", group, BaseCollector.metric_groups)
+                continue
+            group_config[group] = int(seconds)
+        return group_config
+
+    def build_group_schedule(self, group_periods: dict, group_windows: dict) -> list:
+        """ Combines metric groups with the same period, window and resolution into one periodic collection.
+        Returns:
+            list - tuples of (groups, period, window, high_resolution)
+        """
+        schedule = {}
+        for group in BaseCollector.metric_groups:
+            key = (group_periods.get(group, self.default_period), group_windows.get(group, self.default_window),
+                   group in self.high_resolution_groups)
+            schedule.setdefault(key, []).append(group)
+        return [(tuple(groups), period, window, high_resolution)
+                for (period, window, high_resolution), groups in schedule.items()]
+
+    async def collect_from_clusters(self, groups: tuple = None, window: int = None,
+                                    high_resolution: bool = False, deadline: float = None) -> None:
 
         dt = datetime.now()
         seconds = int(dt.strftime('%s'))
@@ -181,54 +534,378 @@ class CollectData:
             logging.debug('aws_secret_access_key %s', self.aws_secret_access_key)
             logging.debug('cluster_region %s', self.cluster_region)
             
-        data_list = await self.cluster_collector_obj.collect(self.cluster_name, seconds - 5*60, seconds)
+        if window is None:
+            window = self.default_window
+        logging.debug('metric groups %s, window %s, high resolution %s', groups, window, high_resolution)
+        collector_obj = self.cluster_collector_obj
+        if high_resolution and self.high_resolution_collector_obj is not None:
+            collector_obj = self.high_resolution_collector_obj
+        missed = sum(collector_obj.cycle_deadline.missed.values())
+        data_list = await collector_obj.collect(self.cluster_name, seconds - window, seconds, groups, deadline)
+        # a window without missed queries is complete, the range since the previous complete window is a gap
+        if self.watermarks is not None and sum(collector_obj.cycle_deadline.missed.values()) == missed:
+            for gap_groups, gap_start, gap_end in self.watermarks.record(
+                    self.cluster_name, groups or BaseCollector.metric_groups, seconds - window, seconds):
+                self.add_backfill_gap(gap_groups, gap_start, gap_end, high_resolution)
         logging.debug("cluster_type %s", self.cluster_type)
         if len(data_list) > 0:
             if "functions_usage" in data_list:
-                logging.debug("functions_usage")
-                logging.debug("%s", data_list["functions_usage"])
+                logging.debug("functions_usage %s", FrameSummary(data_list["functions_usage"]))
             if "system_usage" in data_list:
-                logging.debug("system_usage")
-                logging.debug("%s", data_list["system_usage"])
-            if "functions_usage" in data_list and not data_list["functions_usage"].empty:
-                self.influx_db_writer_obj.write_dataframe_influxdb(
-                    data_list["functions_usage"], "functions_usage")
-            if "system_usage" in data_list and not data_list["system_usage"].empty:
-                self.influx_db_writer_obj.write_dataframe_influxdb(
-                    data_list["system_usage"], "system_usage")
-
-    async def collect_data(self) -> None:
-        await self.collect_from_clusters()
+                logging.debug("system_usage %s", FrameSummary(data_list["system_usage"]))
+            # the sinks write in their own tasks, the next collection does not wait for them
+            self.sink_fanout.publish(data_list)
+            logging.debug("sink stats %s", self.sink_fanout.get_stats())
+
+    async def collect_data(self, groups: tuple = None, window: int = None, high_resolution: bool = False,
+                           deadline: float = None, period: float = None) -> None:
+        started = time.time()
+        cycle_profiler.cycle_started()
+        # the backfill waits while a live cycle is running
+        backfill = self.backfill
+        if backfill is not None:
+            backfill.cycle_started()
+        try:
+            await self.collect_from_clusters(groups, window, high_resolution, deadline)
+        finally:
+            cycle_profiler.cycle_finished()
+            memory_profiler.cycle_finished()
+            if backfill is not None:
+                backfill.cycle_finished()
+        duration = time.time() - started
+        groups_label = ",".join(groups) if groups else "all"
+        Metrics.cycle_duration.labels(Metrics.cluster_name, groups_label).observe(duration)
+        if period is not None and duration > period:
+            Metrics.cycle_overruns.labels(Metrics.cluster_name, groups_label).inc()
+            logging.warning("collection of %s took %.1fs, longer than its period of %ss", groups, duration, period)
+        logging.debug("event loop %s", loop_monitor.get_stats())
         logging.debug("All deployment/removal finished")
 
-
-async def collect_data_interface():
-    collect_data_obj = CollectData()
-    await collect_data_obj.collect_data()
-
-
-@app.route('/start')
-def start_collection():
-    response = Response("Data collection has been started")
-
-    @response.call_on_close
-    def on_close():
-        loop.create_task(apt.invoke_forever(collect_data_interface))
-        loop.run_forever()
-
-    return response
-
-
-@app.route('/stop')
-def stop_collection():
-    loop.stop()
-    return {
+    def add_backfill_gap(self, groups: tuple, start: int, end: int, high_resolution: bool = False) -> int:
+        """ Queues a gap of metric groups for the backfill, with the step of the collector of the groups. """
+        high_resolution = high_resolution and True in self.backfill_collector_objs
+        step = self.high_resolution_step if high_resolution else self.step
+        return self.backfill.add_gap(tuple(groups), start, end, step, high_resolution)
+
+    async def collect_backfill_chunk(self, chunk: BackfillChunk) -> tuple:
+        """ Collects a chunk of a gap.
+        Returns:
+            tuple - (data category -> DataFrame, False if queries of the chunk were missed)
+        """
+        collector_obj = self.backfill_collector_objs.get(chunk.high_resolution, self.backfill_collector_objs[False])
+        missed = sum(collector_obj.cycle_deadline.missed.values())
+        data_list = await collector_obj.collect(self.cluster_name, chunk.start, chunk.end, chunk.groups)
+        return data_list, sum(collector_obj.cycle_deadline.missed.values()) == missed
+
+    async def find_influxdb_gaps(self) -> None:
+        """ Queues the ranges of the last BACKFILL_MAX_HOURS without points in InfluxDB for the backfill. """
+        end = int(time.time()) - max(window for groups, period, window, high_resolution in self.group_schedule)
+        start = end - int(float(config('BACKFILL_MAX_HOURS', default=24)) * 3600)
+        try:
+            gaps = await loop.run_in_executor(None, self.influx_gap_finder.find_gaps, self.cluster_name, start, end)
+        except Exception as e:
+            logging.error("could not query InfluxDB for gaps: %s", repr(e))
+            return
+        for resolution_groups, period, window, high_resolution in self.group_schedule:
+            for groups, gap_start, gap_end in gaps:
+                groups = tuple(group for group in groups if group in resolution_groups)
+                if groups:
+                    self.add_backfill_gap(groups, gap_start, gap_end, high_resolution)
+
+
+collect_data_obj = None
+scheduler = None
+# on-demand profiling of the collection cycles, see /profile
+cycle_profiler = CycleProfiler(config('PROFILE_DIR', default='Profiles'))
+memory_profiler = MemoryProfiler()
+# reports callbacks blocking the collection loop, e.g. SLOW_CALLBACK_THRESHOLD=0.25
+loop_monitor = LoopMonitor(float(config('LOOP_LAG_INTERVAL', default=0.5)),
+                           float(config('SLOW_CALLBACK_THRESHOLD', default=0.25)))
+
+
+# entries of CONFIG_FILE applied to the environment
+config_file_entries = {}
+
+
+def schedule_collection():
+    """ Schedules one periodic collection per distinct (period, window, resolution) of the metric groups on the event loop. """
+    global collect_data_obj, scheduler
+    if collect_data_obj is None:
+        if config('CONFIG_FILE', default=''):
+            load_config_file(config('CONFIG_FILE'))
+        collect_data_obj = CollectData()
+        scheduler = CollectionScheduler(collect_data_obj, collect_data_obj.cycle_deadline_share)
+        scheduler.disabled_groups = set(collect_data_obj.disabled_groups)
+        watch_config()
+        if collect_data_obj.influx_gap_finder is not None:
+            loop.create_task(collect_data_obj.find_influxdb_gaps())
+    scheduler.start()
+
+
+def load_config_file(path: str) -> set:
+    """ Applies the entries of an env file to the environment and returns the changed keys. """
+    global config_file_entries
+    entries = ConfigWatcher.read_env_file(path)
+    changed_keys = ConfigWatcher.apply_env(config_file_entries, entries)
+    config_file_entries = entries
+    return changed_keys
+
+
+def watch_config() -> None:
+    """ Reloads the configuration when CONFIG_FILE or, for GCF, the cluster config object in MinIO changes. """
+    config_watcher = ConfigWatcher(float(config('CONFIG_RELOAD_INTERVAL', default=30)))
+    config_file = config('CONFIG_FILE', default='')
+    if config_file:
+        config_watcher.watch(config_file, functools.partial(ConfigWatcher.file_fingerprint, config_file),
+                             functools.partial(reload_config_file, config_file))
+    if collect_data_obj.cluster_type == "GCF":
+        config_watcher.watch("cluster config object", collect_data_obj.cluster_config_fingerprint,
+                             reload_cluster_config)
+    if config_watcher.sources:
+        loop.create_task(config_watcher.watch_forever())
+
+
+async def reload_config_file(path: str) -> None:
+    previous_disabled_groups = set(collect_data_obj.disabled_groups)
+    reconfigured = await collect_data_obj.reload_config(load_config_file(path))
+    if "schedule" in reconfigured:
+        scheduler.deadline_share = collect_data_obj.cycle_deadline_share
+        # groups enabled or disabled through the control api keep their state, only changes of
+        # DISABLED_METRIC_GROUPS are applied
+        scheduler.disabled_groups -= previous_disabled_groups - collect_data_obj.disabled_groups
+        scheduler.disabled_groups |= collect_data_obj.disabled_groups - previous_disabled_groups
+        scheduler.apply_schedule(collect_data_obj.group_schedule)
+
+
+async def reload_cluster_config() -> None:
+    await collect_data_obj.reconfigure_cluster()
+
+
+async def start_control_server(host: str, port: int) -> web.AppRunner:
+    """ Serves the control api on the collection event loop. """
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info("control api listening on %s:%s", host, port)
+    return runner
+
+
+@routes.get('/start')
+async def start_collection(request):
+    if scheduler is not None and scheduler.running:
+        return web.json_response({"message": "data collection is already running"})
+    schedule_collection()
+    return web.json_response({"message": "data collection has been started"})
+
+
+@routes.get('/stop')
+async def stop_collection(request):
+    if scheduler is not None:
+        scheduler.stop()
+    return web.json_response({
         "message": "data collection has been stopped",
-    }
+    })
+
+
+@routes.get('/status')
+async def get_status(request):
+    if scheduler is None:
+        return web.json_response({"running": False, "collections": []})
+    return web.json_response(scheduler.get_status())
+
+
+@routes.get('/groups/{group}/period')
+async def set_group_period(request):
+    """ Changes the period of a metric group, e.g. /groups/request/period?seconds=10 """
+    try:
+        return web.json_response(scheduler.set_period(request.match_info['group'],
+                                                      float(request.query['seconds'])))
+    except (KeyError, ValueError) as e:
+        return web.json_response({"message": "expected ?seconds=<period>: {}".format(e)}, status=400)
+
+
+@routes.get('/groups/{group}/enable')
+async def enable_group(request):
+    try:
+        scheduler.set_enabled(request.match_info['group'], True)
+    except ValueError as e:
+        return web.json_response({"message": str(e)}, status=400)
+    return web.json_response(scheduler.get_status())
+
+
+@routes.get('/groups/{group}/disable')
+async def disable_group(request):
+    try:
+        scheduler.set_enabled(request.match_info['group'], False)
+    except ValueError as e:
+        return web.json_response({"message": str(e)}, status=400)
+    return web.json_response(scheduler.get_status())
+
+
+@routes.get('/stats')
+async def get_stats(request):
+    """ Returns the cycle statistics of the collections, the sinks and the event loop. """
+    stats = {"event_loop": loop_monitor.get_stats()}
+    if scheduler is not None:
+        stats["collections"] = scheduler.get_status()["collections"]
+        stats["sinks"] = collect_data_obj.sink_fanout.get_stats()
+        if collect_data_obj.recent_store is not None:
+            stats["recent_store"] = collect_data_obj.recent_store.get_stats()
+        if collect_data_obj.streaming_rollup is not None:
+            stats["rollup"] = collect_data_obj.streaming_rollup.get_stats()
+        if collect_data_obj.change_filter is not None:
+            stats["change_filter"] = collect_data_obj.change_filter.get_stats()
+        if collect_data_obj.backfill is not None:
+            stats["backfill"] = collect_data_obj.backfill.get_stats()
+    return web.json_response(stats)
+
+
+@routes.get('/backfill')
+async def get_backfill(request):
+    """ Returns the backfill counters and the watermarks of the metric groups. """
+    if collect_data_obj is None or collect_data_obj.backfill is None:
+        return web.json_response({"message": "backfill is not enabled"}, status=404)
+    watermarks = collect_data_obj.watermarks
+    return web.json_response(dict(collect_data_obj.backfill.get_stats(),
+                                  watermarks=watermarks.get_stats() if watermarks is not None else {}))
+
+
+@routes.get('/backfill/run')
+async def run_backfill(request):
+    """ Re-collects a range, e.g. /backfill/run?start=-7200&end=-3600&groups=request,node. start and end are epoch
+    seconds, negative values are relative to now. All scheduled groups by default.
+    """
+    if collect_data_obj is None or collect_data_obj.backfill is None:
+        return web.json_response({"message": "backfill is not enabled"}, status=404)
+    try:
+        start = float(request.query['start'])
+        end = float(request.query.get('end', 0))
+    except (KeyError, ValueError) as e:
+        return web.json_response({"message": "expected ?start=<seconds>&end=<seconds>: {}".format(e)}, status=400)
+    now = time.time()
+    start = int(now + start if start < 0 else start)
+    end = int(now + end if end <= 0 else end)
+    selected = set(request.query['groups'].split(',')) if request.query.get('groups') else None
+    chunks = 0
+    for groups, period, window, high_resolution in collect_data_obj.group_schedule:
+        groups = tuple(group for group in groups if selected is None or group in selected)
+        if groups and end > start:
+            chunks += collect_data_obj.add_backfill_gap(groups, start, end, high_resolution)
+    return web.json_response({"message": "queued {} chunks".format(chunks)})
+
+
+def recent_query(request) -> tuple:
+    """ Reads the filters and the time range of a /recent query.
+    Filters are comma separated values of category, cluster, function, node and field. start and end are epoch
+    seconds, negative values are relative to now, e.g. ?function=figlet&field=replicas&start=-3600
+    """
+    if collect_data_obj is None or collect_data_obj.recent_store is None:
+        raise web.HTTPNotFound(text=json.dumps({"message": "the recent_store sink is not configured"}),
+                               content_type="application/json")
+    filters = {name: set(request.query[name].split(','))
+               for name in ("category", "cluster", "function", "node", "field") if request.query.get(name)}
+    time_range = []
+    for name in ("start", "end"):
+        value = request.query.get(name)
+        if value is None:
+            time_range.append(None)
+            continue
+        try:
+            seconds = float(value)
+        except ValueError:
+            raise web.HTTPBadRequest(text=json.dumps({"message": "{} is not a number of seconds".format(name)}),
+                                     content_type="application/json")
+        time_range.append(int(((time.time() if seconds < 0 else 0) + seconds) * 1000))
+    return collect_data_obj.recent_store, filters, time_range[0], time_range[1]
+
+
+@routes.get('/recent/series')
+async def get_recent_series(request):
+    store, filters, start, end = recent_query(request)
+    return web.json_response(store.series(filters))
+
+
+@routes.get('/recent/latest')
+async def get_recent_latest(request):
+    store, filters, start, end = recent_query(request)
+    return web.json_response(store.latest(filters))
+
+
+@routes.get('/recent/range')
+async def get_recent_range(request):
+    """ Returns the points of the matching series, with ?format=arrow as an Arrow IPC stream in long format. """
+    store, filters, start, end = recent_query(request)
+    if request.query.get('format') == 'arrow':
+        import pyarrow as pa
+        table = store.to_arrow(filters, start, end)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return web.Response(body=sink.getvalue().to_pybytes(),
+                            headers={"Content-Type": "application/vnd.apache.arrow.stream"})
+    return web.json_response(store.range(filters, start, end))
+
+
+@routes.get('/recent/aggregate')
+async def get_recent_aggregate(request):
+    store, filters, start, end = recent_query(request)
+    try:
+        return web.json_response(store.aggregate(request.query.get('aggregate', 'mean'), filters, start, end))
+    except ValueError as e:
+        return web.json_response({"message": str(e)}, status=400)
+
+
+@routes.get('/profile/start')
+async def start_profile(request):
+    """ Profiles the next collection cycles, e.g. /profile/start?mode=cprofile&cycles=3 """
+    try:
+        return web.json_response(cycle_profiler.start(request.query.get('mode', 'sampling'),
+                                                      int(request.query.get('cycles', 1))))
+    except (ValueError, RuntimeError) as e:
+        return web.json_response({"message": str(e)}, status=400)
+
+
+@routes.get('/profile')
+async def get_profile(request):
+    """ Returns the artifact of the last capture (pstats or collapsed stacks), the status while it is running. """
+    status = cycle_profiler.get_status()
+    if status["state"] != "idle" or status["artifact"] is None:
+        return web.json_response(status, status=202 if status["state"] != "idle" else 404)
+    return web.FileResponse(status["artifact"], headers={
+        "Content-Disposition": "attachment; filename=" + os.path.basename(status["artifact"])})
+
+
+@routes.get('/profile/memory/start')
+async def start_memory_profile(request):
+    memory_profiler.start()
+    return web.json_response({"message": "tracing allocations, a snapshot is taken after every collection cycle"})
+
+
+@routes.get('/profile/memory/stop')
+async def stop_memory_profile(request):
+    memory_profiler.stop()
+    return web.json_response({"message": "tracing allocations has been stopped"})
+
+
+@routes.get('/profile/memory')
+async def get_memory_profile(request):
+    """ Returns the top allocating call sites between the last two cycles, e.g. /profile/memory?top=20&key=traceback """
+    try:
+        return web.json_response(memory_profiler.report(int(request.query.get('top', 20)),
+                                                        request.query.get('key', 'lineno')))
+    except ValueError as e:
+        return web.json_response({"message": str(e)}, status=400)
+
+
+@routes.get('/metrics')
+async def metrics(request):
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
 
 
 if __name__ == '__main__':
-    print("Logging metrics")
+    logging.info("Logging metrics")
 
     SEND_CLUSTER_INFO = False
     if SEND_CLUSTER_INFO:
@@ -241,8 +918,17 @@ if __name__ == '__main__':
         x = requests.post(url, data=myobj, auth=(config(
             'FDN_CLUSTER_SERVICE_ADMIN_USERNAME'), 'FDN_CLUSTER_SERVICE_ADMIN_PASSWORD'))
 
-        print(x.text)
+        logging.info("registered the cluster: %s", x.text)
 
-    loop.create_task(apt.invoke_forever(collect_data_interface))
-    loop.run_forever()
-    app.run(debug=True, host='0.0.0.0', port=3005)
+    # the control api and the collection share the event loop
+    loop_monitor.start(loop)
+    loop.run_until_complete(start_control_server('0.0.0.0', int(config('CONTROL_PORT', default=3005))))
+    schedule_collection()
+    # docker stop closes the sinks, e.g. the rollups save their open intervals
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, loop.stop)
+    try:
+        loop.run_forever()
+    finally:
+        if collect_data_obj is not None:
+            loop.run_until_complete(collect_data_obj.sink_fanout.close())